@@ -0,0 +1,68 @@
+"""
+Access control for course-gated views.
+
+Each user's enrolled course ids are cached as one frozenset and course slugs
+are resolved through the slug cache (courses/slugs.py), so checking "is this
+user enrolled in the course at this URL" costs no queries once warm. Both
+caches are versioned and invalidated by signals. Only a "yes" is trusted from
+the cache: before access is denied the enrollment is looked up, so a buyer
+whose invalidation hasn't landed yet (or whose set was cached from a lagging
+replica) isn't turned away.
+"""
+from django.core.cache import cache
+from django.http import Http404
+
+from .caching import get_version, bump_version
+from .models import Enrollment
+from .slugs import resolve_course_slug
+
+ENROLLMENT_VERSION_NAMESPACE = 'user_enrollments'
+ACCESS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# ============================================================================
+# ENROLLMENTS
+# ============================================================================
+
+def enrolled_course_ids(user):
+    """Ids of the courses a user is enrolled in (cached)"""
+    if not user.is_authenticated:
+        return frozenset()
+    version = get_version(ENROLLMENT_VERSION_NAMESPACE, user.pk)
+    key = f"enrolled_courses:{user.pk}:{version}"
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = frozenset(Enrollment.objects.filter(student_id=user.pk).values_list('course_id', flat=True))
+        cache.set(key, course_ids, ACCESS_CACHE_TIMEOUT)
+    return course_ids
+
+
+def is_enrolled(user, course_id):
+    """Check whether a user is enrolled in a course (a cached "no" is checked in the database)"""
+    if course_id in enrolled_course_ids(user):
+        return True
+    if not user.is_authenticated:
+        return False
+    if not Enrollment.objects.filter(student_id=user.pk, course_id=course_id).exists():
+        return False
+    invalidate_enrollments(user.pk)
+    return True
+
+
+def invalidate_enrollments(user_id):
+    bump_version(ENROLLMENT_VERSION_NAMESPACE, user_id)
+
+
+# ============================================================================
+# COURSE SLUGS
+# ============================================================================
+
+def get_course_header_or_404(slug):
+    header = resolve_course_slug(slug)
+    if header is None:
+        raise Http404('Course not found')
+    return header
+
+
+def get_course_id_or_404(slug):
+    return get_course_header_or_404(slug).id
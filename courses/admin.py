@@ -1,8 +1,8 @@
 from django.contrib import admin
 from .models import (
-    Category, Instructor, Course, Enrollment, UserProfile, Section, Lesson,
-    CourseMaterial, LessonProgress, Cart, CartItem, Order, OrderItem,
-    Review, Discussion, DiscussionReply, Certificate
+    Category, Instructor, Course, CourseSlugHistory, Enrollment, UserProfile, Section, Lesson,
+    CourseMaterial, MaterialBlob, MaterialUpload, LessonProgress, Cart, CartItem, Order, OrderItem,
+    Review, CourseRatingSummary, Discussion, DiscussionReply, Certificate
 )
 from .forms import CategoryForm
 
@@ -42,6 +42,11 @@ class CourseAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
 
+@admin.register(CourseSlugHistory)
+class CourseSlugHistoryAdmin(admin.ModelAdmin):
+    list_display = ['old_slug', 'course', 'created_at']
+    search_fields = ['old_slug', 'course__title']
+
 @admin.register(Enrollment)
 class EnrollmentAdmin(admin.ModelAdmin):
     list_display = ['student', 'course', 'progress_percentage', 'completed', 'enrolled_at']
@@ -67,10 +72,40 @@ class LessonAdmin(admin.ModelAdmin):
 
 @admin.register(CourseMaterial)
 class CourseMaterialAdmin(admin.ModelAdmin):
-    list_display = ['title', 'lesson', 'uploaded_at']
+    list_display = ['title', 'lesson', 'original_filename', 'uploaded_at']
     list_filter = ['uploaded_at']
-    search_fields = ['title', 'lesson__title']
+    search_fields = ['title', 'lesson__title', 'original_filename']
     date_hierarchy = 'uploaded_at'
+    readonly_fields = ['blob', 'original_filename']
+
+@admin.register(MaterialBlob)
+class MaterialBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'size', 'ref_count', 'created_at', 'last_used_at']
+    search_fields = ['sha256', 'file']
+    readonly_fields = ['sha256', 'file', 'size', 'ref_count', 'created_at', 'last_used_at']
+    actions = ['recount_references']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Recount references of all blobs')
+    def recount_references(self, request, queryset):
+        changed = MaterialBlob.refresh_ref_counts()
+        self.message_user(request, f'{changed} blob reference counts corrected.')
+
+@admin.register(MaterialUpload)
+class MaterialUploadAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'lesson', 'uploaded_by', 'received_bytes', 'total_size', 'status', 'updated_at']
+    list_filter = ['status', 'updated_at']
+    search_fields = ['filename', 'title', 'uploaded_by__username']
+    readonly_fields = [
+        'id', 'uploaded_by', 'lesson', 'filename', 'total_size', 'chunk_size', 'received_bytes',
+        'sha256', 'material', 'created_at', 'updated_at'
+    ]
+
+    def has_add_permission(self, request):
+        # Uploads are created through the chunked upload API
+        return False
 
 @admin.register(LessonProgress)
 class LessonProgressAdmin(admin.ModelAdmin):
@@ -120,6 +155,18 @@ class ReviewAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
 
+@admin.register(CourseRatingSummary)
+class CourseRatingSummaryAdmin(admin.ModelAdmin):
+    list_display = ['course', 'rating_count', 'average', 'updated_at']
+    search_fields = ['course__title']
+    readonly_fields = ['rating_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+    actions = ['refresh_summaries']
+
+    @admin.action(description='Recompute from reviews')
+    def refresh_summaries(self, request, queryset):
+        for course_id in queryset.values_list('course_id', flat=True):
+            CourseRatingSummary.refresh(course_id)
+
 @admin.register(Discussion)
 class DiscussionAdmin(admin.ModelAdmin):
     list_display = ['title', 'course', 'author', 'is_pinned', 'is_resolved', 'created_at']
@@ -1,4 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
@@ -6,15 +7,32 @@ from django.db.models import Count, Sum, Avg, Q
 from django.utils import timezone
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from datetime import timedelta
+from django.db import transaction
+from django.views.decorators.http import require_POST, require_http_methods
+from datetime import date, timedelta
 from django.contrib.auth.models import User
+import json
 
 from .models import (
     Course, Instructor, Category, Enrollment, UserProfile, Section, Lesson,
     LessonProgress, Cart, CartItem, Order, OrderItem, Review, Discussion,
-    DiscussionReply, Certificate, CourseMaterial
+    DiscussionReply, Certificate, CourseMaterial, MaterialUpload
 )
 from .forms import CourseCreateForm, InstructorCreateForm, InstructorEditForm, CategoryForm
+from .outline import get_course_outline
+from .course_structure import (
+    CourseStructureError, parse_sections_data, build_course_structure, sync_course_structure,
+    serialize_course_structure
+)
+from .uploads import (
+    UploadError, start_upload, write_chunk, complete_upload, abort_upload, serialize_upload
+)
+from .database import pool_metrics
+from .analytics import DIMENSIONS, GRANULARITIES, bucket_count, sales_series, sales_totals
+
+def _revenue(totals):
+    """Revenue of a sales_totals('total') result"""
+    return totals[0]['revenue'] if totals else 0
 
 # Decorator to check if user is superuser
 def superuser_required(function):
@@ -46,17 +64,12 @@ def admin_dashboard(request):
     total_users = User.objects.count()
     total_courses = Course.objects.count()
     total_enrollments = Enrollment.objects.count()
-    total_revenue = Order.objects.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    total_revenue = _revenue(sales_totals())
 
     # Recent Statistics
     new_users_30d = User.objects.filter(date_joined__date__gte=last_30_days).count()
     new_enrollments_30d = Enrollment.objects.filter(enrolled_at__date__gte=last_30_days).count()
-    revenue_30d = Order.objects.filter(
-        status='completed',
-        created_at__date__gte=last_30_days
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
+    revenue_30d = _revenue(sales_totals(start=last_30_days, granularity='day'))
 
     # Course Statistics
     published_courses = Course.objects.count()
@@ -276,9 +289,8 @@ def admin_courses_list(request):
     """List all courses with filtering"""
 
     courses = Course.objects.select_related('instructor', 'category').annotate(
-        enrollment_count=Count('enrollments'),
+        enrollment_count=Count('enrollments', distinct=True),
         avg_rating=Avg('reviews__rating'),
-        revenue=Sum('orderitem__order__total_amount', filter=Q(orderitem__order__status='completed'))
     ).order_by('-created_at')
 
     # Search
@@ -311,6 +323,11 @@ def admin_courses_list(request):
     page_number = request.GET.get('page')
     courses_page = paginator.get_page(page_number)
 
+    # Revenue from the cached sales buckets (item prices, not order totals)
+    revenue_by_course = {row['id']: row['revenue'] for row in sales_totals('course')}
+    for course in courses_page:
+        course.revenue = revenue_by_course.get(course.id)
+
     # Get all categories for filter
     categories = Category.objects.all()
 
@@ -341,7 +358,7 @@ def admin_course_detail(request, course_id):
     )
 
     # Course sections and lessons
-    sections = Section.objects.filter(course=course).prefetch_related('lessons').order_by('order')
+    outline = get_course_outline(course)
 
     # Course materials
     materials = CourseMaterial.objects.filter(lesson__section__course=course).select_related('lesson')
@@ -362,7 +379,8 @@ def admin_course_detail(request, course_id):
 
     context = {
         'course': course,
-        'sections': sections,
+        'outline': outline,
+        'sections': outline.sections,
         'materials': materials,
         'enrollments': enrollments,
         'reviews': reviews,
@@ -398,9 +416,7 @@ def admin_toggle_course_featured(request, course_id):
 def admin_orders_list(request):
     """List all orders with filtering"""
 
-    orders = Order.objects.select_related('user').annotate(
-        items_count=Count('items')
-    ).order_by('-created_at')
+    orders = Order.objects.all()
 
     # Search
     search_query = request.GET.get('search', '')
@@ -425,24 +441,29 @@ def admin_orders_list(request):
     if date_to:
         orders = orders.filter(created_at__date__lte=date_to)
 
+    # Statistics, in one pass over the filtered orders
+    stats = orders.aggregate(
+        total_orders=Count('id'),
+        total_revenue=Sum('total_amount', filter=Q(status='completed')),
+        pending_revenue=Sum('total_amount', filter=Q(status='pending')),
+    )
+
     # Pagination
+    orders = orders.select_related('user').annotate(items_count=Count('items')).order_by('-created_at')
     paginator = Paginator(orders, 20)
+    paginator.count = stats['total_orders']
     page_number = request.GET.get('page')
     orders_page = paginator.get_page(page_number)
 
-    # Statistics
-    total_revenue = orders.filter(status='completed').aggregate(total=Sum('total_amount'))['total'] or 0
-    pending_revenue = orders.filter(status='pending').aggregate(total=Sum('total_amount'))['total'] or 0
-
     context = {
         'orders': orders_page,
         'search_query': search_query,
         'selected_status': status,
         'date_from': date_from,
         'date_to': date_to,
-        'total_orders': orders.count(),
-        'total_revenue': total_revenue,
-        'pending_revenue': pending_revenue,
+        'total_orders': stats['total_orders'],
+        'total_revenue': stats['total_revenue'] or 0,
+        'pending_revenue': stats['pending_revenue'] or 0,
     }
 
     return render(request, 'custom_admin/orders_list.html', context)
@@ -645,9 +666,7 @@ def admin_delete_review(request, review_id):
 def admin_discussions_list(request):
     """List all discussions with moderation options"""
 
-    discussions = Discussion.objects.select_related('author', 'course').annotate(
-        replies_count=Count('replies')
-    ).order_by('-created_at')
+    discussions = Discussion.objects.select_related('author', 'course').order_by('-created_at')
 
     # Search
     search_query = request.GET.get('search', '')
@@ -951,43 +970,29 @@ def admin_delete_category(request, category_id):
 @superuser_required
 def admin_create_course(request):
     """All-in-one course creator - create course with sections, lessons, and materials"""
-    import json
-
     if request.method == 'POST':
         form = CourseCreateForm(request.POST, request.FILES)
 
-        if form.is_valid():
-            # Create the course
-            course = form.save()
-
-            # Process sections and lessons from JSON data
-            sections_data = json.loads(request.POST.get('sections_data', '[]'))
-
-            for section_data in sections_data:
-                # Create section
-                section = Section.objects.create(
-                    course=course,
-                    title=section_data.get('title', ''),
-                    description=section_data.get('description', ''),
-                    order=section_data.get('order', 0)
-                )
-
-                # Create lessons for this section
-                for lesson_data in section_data.get('lessons', []):
-                    lesson = Lesson.objects.create(
-                        section=section,
-                        title=lesson_data.get('title', ''),
-                        content_type=lesson_data.get('content_type', 'video'),
-                        video_url=lesson_data.get('video_url', ''),
-                        article_content=lesson_data.get('article_content', ''),
-                        duration_minutes=lesson_data.get('duration_minutes', 0),
-                        order=lesson_data.get('order', 0),
-                        is_preview=lesson_data.get('is_preview', False)
-                    )
-
-            messages.success(request, f'Course "{course.title}" created successfully with all sections and lessons!')
+        # Validate the whole syllabus before writing anything
+        try:
+            sections_data = parse_sections_data(request.POST.get('sections_data'))
+        except CourseStructureError as e:
+            sections_data = None
+            messages.error(request, f'Course content error: {e}')
+
+        if form.is_valid() and sections_data is not None:
+            # Create the course, its sections and lessons atomically
+            with transaction.atomic():
+                course = form.save()
+                created = build_course_structure(course, sections_data)
+
+            messages.success(
+                request,
+                f'Course "{course.title}" created successfully with '
+                f'{created["sections"]} sections and {created["lessons"]} lessons!'
+            )
             return redirect('courses:admin_course_detail', course_id=course.id)
-        else:
+        elif not form.is_valid():
             messages.error(request, 'Please correct the errors below.')
     else:
         form = CourseCreateForm()
@@ -1002,52 +1007,33 @@ def admin_create_course(request):
 @superuser_required
 def admin_edit_course(request, course_id):
     """Edit existing course with all sections and lessons"""
-    import json
-
     course = get_object_or_404(Course, id=course_id)
-    sections = Section.objects.filter(course=course).prefetch_related('lessons').order_by('order')
 
     if request.method == 'POST':
-        # Prepare initial data for JSON fields
-        initial_data = request.POST.copy()
-
         form = CourseCreateForm(request.POST, request.FILES, instance=course)
 
-        if form.is_valid():
-            # Update the course
-            course = form.save()
-
-            # Delete existing sections and lessons
-            Section.objects.filter(course=course).delete()
-
-            # Process sections and lessons from JSON data
-            sections_data = json.loads(request.POST.get('sections_data', '[]'))
-
-            for section_data in sections_data:
-                # Create section
-                section = Section.objects.create(
-                    course=course,
-                    title=section_data.get('title', ''),
-                    description=section_data.get('description', ''),
-                    order=section_data.get('order', 0)
+        try:
+            sections_data = parse_sections_data(request.POST.get('sections_data'))
+        except CourseStructureError as e:
+            sections_data = None
+            messages.error(request, f'Course content error: {e}')
+
+        if form.is_valid() and sections_data is not None:
+            try:
+                # Update the course and diff its sections/lessons in one transaction
+                with transaction.atomic():
+                    course = form.save()
+                    changes = sync_course_structure(course, sections_data)
+            except CourseStructureError as e:
+                messages.error(request, f'Course content error: {e}')
+            else:
+                messages.success(
+                    request,
+                    f'Course "{course.title}" updated successfully! '
+                    f'({changes["created"]} added, {changes["updated"]} changed, {changes["deleted"]} removed)'
                 )
-
-                # Create lessons for this section
-                for lesson_data in section_data.get('lessons', []):
-                    lesson = Lesson.objects.create(
-                        section=section,
-                        title=lesson_data.get('title', ''),
-                        content_type=lesson_data.get('content_type', 'video'),
-                        video_url=lesson_data.get('video_url', ''),
-                        article_content=lesson_data.get('article_content', ''),
-                        duration_minutes=lesson_data.get('duration_minutes', 0),
-                        order=lesson_data.get('order', 0),
-                        is_preview=lesson_data.get('is_preview', False)
-                    )
-
-            messages.success(request, f'Course "{course.title}" updated successfully!')
-            return redirect('courses:admin_course_detail', course_id=course.id)
-        else:
+                return redirect('courses:admin_course_detail', course_id=course.id)
+        elif not form.is_valid():
             messages.error(request, 'Please correct the errors below.')
     else:
         # Prepare initial data for the form with text versions of JSON fields
@@ -1059,27 +1045,8 @@ def admin_edit_course(request, course_id):
         }
         form = CourseCreateForm(instance=course, initial=initial)
 
-    # Prepare existing sections data as JSON for JavaScript
-    existing_sections = []
-    for section in sections:
-        section_data = {
-            'title': section.title,
-            'description': section.description,
-            'order': section.order,
-            'lessons': []
-        }
-        for lesson in section.lessons.all():
-            lesson_data = {
-                'title': lesson.title,
-                'content_type': lesson.content_type,
-                'video_url': lesson.video_url,
-                'article_content': lesson.article_content,
-                'duration_minutes': lesson.duration_minutes,
-                'order': lesson.order,
-                'is_preview': lesson.is_preview
-            }
-            section_data['lessons'].append(lesson_data)
-        existing_sections.append(section_data)
+    # Prepare existing sections data (with ids, so edits are diffed) as JSON for JavaScript
+    existing_sections = serialize_course_structure(course)
 
     context = {
         'form': form,
@@ -1108,3 +1075,136 @@ def admin_delete_course(request, course_id):
 
     # For GET requests, redirect to course detail (modal handles confirmation)
     return redirect('courses:admin_course_detail', course_id=course_id)
+
+# ============================================================================
+# CHUNKED MATERIAL UPLOADS
+# ============================================================================
+
+def _upload_error(error):
+    return JsonResponse({'error': str(error)}, status=error.status)
+
+@login_required
+@superuser_required
+@require_POST
+def admin_start_material_upload(request):
+    """Start (or resume) a chunked upload of a lesson material"""
+    try:
+        data = json.loads(request.body)
+        lesson_id = int(data['lesson_id'])
+        total_size = int(data['size'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'lesson_id and size are required'}, status=400)
+
+    lesson = get_object_or_404(Lesson, id=lesson_id)
+    try:
+        upload = start_upload(
+            request.user, lesson, data.get('title', ''), data.get('filename', ''), total_size, data.get('sha256', '')
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(serialize_upload(upload), status=201)
+
+@login_required
+@superuser_required
+@require_http_methods(['GET', 'DELETE'])
+def admin_material_upload(request, upload_id):
+    """Resume offset of an upload (GET) or abort it (DELETE)"""
+    upload = get_object_or_404(MaterialUpload, id=upload_id, uploaded_by=request.user)
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        upload.refresh_from_db()
+    return JsonResponse(serialize_upload(upload))
+
+@login_required
+@superuser_required
+@require_http_methods(['PUT'])
+def admin_upload_chunk(request, upload_id, index):
+    """Receive one chunk; the body is the raw bytes and X-Chunk-SHA256 their checksum"""
+    upload = get_object_or_404(MaterialUpload, id=upload_id, uploaded_by=request.user)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if not content_length:
+        return JsonResponse({'error': 'Content-Length is required'}, status=411)
+
+    try:
+        offset = write_chunk(upload, index, request, content_length, request.headers.get('X-Chunk-SHA256', ''))
+    except UploadError as e:
+        upload.refresh_from_db()
+        return JsonResponse({'error': str(e), **serialize_upload(upload)}, status=e.status)
+    upload.received_bytes = offset
+    return JsonResponse(serialize_upload(upload))
+
+@login_required
+@superuser_required
+@require_POST
+def admin_complete_material_upload(request, upload_id):
+    """Assemble a fully received upload into a CourseMaterial"""
+    upload = get_object_or_404(MaterialUpload, id=upload_id, uploaded_by=request.user)
+    try:
+        material = complete_upload(upload)
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse({
+        'material_id': material.id,
+        'title': material.title,
+        'lesson_id': material.lesson_id,
+        'download_url': reverse('courses:download_material', args=[material.id]),
+    })
+
+# ============================================================================
+# DATABASE
+# ============================================================================
+
+@login_required
+@superuser_required
+def admin_database_pool(request):
+    """This worker's database connection settings and pool saturation, as JSON"""
+    return JsonResponse({'databases': pool_metrics()})
+
+# ============================================================================
+# SALES ANALYTICS
+# ============================================================================
+
+SALES_DEFAULT_RANGE = {'day': timedelta(days=29), 'week': timedelta(weeks=11), 'month': timedelta(days=365)}
+SALES_MAX_BUCKETS = 400
+
+@login_required
+@superuser_required
+def admin_sales_analytics(request):
+    """Revenue per day/week/month, optionally by course, instructor or category, as JSON for charts"""
+    granularity = request.GET.get('granularity', 'day')
+    dimension = request.GET.get('by', 'total')
+    if granularity not in GRANULARITIES or dimension not in DIMENSIONS:
+        return JsonResponse({
+            'error': f'granularity must be one of {", ".join(GRANULARITIES)} and by one of {", ".join(DIMENSIONS)}'
+        }, status=400)
+
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = (
+            date.fromisoformat(request.GET['start']) if request.GET.get('start')
+            else end - SALES_DEFAULT_RANGE[granularity]
+        )
+    except (ValueError, OverflowError):
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates'}, status=400)
+    out_of_range = {'error': f'start must be before end, with at most {SALES_MAX_BUCKETS} buckets between them'}
+    if start > end or bucket_count(start, end, granularity) > SALES_MAX_BUCKETS:
+        return JsonResponse(out_of_range, status=400)
+
+    try:
+        # The bucket after the last one doesn't exist for ranges ending near date.max
+        buckets = sales_series(granularity, dimension, start, end)
+        totals = sales_totals(dimension, start, end, granularity)
+    except OverflowError:
+        return JsonResponse(out_of_range, status=400)
+
+    return JsonResponse({
+        'granularity': granularity,
+        'by': dimension,
+        'start': start,
+        'end': end,
+        'buckets': buckets,
+        'totals': totals,
+    })
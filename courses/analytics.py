@@ -0,0 +1,218 @@
+"""
+Sales analytics: revenue from completed orders, bucketed by day, week or month
+and broken down by course, instructor or category.
+
+Revenue is the sum of OrderItem.price, so an order with several courses
+credits each course with its own price rather than the order total. A sale
+falls in the bucket of its order's completed_at (created_at for orders
+completed before that was recorded), in the current time zone.
+
+Each bucket's rows are cached separately under the sales version. Orders are
+completed with completed_at = now, so new sales only ever land in the open
+(current) bucket, which is cached for SALES_OPEN_BUCKET_TTL seconds; past
+buckets stay cached until an admin edit to a completed order bumps the
+version. A request only queries the database for the buckets it is missing,
+with one grouped query over their range.
+
+Series buckets are always whole, so the first and last ones can include
+sales from before start or after end. Totals are exact: the ragged ends of
+the range are summed from day buckets instead.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DateField, Min, Q, Sum
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+from django.utils import timezone
+
+from .caching import get_version, bump_version
+from .models import Order, OrderItem
+
+SALES_VERSION_NAMESPACE = 'sales'
+SALES_BUCKET_TIMEOUT = 60 * 60 * 24 * 30
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Breakdown -> (group key, label) lookups on OrderItem
+DIMENSIONS = {
+    'total': (None, None),
+    'course': ('course_id', 'course__title'),
+    'instructor': ('course__instructor_id', 'course__instructor__full_name'),
+    'category': ('course__category_id', 'course__category__name'),
+}
+
+
+def invalidate_sales():
+    """Drop every cached bucket (after a change to an already completed order)"""
+    bump_version(SALES_VERSION_NAMESPACE)
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def buckets_between(start, end, granularity):
+    """Start dates of the buckets covering start..end (inclusive)"""
+    bucket = bucket_start(start, granularity)
+    buckets = []
+    while bucket <= end:
+        buckets.append(bucket)
+        bucket = next_bucket(bucket, granularity)
+    return buckets
+
+
+def bucket_count(start, end, granularity):
+    """len(buckets_between(start, end, granularity)), without building the list"""
+    if granularity == 'week':
+        return (bucket_start(end, granularity) - bucket_start(start, granularity)).days // 7 + 1
+    if granularity == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days + 1
+
+
+def _bucket_key(version, granularity, dimension, bucket):
+    return f'sales:{version}:{granularity}:{dimension}:{bucket.isoformat()}'
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _query_buckets(granularity, dimension, start, end):
+    """{bucket: [rows]} for sales from the start of bucket `start` up to the day `end`"""
+    key, label = DIMENSIONS[dimension]
+    since, until = _local_midnight(start), _local_midnight(end)
+    sold_at = Coalesce('order__completed_at', 'order__created_at')
+    if granularity == 'day':
+        bucket = TruncDate(sold_at, tzinfo=timezone.get_current_timezone())
+    else:
+        bucket = Trunc(sold_at, granularity, output_field=DateField(), tzinfo=timezone.get_current_timezone())
+
+    sales = OrderItem.objects.filter(order__status='completed').filter(
+        Q(order__completed_at__gte=since, order__completed_at__lt=until)
+        | Q(order__completed_at__isnull=True, order__created_at__gte=since, order__created_at__lt=until)
+    ).annotate(bucket=bucket)
+    group = ['bucket'] + ([key, label] if key else [])
+    rows = sales.values(*group).annotate(
+        revenue=Sum('price'),
+        items=Count('id'),
+        orders=Count('order_id', distinct=True),
+    ).order_by('bucket', '-revenue')
+
+    results = {}
+    for row in rows:
+        results.setdefault(row['bucket'], []).append({
+            'id': row[key] if key else None,
+            'label': (row[label] or 'Uncategorized') if key else 'All sales',
+            'revenue': row['revenue'] or Decimal('0'),
+            'items': row['items'],
+            'orders': row['orders'],
+        })
+    return results
+
+
+def sales_series(granularity='day', dimension='total', start=None, end=None):
+    """
+    Revenue per bucket from start to end (dates, inclusive): a list of
+    {'bucket': date, 'rows': [{'id', 'label', 'revenue', 'items', 'orders'}]}
+    with rows sorted by revenue. The first and last buckets are whole weeks or
+    months even when start or end falls inside them.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+    if dimension not in DIMENSIONS:
+        raise ValueError(f'dimension must be one of {", ".join(DIMENSIONS)}')
+    today = timezone.localdate()
+    end = end or today
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise ValueError('start must not be after end')
+
+    buckets = buckets_between(start, end, granularity)
+    version = get_version(SALES_VERSION_NAMESPACE)
+    keys = {bucket: _bucket_key(version, granularity, dimension, bucket) for bucket in buckets}
+    cached = cache.get_many(keys.values())
+
+    missing = [bucket for bucket in buckets if keys[bucket] not in cached]
+    if missing:
+        fresh = _query_buckets(
+            granularity, dimension, missing[0], next_bucket(missing[-1], granularity)
+        )
+        open_bucket = bucket_start(today, granularity)
+        closed = {keys[bucket]: fresh.get(bucket, []) for bucket in missing if bucket < open_bucket}
+        if closed:
+            cache.set_many(closed, SALES_BUCKET_TIMEOUT)
+        for bucket in missing:
+            if bucket >= open_bucket:
+                cache.set(keys[bucket], fresh.get(bucket, []), settings.SALES_OPEN_BUCKET_TTL)
+            cached[keys[bucket]] = fresh.get(bucket, [])
+
+    return [{'bucket': bucket, 'rows': cached[keys[bucket]]} for bucket in buckets]
+
+
+def first_sale_date():
+    """Local date of the earliest completed order (today if there is none)"""
+    key = f'sales:{get_version(SALES_VERSION_NAMESPACE)}:first_sale'
+    first = cache.get(key)
+    if first is None:
+        sold_at = Order.objects.filter(status='completed').aggregate(
+            first=Min(Coalesce('completed_at', 'created_at'))
+        )['first']
+        first = timezone.localdate(sold_at) if sold_at else timezone.localdate()
+        cache.set(key, first, SALES_BUCKET_TIMEOUT)
+    return first
+
+
+def clipped_spans(start, end, granularity):
+    """
+    (granularity, start, end) spans covering exactly start..end: whole buckets
+    of `granularity`, with days for a partial bucket at either end
+    """
+    whole_from = bucket_start(start, granularity)
+    if whole_from < start:
+        whole_from = next_bucket(whole_from, granularity)
+    whole_until = bucket_start(end, granularity)
+    if next_bucket(whole_until, granularity) - timedelta(days=1) > end:
+        whole_until -= timedelta(days=1)
+    else:
+        whole_until = end
+    if whole_from > whole_until:
+        return [('day', start, end)]
+
+    spans = [(granularity, whole_from, whole_until)]
+    if start < whole_from:
+        spans.insert(0, ('day', start, whole_from - timedelta(days=1)))
+    if whole_until < end:
+        spans.append(('day', whole_until + timedelta(days=1), end))
+    return spans
+
+
+def sales_totals(dimension='total', start=None, end=None, granularity='month'):
+    """Revenue per course/instructor/category over start..end (default: all time), largest first"""
+    start = start or first_sale_date()
+    end = end or timezone.localdate()
+    if start > end:
+        raise ValueError('start must not be after end')
+    totals = {}
+    for span_granularity, span_start, span_end in clipped_spans(start, end, granularity):
+        for bucket in sales_series(span_granularity, dimension, span_start, span_end):
+            for row in bucket['rows']:
+                total = totals.setdefault(row['id'], {**row, 'revenue': Decimal('0'), 'items': 0, 'orders': 0})
+                total['revenue'] += row['revenue']
+                total['items'] += row['items']
+                total['orders'] += row['orders']
+    return sorted(totals.values(), key=lambda row: row['revenue'], reverse=True)
@@ -0,0 +1,145 @@
+"""
+Content-addressed storage for course material files.
+
+Every distinct file is stored once, as a MaterialBlob keyed by the SHA-256 of
+its bytes, under ``course_materials/blobs/<aa>/<sha256><ext>``. A
+CourseMaterial points at its blob, and its ``file`` holds the blob's name, so
+downloads work unchanged. Uploading a file that is already stored only adds
+a reference; nothing is sent to the storage backend.
+
+``ref_count`` is kept up to date by signals. Blobs that nothing references
+are deleted by ``manage.py gc_material_blobs`` once they have been unused
+for a grace period, which covers uploads that are still attaching to them.
+``manage.py dedupe_course_materials`` moves materials stored before this
+onto blobs and deletes the redundant copies.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, ProtectedError
+from django.utils import timezone
+
+from .models import CourseMaterial, MaterialBlob
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = 'course_materials/blobs'
+
+
+def file_sha256(content):
+    """(hex SHA-256, size in bytes) of a file, read in chunks"""
+    digest = hashlib.sha256()
+    size = 0
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for block in iter(lambda: content.read(1024 * 1024), b''):
+        digest.update(block)
+        size += len(block)
+    return digest.hexdigest(), size
+
+
+def blob_name(sha256, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256}{extension}'
+
+
+def store_blob(content, filename, sha256=None):
+    """The blob holding a file's content, uploading the file only if it isn't stored yet"""
+    if sha256 is None:
+        sha256, size = file_sha256(content)
+    else:
+        size = content.size
+
+    blob = MaterialBlob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        # Keeps the blob away from garbage collection while it's being attached
+        MaterialBlob.objects.filter(pk=blob.pk).update(last_used_at=timezone.now())
+        return blob
+
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    name = default_storage.save(blob_name(sha256, filename), content)
+    try:
+        with transaction.atomic():
+            return MaterialBlob.objects.create(sha256=sha256, file=name, size=size)
+    except IntegrityError:
+        # The same file was stored by a concurrent upload
+        default_storage.delete(name)
+        return MaterialBlob.objects.get(sha256=sha256)
+
+
+def use_blob(material, blob, filename):
+    """Point a CourseMaterial at a blob (references are counted when it is saved)"""
+    material.blob = blob
+    material.file = blob.file.name
+    material.original_filename = filename
+
+
+def collect_unused_blobs(grace_hours):
+    """Delete blobs (and their files) that nothing has referenced for `grace_hours`"""
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    unused = MaterialBlob.objects.filter(ref_count=0, last_used_at__lt=cutoff).exclude(
+        Exists(CourseMaterial.objects.filter(blob=OuterRef('pk')))
+    )
+    deleted = 0
+    for blob in unused.only('id', 'file').iterator():
+        try:
+            removed, _ = MaterialBlob.objects.filter(pk=blob.pk, ref_count=0, last_used_at__lt=cutoff).delete()
+        except ProtectedError:
+            # Referenced since the query ran; the count will be corrected by the next recount
+            continue
+        if removed:
+            default_storage.delete(blob.file.name)
+            deleted += 1
+    return deleted
+
+
+def deduplicate_materials(dry_run=False):
+    """
+    Move materials stored before blobs existed onto blobs. The first copy of
+    each content is adopted as its blob where it already is (no re-upload);
+    later copies are pointed at it and deleted. Returns counts of materials
+    moved, redundant files deleted, bytes reclaimed and unreadable files.
+    """
+    stats = {'materials': 0, 'duplicates': 0, 'bytes_reclaimed': 0, 'missing': 0}
+    seen = {}
+    materials = CourseMaterial.objects.filter(blob__isnull=True).exclude(file='').only(
+        'id', 'file', 'original_filename'
+    )
+    for material in materials.iterator():
+        name = material.file.name
+        try:
+            with default_storage.open(name, 'rb') as content:
+                sha256, size = file_sha256(content)
+        except (FileNotFoundError, OSError):
+            logger.warning('Course material %s: file %s could not be read', material.id, name)
+            stats['missing'] += 1
+            continue
+
+        stats['materials'] += 1
+        if dry_run:
+            if sha256 in seen or MaterialBlob.objects.filter(sha256=sha256).exists():
+                stats['duplicates'] += 1
+                stats['bytes_reclaimed'] += size
+            seen.setdefault(sha256, name)
+            continue
+
+        blob = MaterialBlob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            blob = MaterialBlob.objects.create(sha256=sha256, file=name, size=size)
+        CourseMaterial.objects.filter(pk=material.pk).update(
+            blob=blob, file=blob.file.name, original_filename=material.original_filename or os.path.basename(name)
+        )
+        if blob.file.name != name and not CourseMaterial.objects.filter(file=name).exists():
+            default_storage.delete(name)
+            stats['duplicates'] += 1
+            stats['bytes_reclaimed'] += size
+
+    if not dry_run:
+        # The updates above bypass the signals that keep ref_count current
+        MaterialBlob.refresh_ref_counts()
+    return stats
@@ -0,0 +1,53 @@
+"""
+Version counters for cache invalidation.
+
+Cached structures (course outlines, rendered fragments, ...) embed a version
+number in their cache key. Bumping the version makes every old entry
+unreachable, so nothing has to be deleted explicitly.
+"""
+import time
+
+from django.core.cache import cache
+
+REVIEW_VERSION_NAMESPACE = 'course_reviews'
+CATALOG_VERSION_NAMESPACE = 'catalog'
+CATALOG_MODIFIED_KEY = 'catalog:last_modified'
+
+
+def version_key(namespace, pk=''):
+    """Cache key holding the version counter for a namespace/object"""
+    return f"version:{namespace}:{pk}"
+
+
+def get_version(namespace, pk=''):
+    """Get the current version for a namespace/object"""
+    key = version_key(namespace, pk)
+    version = cache.get(key)
+    if version is None:
+        # Seed with a timestamp so an evicted counter never falls back to a
+        # version that still has stale entries cached under it.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, pk=''):
+    """Invalidate everything cached under the current version"""
+    key = version_key(namespace, pk)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def bump_catalog_version():
+    """Invalidate catalog pages and record when the catalog last changed"""
+    cache.set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+    return bump_version(CATALOG_VERSION_NAMESPACE)
+
+
+def catalog_last_modified():
+    """Unix time of the last catalog change, or None if it has been evicted"""
+    return cache.get(CATALOG_MODIFIED_KEY)
@@ -0,0 +1,246 @@
+"""
+Course structure (sections and lessons) editing for the all-in-one course editor.
+
+The editor posts the whole syllabus as JSON (``sections_data``). It is
+validated as a tree first and then diffed against the existing rows by id:
+inserts, updates, reorders and deletes are applied in bulk inside a single
+transaction. Lessons that are kept keep their primary key, so students'
+LessonProgress and the lesson's CourseMaterials survive the edit.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Section, Lesson
+from .outline import invalidate_course_outline, suppress_outline_invalidation
+
+SECTION_FIELDS = ['title', 'description', 'order']
+LESSON_FIELDS = [
+    'title', 'content_type', 'video_url', 'article_content',
+    'duration_minutes', 'order', 'is_preview',
+]
+CONTENT_TYPES = {choice for choice, _ in Lesson.CONTENT_TYPE_CHOICES}
+# Largest value of a PositiveIntegerField on Postgres (order, duration_minutes)
+MAX_NUMBER = 2 ** 31 - 1
+
+
+class CourseStructureError(ValueError):
+    """Raised when the submitted sections/lessons tree is invalid"""
+
+
+def _text(data, key, label, max_length=None, required=False):
+    value = data.get(key) or ''
+    if not isinstance(value, str):
+        raise CourseStructureError(f'{label}: {key} must be text')
+    value = value.strip()
+    if required and not value:
+        raise CourseStructureError(f'{label}: {key} is required')
+    if max_length and len(value) > max_length:
+        raise CourseStructureError(f'{label}: {key} must be at most {max_length} characters')
+    return value
+
+
+def _number(data, key, label):
+    value = data.get(key) or 0
+    if isinstance(value, bool):
+        raise CourseStructureError(f'{label}: {key} must be a number')
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise CourseStructureError(f'{label}: {key} must be a number')
+    if value < 0:
+        raise CourseStructureError(f'{label}: {key} cannot be negative')
+    if value > MAX_NUMBER:
+        raise CourseStructureError(f'{label}: {key} must be at most {MAX_NUMBER}')
+    return value
+
+
+def _id(data, label):
+    value = data.get('id')
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise CourseStructureError(f'{label}: invalid id')
+
+
+def parse_sections_data(raw):
+    """
+    Validate the posted sections JSON and return a normalized tree:
+    [{'id', 'title', 'description', 'order', 'lessons': [{'id', ...}]}]
+    """
+    try:
+        sections_data = json.loads(raw or '[]')
+    except ValueError:
+        raise CourseStructureError('Sections data is not valid JSON')
+    if not isinstance(sections_data, list):
+        raise CourseStructureError('Sections data must be a list')
+
+    validate_url = URLValidator()
+    sections = []
+    for section_index, section_data in enumerate(sections_data, start=1):
+        label = f'Section {section_index}'
+        if not isinstance(section_data, dict):
+            raise CourseStructureError(f'{label}: invalid section')
+        lessons_data = section_data.get('lessons') or []
+        if not isinstance(lessons_data, list):
+            raise CourseStructureError(f'{label}: lessons must be a list')
+
+        lessons = []
+        for lesson_index, lesson_data in enumerate(lessons_data, start=1):
+            lesson_label = f'{label}, lesson {lesson_index}'
+            if not isinstance(lesson_data, dict):
+                raise CourseStructureError(f'{lesson_label}: invalid lesson')
+            content_type = lesson_data.get('content_type') or 'video'
+            if content_type not in CONTENT_TYPES:
+                raise CourseStructureError(f'{lesson_label}: unknown content type "{content_type}"')
+            video_url = _text(lesson_data, 'video_url', lesson_label, max_length=200)
+            if video_url:
+                try:
+                    validate_url(video_url)
+                except ValidationError:
+                    raise CourseStructureError(f'{lesson_label}: invalid video URL')
+            lessons.append({
+                'id': _id(lesson_data, lesson_label),
+                'title': _text(lesson_data, 'title', lesson_label, max_length=200, required=True),
+                'content_type': content_type,
+                'video_url': video_url,
+                'article_content': _text(lesson_data, 'article_content', lesson_label),
+                'duration_minutes': _number(lesson_data, 'duration_minutes', lesson_label),
+                'order': _number(lesson_data, 'order', lesson_label),
+                'is_preview': bool(lesson_data.get('is_preview', False)),
+            })
+
+        sections.append({
+            'id': _id(section_data, label),
+            'title': _text(section_data, 'title', label, max_length=200, required=True),
+            'description': _text(section_data, 'description', label),
+            'order': _number(section_data, 'order', label),
+            'lessons': lessons,
+        })
+    return sections
+
+
+def _apply(instance, data, fields):
+    """Copy fields onto an instance, returning True if anything changed"""
+    changed = False
+    for field in fields:
+        if getattr(instance, field) != data[field]:
+            setattr(instance, field, data[field])
+            changed = True
+    return changed
+
+
+def sync_course_structure(course, sections):
+    """
+    Make the course's sections/lessons match the parsed tree.
+    Returns counts of created/updated/deleted rows.
+    """
+    with transaction.atomic(), suppress_outline_invalidation():
+        existing_sections = {section.id: section for section in Section.objects.filter(course=course)}
+        existing_lessons = {lesson.id: lesson for lesson in Lesson.objects.filter(section__course=course)}
+
+        seen_sections, seen_lessons = set(), set()
+        for section_data in sections:
+            if section_data['id'] is not None:
+                if section_data['id'] not in existing_sections or section_data['id'] in seen_sections:
+                    raise CourseStructureError(f'Unknown section id {section_data["id"]}')
+                seen_sections.add(section_data['id'])
+            for lesson_data in section_data['lessons']:
+                if lesson_data['id'] is not None:
+                    if lesson_data['id'] not in existing_lessons or lesson_data['id'] in seen_lessons:
+                        raise CourseStructureError(f'Unknown lesson id {lesson_data["id"]}')
+                    seen_lessons.add(lesson_data['id'])
+
+        # Sections: insert new ones (to get their ids), update changed ones
+        new_sections, changed_sections = [], []
+        section_for = []
+        for section_data in sections:
+            if section_data['id'] is None:
+                section = Section(course=course, **{f: section_data[f] for f in SECTION_FIELDS})
+                new_sections.append(section)
+            else:
+                section = existing_sections[section_data['id']]
+                if _apply(section, section_data, SECTION_FIELDS):
+                    changed_sections.append(section)
+            section_for.append(section)
+        Section.objects.bulk_create(new_sections)
+        Section.objects.bulk_update(changed_sections, SECTION_FIELDS)
+
+        # Lessons: insert, update (including moves between sections)
+        now = timezone.now()
+        new_lessons, changed_lessons = [], []
+        for section, section_data in zip(section_for, sections):
+            for lesson_data in section_data['lessons']:
+                if lesson_data['id'] is None:
+                    new_lessons.append(Lesson(section=section, **{f: lesson_data[f] for f in LESSON_FIELDS}))
+                    continue
+                lesson = existing_lessons[lesson_data['id']]
+                changed = _apply(lesson, lesson_data, LESSON_FIELDS)
+                if lesson.section_id != section.id:
+                    lesson.section = section
+                    changed = True
+                if changed:
+                    lesson.updated_at = now
+                    changed_lessons.append(lesson)
+        Lesson.objects.bulk_create(new_lessons)
+        Lesson.objects.bulk_update(changed_lessons, LESSON_FIELDS + ['section', 'updated_at'])
+
+        # Deletes last, after kept lessons have been moved out of removed sections
+        removed_lessons = set(existing_lessons) - seen_lessons
+        removed_sections = set(existing_sections) - seen_sections
+        if removed_lessons:
+            Lesson.objects.filter(id__in=removed_lessons).delete()
+        if removed_sections:
+            Section.objects.filter(id__in=removed_sections).delete()
+
+        transaction.on_commit(lambda: invalidate_course_outline(course.id))
+
+    return {
+        'created': len(new_sections) + len(new_lessons),
+        'updated': len(changed_sections) + len(changed_lessons),
+        'deleted': len(removed_sections) + len(removed_lessons),
+    }
+
+
+def build_course_structure(course, sections):
+    """
+    Insert the parsed tree for a new course: one bulk insert for sections and
+    one for lessons, whatever the size of the syllabus. Ids in the tree are
+    ignored. Call inside the transaction that created the course.
+    """
+    with transaction.atomic(), suppress_outline_invalidation():
+        new_sections = Section.objects.bulk_create([
+            Section(course=course, **{f: section_data[f] for f in SECTION_FIELDS})
+            for section_data in sections
+        ])
+        new_lessons = Lesson.objects.bulk_create([
+            Lesson(section=section, **{f: lesson_data[f] for f in LESSON_FIELDS})
+            for section, section_data in zip(new_sections, sections)
+            for lesson_data in section_data['lessons']
+        ])
+        transaction.on_commit(lambda: invalidate_course_outline(course.id))
+
+    return {'sections': len(new_sections), 'lessons': len(new_lessons)}
+
+
+def serialize_course_structure(course):
+    """Sections/lessons of a course (with ids) as the editor expects them"""
+    sections = Section.objects.filter(course=course).prefetch_related('lessons').order_by('order', 'id')
+    return [
+        {
+            'id': section.id,
+            'title': section.title,
+            'description': section.description,
+            'order': section.order,
+            'lessons': [
+                {'id': lesson.id, **{field: getattr(lesson, field) for field in LESSON_FIELDS}}
+                for lesson in section.lessons.all()
+            ],
+        }
+        for section in sections
+    ]
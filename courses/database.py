@@ -0,0 +1,305 @@
+"""
+Runtime database helpers: per-route statement timeouts, read-replica routing
+and pool metrics.
+
+Requests are sorted into route classes (DATABASE_ROUTE_CLASSES, by URL
+prefix or view name) and a class with its own limit in
+DATABASE_ROUTE_STATEMENT_TIMEOUTS runs its queries under that
+statement_timeout instead of the connection default. The timeout is applied
+lazily, just before the request's first query on each connection:
+
+* inside a transaction, with set_config(..., is_local => true) before the
+  transaction's first statement, so it ends with the transaction;
+* otherwise at session level, and RESET when the request finishes, so the
+  connection goes back to its persistent/pooled life with the default;
+* behind PgBouncer in transaction mode session settings would leak to other
+  clients, so autocommit queries are wrapped in a short transaction instead.
+
+GET/HEAD requests to DATABASE_REPLICA_ROUTES read from one of the
+DATABASE_REPLICAS, chosen per request. Everything else reads from the
+primary, as do all queries outside a request. Once a request writes (or its
+view is marked @use_primary) its remaining reads go to the primary, and a
+cookie keeps that user's requests there for DATABASE_REPLICA_STICKY_SECONDS
+so they read their own writes despite replication lag. Shared catalog pages
+also read from the primary for that long after the catalog changes (see
+courses/http_cache.py).
+"""
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+STICKY_PRIMARY_COOKIE = 'db_primary_until'
+
+_routing = ContextVar('database_routing', default=None)
+
+
+def route_matches(pattern, path, view_name):
+    """A route pattern is a URL prefix ('/...') or a namespaced view name"""
+    if pattern.startswith('/'):
+        return path.startswith(pattern)
+    return pattern == view_name
+
+
+def route_class(path, view_name):
+    """The DATABASE_ROUTE_CLASSES entry matching a request, or 'default'"""
+    for pattern, route in settings.DATABASE_ROUTE_CLASSES:
+        if route_matches(pattern, path, view_name):
+            return route
+    return 'default'
+
+
+class StatementTimeout:
+    """Execute wrapper that runs a connection's queries under a statement timeout"""
+
+    def __init__(self, milliseconds, transaction_local):
+        self.value = f'{int(milliseconds)}ms'
+        self.transaction_local = transaction_local
+        self.session_connection = None
+
+    def _set(self, cursor, local):
+        cursor.execute("SELECT set_config('statement_timeout', %s, %s)", [self.value, local])
+
+    @staticmethod
+    def _transaction_not_begun(connection):
+        """Whether nothing has run yet in the connection's current transaction"""
+        status = connection.connection.info.transaction_status
+        return status == connection.Database.pq.TransactionStatus.IDLE
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        cursor = context['cursor'].cursor
+        if connection.in_atomic_block:
+            # The transaction begins on the server with its first statement, so
+            # a local setting made then lasts exactly as long as the transaction
+            if self._transaction_not_begun(connection):
+                self._set(cursor, True)
+            return execute(sql, params, many, context)
+
+        if self.transaction_local:
+            with transaction.atomic(using=connection.alias):
+                self._set(cursor, True)
+                return execute(sql, params, many, context)
+
+        if self.session_connection is not connection.connection:
+            self._set(cursor, False)
+            self.session_connection = connection.connection
+        return execute(sql, params, many, context)
+
+    def reset(self, connection):
+        """Put a session-level timeout back to the connection default"""
+        if self.session_connection is None or self.session_connection is not connection.connection:
+            return
+        self.session_connection = None
+        if connection.in_atomic_block:
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET statement_timeout')
+        except DatabaseError:
+            # A broken connection is discarded rather than reused
+            connection.close_if_unusable_or_obsolete()
+
+
+class StatementTimeoutMiddleware:
+    """Apply DATABASE_ROUTE_STATEMENT_TIMEOUTS to the queries of matching requests"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.remove_timeouts(request)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            if getattr(request, '_statement_timeouts', None) is not None:
+                # process_view ran on the request's sync thread, where its connections live
+                await sync_to_async(self.remove_timeouts)(request)
+
+    def remove_timeouts(self, request):
+        applied = getattr(request, '_statement_timeouts', None)
+        if applied is not None:
+            stack, wrappers = applied
+            stack.close()
+            for connection, wrapper in wrappers:
+                wrapper.reset(connection)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        route = route_class(request.path_info, match.view_name if match else '')
+        milliseconds = settings.DATABASE_ROUTE_STATEMENT_TIMEOUTS.get(route)
+        if not milliseconds or milliseconds == settings.DATABASE_STATEMENT_TIMEOUT:
+            return None
+
+        transaction_local = settings.DATABASE_CONNECTION_MODE == 'pgbouncer'
+        stack = ExitStack()
+        wrappers = []
+        for alias in connections:
+            connection = connections[alias]
+            if connection.vendor != 'postgresql':
+                continue
+            wrapper = StatementTimeout(milliseconds, transaction_local)
+            stack.enter_context(connection.execute_wrapper(wrapper))
+            wrappers.append((connection, wrapper))
+        request._statement_timeouts = (stack, wrappers)
+        return None
+
+
+# ============================================================================
+# READ REPLICAS
+# ============================================================================
+
+class RoutingState:
+    """Where the current request reads from; shared by every thread serving it"""
+
+    def __init__(self, sticky=False):
+        self.replica = None
+        self.sticky = sticky
+        self.pinned = False
+
+    def use_replica(self):
+        if not self.sticky and settings.DATABASE_REPLICAS:
+            self.replica = random.choice(settings.DATABASE_REPLICAS)
+
+    def stick_to_primary(self):
+        self.replica = None
+        self.sticky = True
+        self.pinned = True
+
+
+def read_from_primary():
+    """Send the current request's remaining reads to the primary, without the sticky cookie"""
+    state = _routing.get()
+    if state is not None:
+        state.replica = None
+
+
+def use_primary(view_func):
+    """Mark a view whose reads must see the latest writes (and start the sticky window)"""
+    view_func.use_primary = True
+    return view_func
+
+
+class PrimaryReplicaRouter:
+    """Send reads to the request's replica, if it has one, and writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.stick_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Route a request's reads to a replica or the primary, see the module docstring"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.routing_state(request)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.remember_primary(state, response)
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context, so the ORM calls of async views see the same state
+        state = self.routing_state(request)
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.remember_primary(state, response)
+
+    def routing_state(self, request):
+        try:
+            until = float(request.COOKIES.get(STICKY_PRIMARY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        return RoutingState(sticky=until > time.time())
+
+    def remember_primary(self, state, response):
+        """Keep a user who wrote on the primary for DATABASE_REPLICA_STICKY_SECONDS"""
+        if state.pinned and settings.DATABASE_REPLICAS:
+            seconds = settings.DATABASE_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_PRIMARY_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _routing.get()
+        if state is None:
+            return None
+        if getattr(view_func, 'use_primary', False):
+            state.stick_to_primary()
+            return None
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        match = request.resolver_match
+        view_name = match.view_name if match else ''
+        if any(route_matches(pattern, request.path_info, view_name) for pattern in settings.DATABASE_REPLICA_ROUTES):
+            state.use_replica()
+        return None
+
+
+def pool_metrics():
+    """Per-alias connection settings and, for pooled aliases, pool saturation"""
+    metrics = {}
+    for alias in connections:
+        connection = connections[alias]
+        entry = {
+            'vendor': connection.vendor,
+            'mode': settings.DATABASE_CONNECTION_MODE,
+            'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+        }
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            stats = pool.get_stats()
+            in_use = stats.get('pool_size', 0) - stats.get('pool_available', 0)
+            entry['pool'] = stats
+            entry['in_use'] = in_use
+            entry['saturation'] = round(in_use / stats['pool_max'], 3) if stats.get('pool_max') else None
+        metrics[alias] = entry
+    return metrics
@@ -0,0 +1,157 @@
+"""
+Course discussion forum listing.
+
+Threads carry denormalized reply_count / last_reply_* / last_activity_at
+columns (kept current by DiscussionReply signals), so a forum page is a
+single keyset range over the (course, -is_pinned, -last_activity_at, -id)
+index with the authors joined in - no per-thread COUNT queries.
+
+Replies inside a thread are paged in chronological order using the stored
+reply_count for the page total. Clients pick up new replies incrementally,
+either by polling get_new_replies or through the SSE stream, which only
+touches the database when the thread's reply version changes.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .caching import version_key, get_version, bump_version
+from .models import Discussion, DiscussionReply
+from .pagination import encode_cursor, decode_cursor, slice_page
+
+DISCUSSIONS_PAGE_SIZE = 20
+REPLIES_PAGE_SIZE = 25
+MAX_NEW_REPLIES = 100
+REPLY_VERSION_NAMESPACE = 'discussion_replies'
+
+# Server-Sent Events: how often the stream checks the reply version, how often
+# it sends a keepalive comment, and how long before the client must reconnect
+SSE_POLL_SECONDS = 2
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 300
+
+
+def discussion_cursor(discussion):
+    """Cursor pointing just after the given thread"""
+    return encode_cursor(discussion.is_pinned, discussion.last_activity_at, discussion.id)
+
+
+def get_discussion_page(course, cursor=None, limit=DISCUSSIONS_PAGE_SIZE):
+    """
+    Get one page of a course's threads, pinned first, then by latest activity.
+    Returns (discussions, next_cursor); next_cursor is None on the last page.
+    """
+    discussions = Discussion.objects.filter(course=course).select_related(
+        'author', 'last_reply_author'
+    ).order_by('-is_pinned', '-last_activity_at', '-id')
+    if cursor:
+        is_pinned, last_activity_at, discussion_id = decode_cursor(cursor, bool, datetime, int)
+        discussions = discussions.filter(
+            Q(is_pinned__lt=is_pinned) |
+            Q(is_pinned=is_pinned, last_activity_at__lt=last_activity_at) |
+            Q(is_pinned=is_pinned, last_activity_at=last_activity_at, id__lt=discussion_id)
+        )
+    return slice_page(discussions[:limit + 1], limit, discussion_cursor)
+
+
+# ============================================================================
+# REPLIES
+# ============================================================================
+
+def reply_page_count(discussion):
+    """Number of reply pages, from the denormalized reply count"""
+    return max(1, -(-discussion.reply_count // REPLIES_PAGE_SIZE))
+
+
+def get_reply_page(discussion, page_number):
+    """
+    Get one page of replies, oldest first.
+    Returns (replies, page_number, page_count) with page_number clamped.
+    """
+    page_count = reply_page_count(discussion)
+    try:
+        page_number = int(page_number)
+    except (TypeError, ValueError):
+        page_number = 1
+    page_number = max(1, min(page_number, page_count))
+
+    offset = (page_number - 1) * REPLIES_PAGE_SIZE
+    replies = DiscussionReply.objects.filter(discussion=discussion).select_related(
+        'author'
+    ).order_by('created_at', 'id')[offset:offset + REPLIES_PAGE_SIZE]
+    return list(replies), page_number, page_count
+
+
+def get_new_replies(discussion_id, after_id=None, since=None, limit=MAX_NEW_REPLIES):
+    """Replies created after a reply id and/or timestamp, oldest first"""
+    replies = DiscussionReply.objects.filter(discussion_id=discussion_id).select_related('author')
+    if after_id is not None:
+        replies = replies.filter(id__gt=after_id)
+    if since is not None:
+        replies = replies.filter(created_at__gt=since)
+    return replies.order_by('created_at', 'id')[:limit]
+
+
+def reply_version_key(discussion_id):
+    return version_key(REPLY_VERSION_NAMESPACE, discussion_id)
+
+
+def get_reply_version(discussion_id):
+    """Version bumped every time a reply is added to or removed from a thread"""
+    return get_version(REPLY_VERSION_NAMESPACE, discussion_id)
+
+
+def bump_reply_version(discussion_id):
+    bump_version(REPLY_VERSION_NAMESPACE, discussion_id)
+
+
+def serialize_reply(reply):
+    """Reply as returned by the new-replies endpoint and the SSE stream"""
+    return {
+        'id': reply.id,
+        'author': reply.author.get_full_name() or reply.author.username,
+        'is_instructor_reply': reply.is_instructor_reply,
+        'content': reply.content,
+        'created_at': reply.created_at.isoformat(),
+    }
+
+
+async def reply_event_stream(discussion_id, last_id=0):
+    """
+    Server-Sent Events for replies posted after last_id. Only the cache is
+    polled while nothing happens; the database is queried when the thread's
+    reply version changes. Ends after SSE_MAX_SECONDS, the browser reconnects
+    with Last-Event-ID and picks up where it left off.
+    """
+    key = reply_version_key(discussion_id)
+    deadline = time.monotonic() + SSE_MAX_SECONDS
+    version = await cache.aget(key)
+    yield f'retry: {SSE_POLL_SECONDS * 1000}\n\n'
+
+    while True:
+        # A full batch means more replies may be waiting; fetch until one comes back short
+        sent = MAX_NEW_REPLIES
+        while sent == MAX_NEW_REPLIES:
+            sent = 0
+            async for reply in get_new_replies(discussion_id, after_id=last_id, limit=MAX_NEW_REPLIES):
+                sent += 1
+                last_id = reply.id
+                yield f'id: {reply.id}\nevent: reply\ndata: {json.dumps(serialize_reply(reply))}\n\n'
+
+        idle = 0
+        while True:
+            if time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(SSE_POLL_SECONDS)
+            current = await cache.aget(key)
+            if current != version:
+                version = current
+                break
+            idle += SSE_POLL_SECONDS
+            if idle >= SSE_HEARTBEAT_SECONDS:
+                idle = 0
+                yield ': keepalive\n\n'
@@ -0,0 +1,192 @@
+"""
+Protected file downloads.
+
+Views check access and then call ``serve_protected_file``, which picks the
+cheapest way to send the file:
+
+1. Files larger than MEDIA_REDIRECT_MIN_BYTES on a remote store that can
+   sign expiring URLs are redirected to one, so they never reach the app.
+2. With PROTECTED_MEDIA_SERVER = 'nginx' (X-Accel-Redirect) or 'apache'
+   (X-Sendfile), the front-end server sends the file from disk and handles
+   Range requests itself. The worker is free again as soon as the headers
+   are sent.
+3. Otherwise the file goes out through FileResponse. Under gunicorn that
+   uses wsgi.file_wrapper, which is os.sendfile. Single byte ranges are
+   answered with 206 by exposing only the requested window of the file.
+"""
+import io
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .storage import should_redirect, signed_url
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header into an inclusive (start, end) byte range. Returns None
+    when the whole file should be sent, including for malformed or multi-range
+    headers. Raises RangeNotSatisfiable when the range lies past the end.
+    """
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class FileRange:
+    """A read-only window on an open file, so FileResponse sends only that part"""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.name = getattr(file, 'name', None)
+        self.file.seek(start)
+
+    def fileno(self):
+        # With wsgi.file_wrapper, gunicorn sendfiles Content-Length bytes from the current offset
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += self.length
+        offset = max(0, min(offset, self.length))
+        self.file.seek(self.start + offset)
+        return offset
+
+    def read(self, size=-1):
+        remaining = self.length - self.tell()
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+def local_file_path(field_file):
+    """Path of a file on local disk (the storage's cache for remote stores), or None"""
+    storage = field_file.storage
+    if hasattr(storage, 'local_path'):
+        return storage.local_path(field_file.name)
+    try:
+        return storage.path(field_file.name)
+    except NotImplementedError:
+        return None
+
+
+def accel_redirect_uri(path):
+    """Internal nginx URI for a file, from PROTECTED_MEDIA_ACCEL_LOCATIONS"""
+    path = os.path.realpath(path)
+    for directory, location in settings.PROTECTED_MEDIA_ACCEL_LOCATIONS.items():
+        directory = os.path.realpath(directory)
+        if os.path.commonpath([path, directory]) == directory:
+            return location.rstrip('/') + '/' + os.path.relpath(path, directory).replace(os.sep, '/')
+    return None
+
+
+def _if_range_matches(request, etag, last_modified):
+    """A Range request only applies if the file hasn't changed since the client's copy"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_protected_file(request, field_file, filename, content_type=None):
+    """Send a FieldFile the caller has already authorized as an attachment"""
+    storage = field_file.storage
+    name = field_file.name
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if hasattr(storage, 'signed_url') and should_redirect(storage.size(name)):
+        url = signed_url(storage, name)
+        if url:
+            return HttpResponseRedirect(url)
+
+    path = local_file_path(field_file)
+    server = settings.PROTECTED_MEDIA_SERVER
+    if path and server == 'nginx':
+        uri = accel_redirect_uri(path)
+        if uri:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = uri
+            return _attachment(response, filename)
+    elif path and server == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return _attachment(response, filename)
+
+    file = open(path, 'rb') if path else storage.open(name, 'rb')
+    try:
+        if path:
+            stat = os.fstat(file.fileno())
+            size, last_modified = stat.st_size, int(stat.st_mtime)
+        else:
+            size, last_modified = storage.size(name), None
+        etag = quote_etag(f'{size:x}-{last_modified or 0:x}')
+
+        byte_range = None
+        if _if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    except BaseException:
+        file.close()
+        raise
+
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(file, content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return _attachment(response, filename)
+
+
+def _attachment(response, filename):
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Cache-Control'] = 'private, no-transform'
+    return response
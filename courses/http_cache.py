@@ -0,0 +1,150 @@
+"""
+HTTP caching for anonymous catalog pages.
+
+Visitors without a session or messages cookie all get the same catalog HTML,
+so their responses carry:
+
+* an ETag built from the catalog version counter (bumped whenever a course,
+  instructor, category, lesson, review or enrollment changes), the deployed
+  code and any per-page parts such as Course.updated_at;
+* a Last-Modified from the same sources;
+* Cache-Control that lets browsers keep the page for CATALOG_BROWSER_MAX_AGE
+  and a CDN for CATALOG_CDN_MAX_AGE.
+
+A conditional request that still matches is answered with a 304 before the
+view runs. The ETag changes as soon as the catalog changes, but a replica
+may not have the change yet, so for DATABASE_REPLICA_STICKY_SECONDS after a
+change shared pages are built from the primary; otherwise a stale page
+could be cached under the new ETag until the next change. Requests with a session or messages cookie get a private response,
+and every response varies on Cookie, so a shared cache never hands one user's
+page to another.
+"""
+import hashlib
+import time
+from functools import lru_cache, wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .caching import CATALOG_VERSION_NAMESPACE, catalog_last_modified, get_version
+from .database import read_from_primary
+
+
+def is_shared_request(request):
+    """Whether the response can be shared: no session and no pending messages"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+@lru_cache(maxsize=1)
+def deployed_at():
+    """Newest template or courses module, so a deploy changes every validator"""
+    directories = [Path(directory) for directory in settings.TEMPLATES[0]['DIRS']]
+    directories.append(Path(__file__).resolve().parent)
+    newest = 0
+    for directory in directories:
+        for path in directory.rglob('*'):
+            if path.suffix in ('.html', '.py'):
+                newest = max(newest, int(path.stat().st_mtime))
+    return newest
+
+
+def catalog_validators(*parts, modified=None):
+    """ETag and Last-Modified (unix time) for a page built from the catalog"""
+    version = get_version(CATALOG_VERSION_NAMESPACE)
+    digest = hashlib.sha1(repr((version, deployed_at(), parts)).encode()).hexdigest()
+    last_modified = catalog_last_modified()
+    if last_modified is not None:
+        last_modified = max(last_modified, deployed_at(), int(modified.timestamp()) if modified else 0)
+    return quote_etag(digest), last_modified
+
+
+def read_recent_changes_from_primary():
+    """Build the page from the primary while replicas may still lag behind a catalog change"""
+    changed = catalog_last_modified()
+    if changed is None or time.time() - changed < settings.DATABASE_REPLICA_STICKY_SECONDS:
+        read_from_primary()
+
+
+def _shared_headers(response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.CATALOG_BROWSER_MAX_AGE,
+        s_maxage=settings.CATALOG_CDN_MAX_AGE,
+        stale_while_revalidate=settings.CATALOG_STALE_WHILE_REVALIDATE,
+    )
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def _not_modified(response, etag, last_modified):
+    # A failed If-Match precondition (412) is not a cacheable page
+    if response.status_code == 304:
+        return _shared_headers(response, etag, last_modified)
+    return response
+
+
+def _finish(request, response, etag, last_modified):
+    # A page that issued a CSRF token or set cookies belongs to one visitor
+    if (
+        response.status_code != 200
+        or response.cookies
+        or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    ):
+        return private_response(response)
+    return _shared_headers(response, etag, last_modified)
+
+
+def private_response(response):
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def catalog_page(validators=None):
+    """
+    Conditional GET and CDN caching for an anonymous catalog view.
+    validators(request, *args, **kwargs) returns the page's extra ETag parts and
+    its own last-modified datetime (or None); by default only the catalog counts.
+    """
+    def resolve(request, *args, **kwargs):
+        read_recent_changes_from_primary()
+        parts, modified = validators(request, *args, **kwargs) if validators else ((), None)
+        return catalog_validators(*parts, modified=modified)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                if not is_shared_request(request):
+                    return private_response(await view_func(request, *args, **kwargs))
+                etag, last_modified = await sync_to_async(resolve)(request, *args, **kwargs)
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    return _not_modified(not_modified, etag, last_modified)
+                response = await view_func(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified)
+        else:
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                if not is_shared_request(request):
+                    return private_response(view_func(request, *args, **kwargs))
+                etag, last_modified = resolve(request, *args, **kwargs)
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    return _not_modified(not_modified, etag, last_modified)
+                response = view_func(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified)
+        return _wrapped_view
+    return decorator
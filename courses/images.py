@@ -0,0 +1,210 @@
+"""
+Responsive image derivatives.
+
+When a course image, instructor photo or profile picture is uploaded, a
+background worker resizes it with Pillow to a few fixed widths in AVIF (when
+Pillow was built with it), WebP and JPEG, saves the files through the
+default storage backend and records them on the model's ``*_variants``
+JSONField:
+
+    {"source": "courses/intro.jpg",
+     "formats": {"webp": [[320, "derivatives/courses/intro/320.webp"], ...], ...}}
+
+The ``responsive_image`` template tag turns that into a <picture> with
+``srcset``. Until the variants exist (or if generation failed) the original
+file is served. ``manage.py generate_image_derivatives`` processes anything
+still pending, e.g. images uploaded before this existed. When an image is
+replaced, cleared or its row deleted, the old original and its derivatives
+are deleted from storage once the change is committed.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# model label -> image fields that get derivatives (variants are stored in <field>_variants)
+IMAGE_FIELDS = {
+    'courses.Course': ['image'],
+    'courses.Instructor': ['profile_image'],
+    'courses.UserProfile': ['profile_picture'],
+}
+
+# (format key, Pillow format, MIME type, save options), best compression first
+DERIVATIVE_FORMATS = [
+    ('avif', 'AVIF', 'image/avif', {'quality': 50}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 75, 'method': 6}),
+    ('jpeg', 'JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+]
+
+_executor = None
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def available_formats():
+    """Derivative formats this Pillow build can encode"""
+    return [entry for entry in DERIVATIVE_FORMATS if entry[0] != 'avif' or features.check('avif')]
+
+
+def derivative_name(source_name, width, extension):
+    stem, _ = os.path.splitext(source_name)
+    return f'derivatives/{stem}/{width}.{extension}'
+
+
+def generate_derivatives(field_file):
+    """Resize an image file to every configured width/format and store the results"""
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    # Derivatives never upscale; a small original still gets one rendition
+    widths = [width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width < image.width]
+    if not widths:
+        widths = [image.width]
+
+    formats = {}
+    for key, pillow_format, mime_type, options in available_formats():
+        renditions = []
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            if pillow_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                resized = resized.convert('RGB')
+            buffer = BytesIO()
+            resized.save(buffer, pillow_format, **options)
+
+            name = derivative_name(field_file.name, width, key)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            renditions.append([width, name])
+        formats[key] = renditions
+
+    return {'source': field_file.name, 'formats': formats}
+
+
+def process_image(model_label, pk, field_name):
+    """Generate and record derivatives for one image field of one row"""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return None
+
+    previous = getattr(instance, variants_field(field_name)) or {}
+    variants = generate_derivatives(field_file)
+    # Only record them if the image was not replaced while we were working
+    updated = model.objects.filter(pk=pk, **{field_name: field_file.name}).update(
+        **{variants_field(field_name): variants}
+    )
+    if updated and previous.get('source') != variants['source']:
+        delete_derivatives(previous, keep=variants)
+    elif not updated:
+        current = model.objects.filter(pk=pk).values_list(variants_field(field_name), flat=True).first()
+        delete_derivatives(variants, keep=current)
+        return None
+    return variants
+
+
+def variant_names(variants):
+    """Storage names of every derivative recorded in a variants dict"""
+    formats = (variants or {}).get('formats', {})
+    return {name for renditions in formats.values() for _, name in renditions}
+
+
+def delete_derivatives(variants, keep=None):
+    """Delete the derivative files of a replaced image, except any the new variants reuse"""
+    for name in variant_names(variants) - variant_names(keep):
+        default_storage.delete(name)
+
+
+def delete_image_files(model, field_name, name, variants):
+    """Delete an image file no row refers to any more, with its derivatives"""
+    if model.objects.filter(**{field_name: name}).exists():
+        return
+    delete_derivatives(variants)
+    model._meta.get_field(field_name).storage.delete(name)
+
+
+def delete_image_on_commit(instance, field_name, name, variants):
+    """Delete a replaced or orphaned image once the change is committed"""
+    model = type(instance)
+    transaction.on_commit(lambda: delete_image_files(model, field_name, name, variants))
+
+
+def _run(model_label, pk, field_name):
+    try:
+        process_image(model_label, pk, field_name)
+    except Exception:
+        logger.exception('Image derivatives failed for %s %s.%s', model_label, pk, field_name)
+    finally:
+        connection.close()
+
+
+def enqueue_derivatives(instance, field_name):
+    """Generate derivatives in the background once the upload is committed"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='images')
+    model_label = instance._meta.label
+    transaction.on_commit(lambda: _executor.submit(_run, model_label, instance.pk, field_name))
+
+
+def needs_derivatives(instance, field_name):
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field(field_name)) or {}
+    return bool(field_file) and variants.get('source') != field_file.name
+
+
+def pending_images():
+    """(model label, pk, field name) for every image without current derivatives"""
+    for model_label, field_names in IMAGE_FIELDS.items():
+        model = apps.get_model(model_label)
+        for field_name in field_names:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in rows.only('pk', field_name, variants_field(field_name)).iterator():
+                if needs_derivatives(instance, field_name):
+                    yield model_label, instance.pk, field_name
+
+
+def picture_sources(field_file):
+    """
+    Srcsets for the current variants of an image as
+    ([(mime type, srcset), ...] best format first, jpeg srcset, largest jpeg URL).
+    Empty when the image has no up-to-date derivatives yet.
+    """
+    instance = getattr(field_file, 'instance', None)
+    field = getattr(field_file, 'field', None)
+    variants = getattr(instance, variants_field(field.name), None) if field is not None else None
+    if not variants or variants.get('source') != field_file.name:
+        return [], '', None
+
+    formats = variants.get('formats', {})
+    sources = []
+    for key, _, mime_type, _ in DERIVATIVE_FORMATS:
+        renditions = formats.get(key)
+        if key != 'jpeg' and renditions:
+            sources.append((mime_type, _srcset(renditions)))
+
+    jpeg = formats.get('jpeg') or []
+    if not jpeg:
+        return sources, '', None
+    return sources, _srcset(jpeg), default_storage.url(jpeg[-1][1])
+
+
+def _srcset(renditions):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in renditions)
@@ -0,0 +1,127 @@
+"""
+Compare concurrent-request throughput of the WSGI and ASGI deployments
+Usage: python manage.py benchmark_servers [--concurrency 64] [--requests 2000] [--workers 3] / /courses/ /instructors/
+
+Starts gunicorn with sync workers (emining_university.wsgi) and then with
+uvicorn workers (emining_university.gunicorn_asgi) on a local port, fires
+the same concurrent load at each path and prints requests/second and latency
+percentiles side by side. Run it against a database that looks like
+production; pass --header 'Cookie: sessionid=...' to benchmark logged-in pages.
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = [
+    ('wsgi', ['emining_university.wsgi:application', '--worker-class', 'sync']),
+    ('asgi', ['-c', 'python:emining_university.gunicorn_asgi', 'emining_university.asgi:application']),
+]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _load(base_url, path, concurrency, total, headers):
+    """Send `total` GETs with `concurrency` in flight; (seconds, latencies, errors)"""
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the WSGI and ASGI (uvicorn worker) deployments under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/', '/courses/', '/instructors/'])
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per path and profile')
+        parser.add_argument('--workers', type=int, default=3, help='Gunicorn worker processes')
+        parser.add_argument('--warmup', type=int, default=50, help='Unmeasured requests per path first')
+        parser.add_argument(
+            '--header',
+            action='append',
+            default=[],
+            help="Extra request header, e.g. 'Cookie: sessionid=...' (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        for header in options['header']:
+            name, _, value = header.partition(':')
+            headers[name.strip()] = value.strip()
+
+        results = []
+        for profile, arguments in PROFILES:
+            port = _free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            server = self._start(arguments, port, options['workers'])
+            try:
+                self._wait_until_ready(server, base_url)
+                for path in options['paths']:
+                    asyncio.run(_load(base_url, path, options['concurrency'], options['warmup'], headers))
+                    elapsed, latencies, errors = asyncio.run(
+                        _load(base_url, path, options['concurrency'], options['requests'], headers)
+                    )
+                    results.append((profile, path, elapsed, latencies, errors))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        self.stdout.write(
+            f'{"profile":<8}{"path":<28}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}'
+        )
+        for profile, path, elapsed, latencies, errors in results:
+            cuts = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f'{profile:<8}{path:<28}{len(latencies) / elapsed:>10.1f}'
+                f'{cuts[49] * 1000:>10.1f}{cuts[94] * 1000:>10.1f}{cuts[98] * 1000:>10.1f}{errors:>8}'
+            )
+
+    def _start(self, arguments, port, workers):
+        environment = dict(os.environ, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(workers))
+        command = [
+            sys.executable, '-m', 'gunicorn', *arguments,
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+        ]
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=environment)
+
+    def _wait_until_ready(self, server, base_url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'The server exited with status {server.returncode}')
+            try:
+                httpx.get(base_url + '/', timeout=2)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise CommandError(f'The server did not start within {timeout} seconds')
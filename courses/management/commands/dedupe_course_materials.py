@@ -0,0 +1,30 @@
+"""
+Move course materials uploaded before content-addressed storage onto shared blobs,
+deleting the duplicate copies
+Usage: python manage.py dedupe_course_materials [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from courses.blobs import deduplicate_materials
+
+
+class Command(BaseCommand):
+    help = 'Deduplicate existing course material files by content'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how much would be reclaimed',
+        )
+
+    def handle(self, *args, **options):
+        stats = deduplicate_materials(dry_run=options['dry_run'])
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        if stats['missing']:
+            self.stdout.write(self.style.WARNING(f'{stats["missing"]} material files could not be read'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["materials"]} materials checked, {stats["duplicates"]} duplicates; '
+            f'{verb} {filesizeformat(stats["bytes_reclaimed"])}'
+        ))
@@ -0,0 +1,23 @@
+"""
+Delete chunked material uploads that were abandoned part-way, with their part files
+Usage: python manage.py expire_material_uploads [--hours 48]  (run daily from cron)
+"""
+from django.core.management.base import BaseCommand
+
+from courses.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished or aborted material uploads that have been idle too long'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=48,
+            help='Expire uploads with no new chunk for this many hours',
+        )
+
+    def handle(self, *args, **options):
+        expired = expire_uploads(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} material uploads'))
@@ -0,0 +1,229 @@
+"""
+Django management command to EXPLAIN the hot query shapes used by the views
+and report sequential scans / sorts that are not served by an index.
+
+Usage:
+    python manage.py explain_hot_queries
+    python manage.py explain_hot_queries --seed 2000 --compare
+
+--seed creates synthetic data inside a transaction that is rolled back at the
+end. --compare times every query with and without the composite indexes from
+migration 0007 (the indexes are dropped inside the same rolled-back
+transaction).
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from courses.models import (
+    Course, Instructor, Category, Enrollment, Section, Lesson, LessonProgress,
+    Order, Review, Discussion, Certificate
+)
+
+HOT_INDEXES = [
+    (Course, 'course_featured_idx'),
+    (Enrollment, 'enrollment_student_date_idx'),
+    (Lesson, 'lesson_section_order_idx'),
+    (LessonProgress, 'progress_student_viewed_idx'),
+    (LessonProgress, 'progress_student_done_idx'),
+    (Order, 'order_status_date_idx'),
+    (Review, 'review_course_date_idx'),
+    (Discussion, 'discussion_course_activity_idx'),
+    (Certificate, 'certificate_issued_idx'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    """Query shapes taken from views.py / admin_views.py"""
+    student = Enrollment.objects.values_list('student_id', flat=True).first() or 0
+    course = Course.objects.values_list('id', flat=True).first() or 0
+    section = Section.objects.values_list('id', flat=True).first() or 0
+
+    return [
+        ('home: featured courses',
+         Course.objects.filter(is_featured=True).select_related('instructor')[:6]),
+        ('dashboard: enrollments',
+         Enrollment.objects.filter(student_id=student).order_by('-enrolled_at')),
+        ('dashboard: recent progress',
+         LessonProgress.objects.filter(student_id=student).order_by('-last_viewed')[:5]),
+        ('dashboard: completed lessons',
+         LessonProgress.objects.filter(student_id=student, completed=True)),
+        ('admin: orders by status',
+         Order.objects.filter(status='pending').order_by('-created_at')[:20]),
+        ('course detail: reviews',
+         Review.objects.filter(course_id=course).order_by('-created_at')),
+        ('discussions: course threads',
+         Discussion.objects.filter(course_id=course).order_by('-is_pinned', '-last_activity_at', '-id')[:20]),
+        ('admin: recent certificates',
+         Certificate.objects.order_by('-issued_at')[:20]),
+        ('outline: section lessons',
+         Lesson.objects.filter(section_id=section).order_by('order')),
+    ]
+
+
+def find_problems(plan):
+    """Return plan lines that indicate full scans or sorts"""
+    problems = []
+    for line in plan.splitlines():
+        text = line.strip()
+        if 'Seq Scan' in text:
+            problems.append(text)
+        elif 'SCAN ' in text and 'USING' not in text and 'CONSTANT ROW' not in text:
+            problems.append(text)
+        elif 'USE TEMP B-TREE' in text:
+            problems.append(text)
+    return problems
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot query patterns and report sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Create this many synthetic students/courses first (rolled back afterwards)',
+        )
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help='Time each query with and without the hot-query indexes',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Executions per query when timing',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                    self.analyze()
+
+                self.explain_all()
+
+                if options['compare']:
+                    with_indexes = self.benchmark(options['repeat'])
+                    self.drop_hot_indexes()
+                    self.analyze()
+                    without_indexes = self.benchmark(options['repeat'])
+                    self.report_comparison(with_indexes, without_indexes)
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    def explain_all(self):
+        total_problems = 0
+        for name, queryset in hot_queries():
+            plan = queryset.explain()
+            problems = find_problems(plan)
+            total_problems += len(problems)
+            if problems:
+                self.stdout.write(self.style.WARNING(f'✗ {name}'))
+                for problem in problems:
+                    self.stdout.write(f'    {problem}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'✓ {name}'))
+
+        if total_problems:
+            self.stdout.write(self.style.WARNING(f'{total_problems} sequential scans/sorts found'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All hot queries are index-backed'))
+
+    def benchmark(self, repeat):
+        timings = {}
+        for name, queryset in hot_queries():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            timings[name] = (time.perf_counter() - start) / repeat * 1000
+        return timings
+
+    def report_comparison(self, with_indexes, without_indexes):
+        self.stdout.write('')
+        self.stdout.write(f"{'Query':<32}{'indexed':>12}{'no index':>12}{'speedup':>10}")
+        for name, indexed_ms in with_indexes.items():
+            plain_ms = without_indexes[name]
+            speedup = plain_ms / indexed_ms if indexed_ms else 0
+            self.stdout.write(f'{name:<32}{indexed_ms:>10.2f}ms{plain_ms:>10.2f}ms{speedup:>9.1f}x')
+
+    def drop_hot_indexes(self):
+        with connection.cursor() as cursor:
+            for model, index_name in HOT_INDEXES:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index_name)}')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def seed(self, count):
+        """Create a synthetic catalog shaped like production traffic"""
+        self.stdout.write(f'Seeding {count} students/courses...')
+        now = timezone.now()
+
+        instructor_user = User.objects.create_user('explain_seed_instructor')
+        instructor = Instructor.objects.create(user=instructor_user, full_name='Seed Instructor')
+        category = Category.objects.create(name='Seed Category', slug='explain-seed-category')
+
+        courses = Course.objects.bulk_create([
+            Course(
+                title=f'Seed Course {i}', slug=f'explain-seed-course-{i}', instructor=instructor,
+                category=category, price=Decimal('100.00'), is_featured=(i % 50 == 0),
+            )
+            for i in range(count)
+        ])
+        sections = Section.objects.bulk_create([
+            Section(course=course, title=f'Section {j}', order=j)
+            for course in courses for j in range(3)
+        ])
+        lessons = Lesson.objects.bulk_create([
+            Lesson(section=section, title=f'Lesson {k}', order=k, duration_minutes=10)
+            for section in sections for k in range(5)
+        ])
+        students = User.objects.bulk_create([
+            User(username=f'explain_seed_student_{i}') for i in range(count)
+        ])
+
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course=courses[(i + j) % count])
+            for i, student in enumerate(students) for j in range(3)
+        ], ignore_conflicts=True)
+        LessonProgress.objects.bulk_create([
+            LessonProgress(
+                student=student, lesson=lessons[(i * 7 + j) % len(lessons)],
+                completed=(j % 2 == 0), last_viewed=now,
+            )
+            for i, student in enumerate(students) for j in range(10)
+        ], ignore_conflicts=True)
+        Order.objects.bulk_create([
+            Order(
+                user=student, order_id=f'EXPLAIN-SEED-{i}', total_amount=Decimal('100.00'),
+                status=('completed', 'pending', 'failed')[i % 3],
+            )
+            for i, student in enumerate(students)
+        ])
+        Review.objects.bulk_create([
+            Review(course=courses[i % count], student=student, rating=(i % 5) + 1, title='Seed', comment='Seed')
+            for i, student in enumerate(students)
+        ], ignore_conflicts=True)
+        Discussion.objects.bulk_create([
+            Discussion(course=courses[i % count], author=student, title='Seed', content='Seed', is_pinned=(i % 20 == 0))
+            for i, student in enumerate(students)
+        ])
+        Certificate.objects.bulk_create([
+            Certificate(student=student, course=courses[i % count], certificate_id=f'EXPLAIN-SEED-{i}')
+            for i, student in enumerate(students)
+        ], ignore_conflicts=True)
@@ -0,0 +1,23 @@
+"""
+Flush coalesced lesson views from the cache to LessonProgress.last_viewed
+Usage: python manage.py flush_lesson_views  (run every few minutes from cron)
+"""
+from django.core.management.base import BaseCommand
+
+from courses.progress import flush_lesson_views
+
+
+class Command(BaseCommand):
+    help = 'Write cached lesson views to LessonProgress.last_viewed in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of queued views to upsert per query',
+        )
+
+    def handle(self, *args, **options):
+        written = flush_lesson_views(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed {written} lesson views'))
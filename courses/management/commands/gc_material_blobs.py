@@ -0,0 +1,32 @@
+"""
+Delete material blobs that no course material references any more
+Usage: python manage.py gc_material_blobs [--grace-hours 24] [--recount]  (run daily from cron)
+"""
+from django.core.management.base import BaseCommand
+
+from courses.blobs import collect_unused_blobs
+from courses.models import MaterialBlob
+
+
+class Command(BaseCommand):
+    help = 'Delete unreferenced material blobs and their files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='Only delete blobs unused for at least this many hours',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recount every blob\'s references before collecting',
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            corrected = MaterialBlob.refresh_ref_counts()
+            self.stdout.write(f'Corrected {corrected} reference counts')
+        deleted = collect_unused_blobs(options['grace_hours'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unused blobs'))
@@ -0,0 +1,48 @@
+"""
+Generate responsive derivatives for images that do not have current ones
+(uploads from before the image pipeline, or ones whose background job failed)
+Usage: python manage.py generate_image_derivatives [--workers 4]
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from courses.images import pending_images, process_image
+
+
+def _process(model_label, pk, field_name):
+    try:
+        return process_image(model_label, pk, field_name)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Resize pending course, instructor and profile images to WebP/AVIF/JPEG derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of images to process in parallel',
+        )
+
+    def handle(self, *args, **options):
+        jobs = list(pending_images())
+        self.stdout.write(f'{len(jobs)} images pending')
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(_process, *job): job for job in jobs}
+            for future in as_completed(futures):
+                model_label, pk, field_name = futures[future]
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'✗ {model_label} {pk}.{field_name}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {done} images ({failed} failed)'))
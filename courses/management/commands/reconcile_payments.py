@@ -0,0 +1,49 @@
+"""
+Settle pending orders from Paystack's transaction list
+Usage: python manage.py reconcile_payments [--days 3] [--fail-after-hours 24] [--concurrency 4] [--no-email]  (run nightly from cron)
+"""
+import asyncio
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from courses.paystack import PaystackError
+from courses.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Fulfil or fail orders according to the transactions Paystack recorded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3, help='How far back to list transactions')
+        parser.add_argument(
+            '--fail-after-hours',
+            type=int,
+            default=24,
+            help='Only fail pending orders at least this old whose payment failed or was abandoned',
+        )
+        parser.add_argument('--per-page', type=int, default=100, help='Transactions per Paystack page')
+        parser.add_argument('--concurrency', type=int, default=4, help='Pages fetched at once')
+        parser.add_argument('--no-email', action='store_true', help='Don\'t email buyers whose orders are fulfilled')
+
+    def handle(self, *args, **options):
+        end = timezone.now()
+        try:
+            result = asyncio.run(reconcile(
+                start=end - timedelta(days=options['days']),
+                end=end,
+                per_page=options['per_page'],
+                concurrency=options['concurrency'],
+                fail_after=timedelta(hours=options['fail_after_hours']),
+                send_emails=not options['no_email'],
+            ))
+        except PaystackError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'Checked {result.transactions} transactions, {result.matched} unsettled orders')
+        for order_id in result.mismatched:
+            self.stdout.write(self.style.WARNING(f'{order_id}: paid amount or currency does not match the order'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Fulfilled {len(result.fulfilled)} orders, failed {result.failed}'
+        ))
@@ -0,0 +1,48 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponsePermanentRedirect
+from django.urls import reverse
+
+from .slugs import resolve_course_slug
+
+COURSE_SLUG_KWARGS = ('slug', 'course_slug')
+
+
+class CourseSlugRedirectMiddleware:
+    """Permanently redirect course URLs that use a previous slug of the course"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is None or match.namespace != 'courses':
+            return None
+
+        for name in COURSE_SLUG_KWARGS:
+            slug = view_kwargs.get(name)
+            if slug:
+                break
+        else:
+            return None
+
+        header = resolve_course_slug(slug)
+        if header is None or header.slug == slug:
+            return None
+
+        url = reverse(match.view_name, args=view_args, kwargs={**view_kwargs, name: header.slug})
+        if request.META.get('QUERY_STRING'):
+            url = f"{url}?{request.META['QUERY_STRING']}"
+        return HttpResponsePermanentRedirect(url)
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_alter_course_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonprogress',
+            name='watched_seconds',
+            field=models.PositiveIntegerField(default=0, help_text='Total video watch time in seconds'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_lessonprogress_watched_seconds'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lessonprogress',
+            name='last_viewed',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Flushed periodically from the view cache'),
+        ),
+    ]
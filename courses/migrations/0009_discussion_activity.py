@@ -0,0 +1,70 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def backfill_discussion_activity(apps, schema_editor):
+    Discussion = apps.get_model('courses', 'Discussion')
+    DiscussionReply = apps.get_model('courses', 'DiscussionReply')
+    latest = DiscussionReply.objects.filter(discussion=OuterRef('pk')).order_by('-created_at', '-id')
+    discussions = Discussion.objects.annotate(
+        replies_total=Count('replies'),
+        latest_reply_at=Subquery(latest.values('created_at')[:1]),
+        latest_reply_author=Subquery(latest.values('author_id')[:1]),
+    )
+    updated = []
+    for discussion in discussions.iterator():
+        discussion.reply_count = discussion.replies_total
+        discussion.last_reply_at = discussion.latest_reply_at
+        discussion.last_reply_author_id = discussion.latest_reply_author
+        discussion.last_activity_at = discussion.latest_reply_at or discussion.created_at
+        updated.append(discussion)
+    Discussion.objects.bulk_update(
+        updated, ['reply_count', 'last_reply_at', 'last_reply_author', 'last_activity_at'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0008_courseratingsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discussion',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_reply_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_reply_author',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Latest of creation and last reply, used for ordering'),
+        ),
+        migrations.AlterModelOptions(
+            name='discussion',
+            options={'ordering': ['-is_pinned', '-last_activity_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='discussion',
+            name='discussion_course_pin_idx',
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['course', '-is_pinned', '-last_activity_at', '-id'], name='discussion_course_activity_idx'),
+        ),
+        migrations.RunPython(backfill_discussion_activity, migrations.RunPython.noop),
+    ]
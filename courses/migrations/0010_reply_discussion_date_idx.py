@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_discussion_activity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discussionreply',
+            index=models.Index(fields=['discussion', 'created_at', 'id'], name='reply_discussion_date_idx'),
+        ),
+    ]
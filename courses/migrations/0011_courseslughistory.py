@@ -0,0 +1,24 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_reply_discussion_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSlugHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_slug', models.SlugField(max_length=500, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='old_slugs', to='courses.course')),
+            ],
+            options={
+                'verbose_name_plural': 'Course Slug History',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_materialupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Number of materials using this file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Last time a material was pointed at this file')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'last_used_at'], name='blob_unused_idx')],
+            },
+        ),
+        migrations.AlterField(
+            model_name='coursematerial',
+            name='file',
+            field=models.FileField(max_length=255, upload_to='course_materials/'),
+        ),
+        migrations.AddField(
+            model_name='coursematerial',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='materials', to='courses.materialblob'),
+        ),
+        migrations.AddField(
+            model_name='coursematerial',
+            name='original_filename',
+            field=models.CharField(blank=True, help_text='Name the file was uploaded with', max_length=255),
+        ),
+    ]
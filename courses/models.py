@@ -1,4 +1,8 @@
+import os
+import uuid
+
 from django.db import models
+from django.db.models import Count, F, Q, Sum
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -8,6 +12,7 @@ class UserProfile(models.Model):
     phone_number = models.CharField(max_length=20, blank=True)
     bio = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     date_of_birth = models.DateField(null=True, blank=True)
     country = models.CharField(max_length=100, default='Ghana')
     city = models.CharField(max_length=100, blank=True)
@@ -22,6 +27,7 @@ class Instructor(models.Model):
     full_name = models.CharField(max_length=200)
     bio = models.TextField(blank=True)
     profile_image = models.ImageField(upload_to='instructors/', blank=True, null=True)
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.full_name
@@ -52,6 +58,7 @@ class Course(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=10, default='₵')
     image = models.ImageField(upload_to='courses/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_featured = models.BooleanField(default=False)
     what_you_will_learn = models.JSONField(default=list, blank=True, help_text="List of learning outcomes")
     requirements = models.JSONField(default=list, blank=True, help_text="List of course requirements")
@@ -59,24 +66,46 @@ class Course(models.Model):
     tags = models.JSONField(default=list, blank=True, help_text="List of course tags")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_featured'], name='course_featured_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def get_rating_summary(self):
+        """Get the precomputed rating histogram, building it on first use"""
+        try:
+            return self.rating_summary
+        except CourseRatingSummary.DoesNotExist:
+            return CourseRatingSummary.refresh(self.id)
+
     def get_average_rating(self):
         """Calculate average rating"""
-        from django.db.models import Avg
-        avg = self.reviews.aggregate(Avg('rating'))['rating__avg']
-        return round(avg, 1) if avg else 0
+        return self.get_rating_summary().average
 
     def get_rating_count(self):
         """Get total number of ratings"""
-        return self.reviews.count()
+        return self.get_rating_summary().rating_count
 
     def get_enrollment_count(self):
         """Get number of enrolled students"""
         return self.enrollments.count()
 
+class CourseSlugHistory(models.Model):
+    """Previous slugs of a course, so old URLs redirect to the current one"""
+    old_slug = models.SlugField(max_length=500, unique=True)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='old_slugs')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Course Slug History"
+
+    def __str__(self):
+        return f"{self.old_slug} -> {self.course_id}"
+
 class Enrollment(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollments')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
@@ -87,6 +116,9 @@ class Enrollment(models.Model):
 
     class Meta:
         unique_together = ['student', 'course']
+        indexes = [
+            models.Index(fields=['student', '-enrolled_at'], name='enrollment_student_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.username} - {self.course.title}"
@@ -159,6 +191,9 @@ class Lesson(models.Model):
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['section', 'order'], name='lesson_section_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.section.course.title} - {self.title}"
@@ -173,27 +208,115 @@ class Lesson(models.Model):
             return f"https://www.youtube.com/embed/{video_id}"
         return self.video_url
 
+class MaterialBlob(models.Model):
+    """A stored material file, shared by every CourseMaterial with the same content"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0, help_text="Number of materials using this file")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, help_text="Last time a material was pointed at this file")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'last_used_at'], name='blob_unused_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+    @classmethod
+    def adjust_refs(cls, old_blob_id=None, new_blob_id=None):
+        """Move one reference from a blob to another"""
+        if old_blob_id == new_blob_id:
+            return
+        if new_blob_id:
+            cls.objects.filter(pk=new_blob_id).update(ref_count=F('ref_count') + 1, last_used_at=timezone.now())
+        if old_blob_id:
+            cls.objects.filter(pk=old_blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    @classmethod
+    def refresh_ref_counts(cls):
+        """Recount every blob's references from CourseMaterial"""
+        counts = dict(
+            CourseMaterial.objects.filter(blob__isnull=False).values_list('blob').annotate(count=Count('id'))
+        )
+        changed = []
+        for blob in cls.objects.only('id', 'ref_count').iterator():
+            count = counts.get(blob.id, 0)
+            if blob.ref_count != count:
+                blob.ref_count = count
+                changed.append(blob)
+        cls.objects.bulk_update(changed, ['ref_count'], batch_size=500)
+        return len(changed)
+
 class CourseMaterial(models.Model):
     """Downloadable course materials"""
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='materials')
     title = models.CharField(max_length=200)
-    file = models.FileField(upload_to='course_materials/')
+    file = models.FileField(upload_to='course_materials/', max_length=255)
+    blob = models.ForeignKey(MaterialBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='materials')
+    original_filename = models.CharField(max_length=255, blank=True, help_text="Name the file was uploaded with")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title
 
+    @property
+    def download_filename(self):
+        return self.original_filename or os.path.basename(self.file.name)
+
+class MaterialUpload(models.Model):
+    """A resumable, chunked upload that becomes a CourseMaterial once complete"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='material_uploads')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='material_uploads')
+    title = models.CharField(max_length=200)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0, help_text="Bytes received in order so far (the resume offset)")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Checksum of the whole file, if the client sent one")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    material = models.ForeignKey(CourseMaterial, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
 class LessonProgress(models.Model):
     """Track student progress through lessons"""
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
-    last_viewed = models.DateTimeField(auto_now=True)
+    watched_seconds = models.PositiveIntegerField(default=0, help_text="Total video watch time in seconds")
+    last_viewed = models.DateTimeField(default=timezone.now, help_text="Flushed periodically from the view cache")
 
     class Meta:
         unique_together = ['student', 'lesson']
         verbose_name_plural = "Lesson Progress"
+        indexes = [
+            models.Index(fields=['student', '-last_viewed'], name='progress_student_viewed_idx'),
+            models.Index(fields=['student', 'completed'], name='progress_student_done_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.username} - {self.lesson.title}"
@@ -246,6 +369,11 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at'], name='order_status_date_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.order_id} - {self.user.username}"
 
@@ -279,10 +407,79 @@ class Review(models.Model):
     class Meta:
         unique_together = ['course', 'student']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['course', '-created_at'], name='review_course_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.username} - {self.course.title} ({self.rating} stars)"
 
+class CourseRatingSummary(models.Model):
+    """Per-course rating histogram, maintained incrementally on Review save/delete"""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Course Rating Summaries"
+
+    def __str__(self):
+        return f"{self.course_id}: {self.average} ({self.rating_count} ratings)"
+
+    @property
+    def average(self):
+        if not self.rating_count:
+            return 0
+        return round(self.rating_sum / self.rating_count, 1)
+
+    @property
+    def histogram(self):
+        """Buckets from 5 stars down to 1 with counts and percentages"""
+        buckets = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}')
+            percent = round(count / self.rating_count * 100) if self.rating_count else 0
+            buckets.append({'stars': stars, 'count': count, 'percent': percent})
+        return buckets
+
+    @classmethod
+    def refresh(cls, course_id):
+        """Recompute the summary for a course from its reviews"""
+        totals = Review.objects.filter(course_id=course_id).aggregate(
+            rating_count=Count('id'),
+            rating_sum=Sum('rating'),
+            **{f'rating_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)}
+        )
+        totals['rating_sum'] = totals['rating_sum'] or 0
+        summary, created = cls.objects.update_or_create(course_id=course_id, defaults=totals)
+        return summary
+
+    @classmethod
+    def apply_change(cls, course_id, old_rating=None, new_rating=None):
+        """Apply a single review insert/update/delete to the histogram"""
+        if old_rating == new_rating:
+            return
+        changes = {
+            'rating_count': F('rating_count') + (1 if new_rating else 0) - (1 if old_rating else 0),
+            'rating_sum': F('rating_sum') + (new_rating or 0) - (old_rating or 0),
+        }
+        if old_rating:
+            changes[f'rating_{old_rating}'] = F(f'rating_{old_rating}') - 1
+        if new_rating:
+            changes[f'rating_{new_rating}'] = F(f'rating_{new_rating}') + 1
+
+        updated = cls.objects.filter(course_id=course_id).update(**changes)
+        if not updated and new_rating:
+            # No summary yet: build it from the reviews (which already include this change).
+            # Deletes are skipped so a cascading course delete never recreates it.
+            cls.refresh(course_id)
+
 class Discussion(models.Model):
     """Course discussion threads"""
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='discussions')
@@ -291,17 +488,54 @@ class Discussion(models.Model):
     content = models.TextField()
     is_pinned = models.BooleanField(default=False)
     is_resolved = models.BooleanField(default=False)
+    reply_count = models.PositiveIntegerField(default=0)
+    last_reply_at = models.DateTimeField(null=True, blank=True)
+    last_reply_author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now, help_text="Latest of creation and last reply, used for ordering")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-is_pinned', '-created_at']
+        ordering = ['-is_pinned', '-last_activity_at', '-id']
+        indexes = [
+            models.Index(fields=['course', '-is_pinned', '-last_activity_at', '-id'], name='discussion_course_activity_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
     def get_reply_count(self):
-        return self.replies.count()
+        return self.reply_count
+
+    @classmethod
+    def reply_added(cls, reply):
+        """Count a new reply and make it the thread's last activity"""
+        cls.objects.filter(pk=reply.discussion_id).update(
+            reply_count=F('reply_count') + 1,
+            last_reply_at=reply.created_at,
+            last_reply_author_id=reply.author_id,
+            last_activity_at=reply.created_at,
+        )
+
+    @classmethod
+    def reply_removed(cls, reply):
+        """Uncount a deleted reply, falling back to the previous reply as last activity"""
+        cls.objects.filter(pk=reply.discussion_id, reply_count__gt=0).update(reply_count=F('reply_count') - 1)
+        latest = DiscussionReply.objects.filter(discussion_id=reply.discussion_id).order_by(
+            '-created_at', '-id'
+        ).values('created_at', 'author_id').first()
+        if latest:
+            cls.objects.filter(pk=reply.discussion_id).update(
+                last_reply_at=latest['created_at'],
+                last_reply_author_id=latest['author_id'],
+                last_activity_at=latest['created_at'],
+            )
+        else:
+            cls.objects.filter(pk=reply.discussion_id).update(
+                last_reply_at=None,
+                last_reply_author_id=None,
+                last_activity_at=F('created_at'),
+            )
 
 class DiscussionReply(models.Model):
     """Replies to discussion threads"""
@@ -315,6 +549,9 @@ class DiscussionReply(models.Model):
     class Meta:
         ordering = ['created_at']
         verbose_name_plural = "Discussion Replies"
+        indexes = [
+            models.Index(fields=['discussion', 'created_at', 'id'], name='reply_discussion_date_idx'),
+        ]
 
     def __str__(self):
         return f"Reply by {self.author.username} on {self.discussion.title}"
@@ -329,6 +566,9 @@ class Certificate(models.Model):
 
     class Meta:
         unique_together = ['student', 'course']
+        indexes = [
+            models.Index(fields=['-issued_at'], name='certificate_issued_idx'),
+        ]
 
     def __str__(self):
         return f"Certificate: {self.student.username} - {self.course.title}"
@@ -340,4 +580,4 @@ class Certificate(models.Model):
         from datetime import datetime
         timestamp = datetime.now().strftime('%Y%m')
         unique_id = str(uuid.uuid4())[:8].upper()
-        return f"CERT-{timestamp}-{unique_id}"
\ No newline at end of file
+        return f"CERT-{timestamp}-{unique_id}"
@@ -0,0 +1,157 @@
+"""
+Course outline service.
+
+Loads the full section -> lesson tree of a course (with material counts) in
+two queries and caches it per course outline version. Every content page
+(course detail, course content, lesson view, admin course detail) reuses the
+same immutable structure instead of building its own prefetch.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .caching import get_version, bump_version
+from .models import Section, Lesson
+
+OUTLINE_VERSION_NAMESPACE = 'course_outline'
+OUTLINE_CACHE_TIMEOUT = 60 * 60 * 24
+
+_invalidation_suppressed = ContextVar('outline_invalidation_suppressed', default=False)
+
+
+@dataclass(frozen=True)
+class OutlineLesson:
+    id: int
+    section_id: int
+    title: str
+    content_type: str
+    duration_minutes: int
+    order: int
+    is_preview: bool
+    material_count: int
+
+
+@dataclass(frozen=True)
+class OutlineSection:
+    id: int
+    title: str
+    description: str
+    order: int
+    lessons: tuple
+    lesson_count: int
+    total_minutes: int
+
+
+@dataclass(frozen=True)
+class CourseOutline:
+    course_id: int
+    sections: tuple
+    lesson_ids: tuple
+    lesson_count: int
+    total_minutes: int
+    _lessons: dict = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def total_hours(self):
+        return round(self.total_minutes / 60, 1)
+
+    def get_lesson(self, lesson_id):
+        """Get the outline entry for a lesson, or None if not in this course"""
+        return self._lessons.get(lesson_id)
+
+    def index_of(self, lesson_id):
+        """Position of a lesson in course order"""
+        return self.lesson_ids.index(lesson_id)
+
+    def next_lesson(self, lesson_id):
+        index = self.index_of(lesson_id) + 1
+        if index < len(self.lesson_ids):
+            return self._lessons[self.lesson_ids[index]]
+        return None
+
+    def previous_lesson(self, lesson_id):
+        index = self.index_of(lesson_id) - 1
+        if index >= 0:
+            return self._lessons[self.lesson_ids[index]]
+        return None
+
+
+def outline_cache_key(course_id):
+    version = get_version(OUTLINE_VERSION_NAMESPACE, course_id)
+    return f"course_outline:{course_id}:{version}"
+
+
+def invalidate_course_outline(course_id):
+    """Invalidate the cached outline after sections/lessons/materials change"""
+    bump_version(OUTLINE_VERSION_NAMESPACE, course_id)
+
+
+def outline_invalidation_suppressed():
+    return _invalidation_suppressed.get()
+
+
+@contextmanager
+def suppress_outline_invalidation():
+    """
+    Skip per-row signal invalidation during bulk edits. The caller is
+    responsible for calling invalidate_course_outline once afterwards.
+    """
+    token = _invalidation_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _invalidation_suppressed.reset(token)
+
+
+def build_course_outline(course_id):
+    """Build the outline from the database (two queries)"""
+    section_rows = Section.objects.filter(course_id=course_id).order_by('order', 'id').values(
+        'id', 'title', 'description', 'order'
+    )
+    lesson_rows = Lesson.objects.filter(section__course_id=course_id).annotate(
+        material_count=Count('materials')
+    ).order_by('order', 'id').values(
+        'id', 'section_id', 'title', 'content_type', 'duration_minutes',
+        'order', 'is_preview', 'material_count'
+    )
+
+    lessons_by_section = {}
+    for row in lesson_rows:
+        lessons_by_section.setdefault(row['section_id'], []).append(OutlineLesson(**row))
+
+    sections = []
+    lessons = {}
+    for row in section_rows:
+        section_lessons = tuple(lessons_by_section.get(row['id'], ()))
+        for lesson in section_lessons:
+            lessons[lesson.id] = lesson
+        sections.append(OutlineSection(
+            lessons=section_lessons,
+            lesson_count=len(section_lessons),
+            total_minutes=sum(lesson.duration_minutes for lesson in section_lessons),
+            **row
+        ))
+
+    lesson_ids = tuple(lesson.id for section in sections for lesson in section.lessons)
+    return CourseOutline(
+        course_id=course_id,
+        sections=tuple(sections),
+        lesson_ids=lesson_ids,
+        lesson_count=len(lesson_ids),
+        total_minutes=sum(section.total_minutes for section in sections),
+        _lessons=lessons,
+    )
+
+
+def get_course_outline(course):
+    """Get the cached outline for a course (accepts a Course or its id)"""
+    course_id = getattr(course, 'pk', course)
+    key = outline_cache_key(course_id)
+    outline = cache.get(key)
+    if outline is None:
+        outline = build_course_outline(course_id)
+        cache.set(key, outline, OUTLINE_CACHE_TIMEOUT)
+    return outline
@@ -0,0 +1,47 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Listings are paged by the values of their sort key instead of OFFSET, so
+every page costs one index range scan. The cursor is the sort key of the
+last row of the previous page, packed into an opaque urlsafe token.
+"""
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(*values):
+    """Pack sort key values (datetimes, ints, bools) into a cursor"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """Unpack a cursor, converting each value with the matching type"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise InvalidCursor('Invalid cursor')
+        return [
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, values)
+        ]
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def slice_page(rows, limit, cursor_for):
+    """
+    Split a list fetched with limit + 1 rows into (page, next_cursor);
+    next_cursor is None on the last page.
+    """
+    rows = list(rows)
+    if len(rows) > limit:
+        page = rows[:limit]
+        return page, cursor_for(page[-1])
+    return rows, None
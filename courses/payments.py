@@ -0,0 +1,128 @@
+"""
+Order creation and fulfilment.
+
+Both the Paystack callback (payment_verify) and the webhook can report the
+same payment, often at the same moment, so fulfilment is idempotent: the
+order is flipped to completed with a conditional UPDATE and only the request
+that wins enrolls the buyer and gets the order back to send the
+confirmation email for. These are plain sync functions; async views call
+them through sync_to_async so each runs in one transaction, and send the
+email off the shared sync thread.
+
+fulfil_orders and fail_orders do the same for a batch of orders in a fixed
+number of queries, for reconciliation.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from .access import invalidate_enrollments
+from .caching import bump_catalog_version
+from .models import Cart, Enrollment, Order, OrderItem
+
+
+def create_order_from_cart(user):
+    """A pending order for everything in the user's cart, or None if it's empty"""
+    cart = Cart.objects.filter(user=user).first()
+    if cart is None:
+        return None
+    courses = [item.course for item in cart.items.select_related('course')]
+    if not courses:
+        return None
+
+    with transaction.atomic():
+        order = Order(user=user, currency='GHS', status='pending')
+        order.order_id = order.generate_order_id()
+        order.total_amount = sum(course.price for course in courses)
+        order.save()
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, course=course, price=course.price) for course in courses]
+        )
+    return order
+
+
+def fulfil_order(order_pk, payment_reference, payment_method):
+    """
+    Mark an order paid, enroll the buyer and clear their cart. Returns the order
+    (with its user and courses loaded for send_enrollment_email), or None if it
+    had already been fulfilled.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order_pk).exclude(status='completed').update(
+            status='completed',
+            payment_reference=str(payment_reference),
+            payment_method=payment_method or '',
+            completed_at=now,
+            updated_at=now,
+        )
+        if not updated:
+            return None
+
+        order = Order.objects.select_related('user').prefetch_related('items__course').get(pk=order_pk)
+        for item in order.items.all():
+            Enrollment.objects.get_or_create(student_id=order.user_id, course_id=item.course_id)
+        Cart.objects.filter(user_id=order.user_id).delete()
+    return order
+
+
+def fulfil_orders(payments):
+    """
+    Fulfil a batch of orders from (order_pk, payment_reference, payment_method)
+    tuples. Returns the orders this call fulfilled, loaded like fulfil_order's;
+    ones already completed are skipped.
+    """
+    payments = {order_pk: (str(reference), method or '') for order_pk, reference, method in payments}
+    if not payments:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic():
+        pks = list(
+            Order.objects.select_for_update().filter(pk__in=payments).exclude(status='completed')
+            .values_list('pk', flat=True)
+        )
+        if not pks:
+            return []
+
+        Order.objects.filter(pk__in=pks).update(
+            status='completed',
+            payment_reference=Case(
+                *[When(pk=pk, then=Value(payments[pk][0])) for pk in pks], output_field=CharField()
+            ),
+            payment_method=Case(
+                *[When(pk=pk, then=Value(payments[pk][1])) for pk in pks], output_field=CharField()
+            ),
+            completed_at=now,
+            updated_at=now,
+        )
+        orders = list(Order.objects.select_related('user').prefetch_related('items__course').filter(pk__in=pks))
+        Enrollment.objects.bulk_create(
+            [
+                Enrollment(student_id=order.user_id, course_id=item.course_id)
+                for order in orders for item in order.items.all()
+            ],
+            ignore_conflicts=True,
+        )
+        user_ids = {order.user_id for order in orders}
+        Cart.objects.filter(user_id__in=user_ids).delete()
+
+        # bulk_create skips the Enrollment signals, so invalidate by hand
+        for user_id in user_ids:
+            transaction.on_commit(partial(invalidate_enrollments, user_id))
+        transaction.on_commit(bump_catalog_version)
+    return orders
+
+
+def fail_order(order_pk):
+    """Mark a pending order failed (a completed one is left alone)"""
+    return Order.objects.filter(pk=order_pk, status='pending').update(status='failed', updated_at=timezone.now())
+
+
+def fail_orders(order_pks):
+    """Mark a batch of pending orders failed; returns how many were"""
+    if not order_pks:
+        return 0
+    return Order.objects.filter(pk__in=order_pks, status='pending').update(status='failed', updated_at=timezone.now())
@@ -0,0 +1,104 @@
+"""
+Paystack API client.
+
+Requests go through httpx's AsyncClient, so async views wait on Paystack
+without holding a worker thread. One client (and its keep-alive connection
+pool) is kept per event loop: under an ASGI server that is one per worker
+process, under WSGI each request's loop gets its own.
+"""
+import asyncio
+import hashlib
+import hmac
+import weakref
+from decimal import Decimal
+from urllib.parse import quote
+
+import httpx
+from django.conf import settings
+
+PAYSTACK_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class PaystackError(Exception):
+    pass
+
+
+def _client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=settings.PAYSTACK_API_URL,
+            headers={'Authorization': f'Bearer {settings.PAYSTACK_SECRET_KEY}'},
+            timeout=PAYSTACK_TIMEOUT,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def _request(method, path, **kwargs):
+    try:
+        response = await _client().request(method, path, **kwargs)
+        payload = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise PaystackError(f'Paystack request failed: {e}') from e
+    if not payload.get('status'):
+        raise PaystackError(payload.get('message') or f'Paystack returned HTTP {response.status_code}')
+    return payload
+
+
+def to_subunits(amount):
+    """Paystack amounts are in the currency's subunit (GHS * 100 = pesewas)"""
+    return int(Decimal(amount) * 100)
+
+
+async def initialize_transaction(email, amount, reference, callback_url):
+    payload = await _request('POST', '/transaction/initialize', json={
+        'email': email,
+        'amount': to_subunits(amount),
+        'reference': reference,
+        'callback_url': callback_url,
+    })
+    return payload['data']
+
+
+async def verify_transaction(reference):
+    payload = await _request('GET', f'/transaction/verify/{quote(reference, safe="")}')
+    return payload['data']
+
+
+async def list_transactions(page=1, per_page=100, start=None, end=None):
+    """One page of transactions (newest first) and the listing's meta (total, pageCount, ...)"""
+    params = {'page': page, 'perPage': per_page}
+    if start is not None:
+        params['from'] = start.isoformat()
+    if end is not None:
+        params['to'] = end.isoformat()
+    payload = await _request('GET', '/transaction', params=params)
+    return payload['data'], payload.get('meta') or {}
+
+
+async def close_client():
+    """Close this event loop's client (for commands that run their own loop)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def valid_webhook_signature(body, signature):
+    """Paystack signs webhook bodies with HMAC-SHA512 of the secret key"""
+    if not settings.PAYSTACK_SECRET_KEY or not signature:
+        return False
+    expected = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def is_successful_charge(data, order):
+    """A charge pays for an order if it succeeded for the order's full amount"""
+    return (
+        data.get('status') == 'success'
+        and data.get('amount') == to_subunits(order.total_amount)
+        and (data.get('currency') or order.currency) == order.currency
+    )
@@ -0,0 +1,357 @@
+"""
+Per-(student, course) lesson completion state.
+
+Completion is kept as a bitset over the course outline's ordered lesson ids,
+together with the last viewed lesson. One cache fetch gives the sidebar
+checkmarks, the "next incomplete lesson" and the resume position; on a miss
+it is rebuilt from LessonProgress with a single query.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .caching import get_version
+from .models import Enrollment, Lesson, LessonProgress
+from .outline import OUTLINE_VERSION_NAMESPACE, get_course_outline
+
+PROGRESS_CACHE_TIMEOUT = 60 * 60 * 24
+
+PROGRESS_EVENT_TYPES = ('viewed', 'watched', 'completed')
+MAX_PROGRESS_EVENTS = 500
+MAX_WATCHED_SECONDS_PER_EVENT = 60 * 60
+# Largest BigAutoField id, and largest PositiveIntegerField on Postgres
+MAX_LESSON_ID = 2 ** 63 - 1
+MAX_SECONDS = 2 ** 31 - 1
+
+
+class ProgressBitmap:
+    """Completion bitset for one student over one course outline"""
+
+    def __init__(self, lesson_ids, bits=0, last_viewed_lesson_id=None):
+        self.lesson_ids = lesson_ids
+        self.bits = bits
+        self.last_viewed_lesson_id = last_viewed_lesson_id
+        self._positions = {lesson_id: index for index, lesson_id in enumerate(lesson_ids)}
+
+    def _mask(self, lesson_id):
+        index = self._positions.get(lesson_id)
+        return 0 if index is None else 1 << index
+
+    def is_completed(self, lesson_id):
+        mask = self._mask(lesson_id)
+        return bool(mask and self.bits & mask)
+
+    def mark_completed(self, lesson_id):
+        self.bits |= self._mask(lesson_id)
+
+    @property
+    def completed_ids(self):
+        return frozenset(
+            lesson_id for index, lesson_id in enumerate(self.lesson_ids)
+            if self.bits >> index & 1
+        )
+
+    @property
+    def completed_count(self):
+        return self.bits.bit_count()
+
+    @property
+    def percentage(self):
+        if not self.lesson_ids:
+            return 0
+        return int(self.completed_count / len(self.lesson_ids) * 100)
+
+    def next_incomplete(self, after_lesson_id=None):
+        """First incomplete lesson after the given one, wrapping to the start"""
+        start = self._positions.get(after_lesson_id, -1) + 1
+        order = list(range(start, len(self.lesson_ids))) + list(range(0, start))
+        for index in order:
+            if not self.bits >> index & 1:
+                return self.lesson_ids[index]
+        return None
+
+    @property
+    def resume_lesson_id(self):
+        """Lesson to send the student back to"""
+        if self.last_viewed_lesson_id in self._positions and not self.is_completed(self.last_viewed_lesson_id):
+            return self.last_viewed_lesson_id
+        return self.next_incomplete(self.last_viewed_lesson_id) or self.last_viewed_lesson_id
+
+
+def progress_cache_key(student_id, course_id):
+    version = get_version(OUTLINE_VERSION_NAMESPACE, course_id)
+    return f"lesson_progress:{student_id}:{course_id}:{version}"
+
+
+def build_progress_bitmap(student_id, outline):
+    """Build the bitmap from LessonProgress (one query)"""
+    bitmap = ProgressBitmap(outline.lesson_ids)
+    rows = LessonProgress.objects.filter(
+        student_id=student_id,
+        lesson_id__in=outline.lesson_ids,
+    ).order_by('last_viewed').values_list('lesson_id', 'completed')
+    for lesson_id, completed in rows:
+        if completed:
+            bitmap.mark_completed(lesson_id)
+        bitmap.last_viewed_lesson_id = lesson_id
+    return bitmap
+
+
+def _store(student_id, outline, bitmap):
+    cache.set(
+        progress_cache_key(student_id, outline.course_id),
+        (bitmap.bits, bitmap.last_viewed_lesson_id),
+        PROGRESS_CACHE_TIMEOUT
+    )
+
+
+def get_progress_bitmap(student, outline):
+    """Get the cached completion bitmap of a student for a course outline"""
+    student_id = getattr(student, 'pk', student)
+    cached = cache.get(progress_cache_key(student_id, outline.course_id))
+    if cached is not None:
+        bits, last_viewed_lesson_id = cached
+        return ProgressBitmap(outline.lesson_ids, bits, last_viewed_lesson_id)
+    bitmap = build_progress_bitmap(student_id, outline)
+    _store(student_id, outline, bitmap)
+    return bitmap
+
+
+def record_lesson_viewed(student, outline, lesson_id):
+    """Remember the resume position"""
+    bitmap = get_progress_bitmap(student, outline)
+    if bitmap.last_viewed_lesson_id != lesson_id:
+        bitmap.last_viewed_lesson_id = lesson_id
+        _store(getattr(student, 'pk', student), outline, bitmap)
+    return bitmap
+
+
+def record_lesson_completed(student, outline, lesson_id):
+    """Set the completion bit for a lesson"""
+    bitmap = get_progress_bitmap(student, outline)
+    bitmap.mark_completed(lesson_id)
+    bitmap.last_viewed_lesson_id = lesson_id
+    _store(getattr(student, 'pk', student), outline, bitmap)
+    return bitmap
+
+
+# ============================================================================
+# BATCH PROGRESS INGESTION
+# ============================================================================
+
+def coalesce_progress_events(events):
+    """Merge queued client events into one pending update per lesson"""
+    pending = {}
+    for event in events:
+        try:
+            lesson_id = int(event['lesson_id'])
+            event_type = event['type']
+            seconds = int(event.get('seconds', 0))
+        except (KeyError, TypeError, ValueError, OverflowError, AttributeError):
+            raise ValueError('Malformed progress event')
+        if not 0 < lesson_id <= MAX_LESSON_ID or abs(seconds) > MAX_SECONDS:
+            raise ValueError('Malformed progress event')
+        if event_type not in PROGRESS_EVENT_TYPES:
+            raise ValueError(f'Unknown progress event type: {event_type}')
+
+        update = pending.setdefault(lesson_id, {'watched_seconds': 0, 'completed': False, 'viewed': False})
+        if event_type == 'viewed':
+            update['viewed'] = True
+        elif event_type == 'watched':
+            update['watched_seconds'] += max(0, min(seconds, MAX_WATCHED_SECONDS_PER_EVENT))
+        elif event_type == 'completed':
+            update['completed'] = True
+    return pending
+
+
+def flush_progress_updates(student, pending):
+    """
+    Write pending per-lesson updates for lessons the student is enrolled in.
+    Only lessons with watched seconds or a completion touch the database:
+    missing rows are inserted, then updated with one UPDATE that adds the
+    watched seconds in the database, so concurrent batches for the same lesson
+    don't lose each other's time. Plain views are queued with
+    note_lesson_viewed like page views. Returns {course_id: [newly completed
+    lesson ids]}.
+    """
+    lesson_courses = dict(
+        Lesson.objects.filter(
+            id__in=pending,
+            section__course__enrollments__student=student
+        ).values_list('id', 'section__course_id')
+    )
+    changed = {}
+    for lesson_id, course_id in lesson_courses.items():
+        update = pending[lesson_id]
+        if update['watched_seconds'] or update['completed']:
+            changed[lesson_id] = course_id
+        elif update['viewed']:
+            note_lesson_viewed(student, lesson_id)
+    if not changed:
+        return {}
+
+    rows = LessonProgress.objects.filter(student=student, lesson_id__in=changed)
+    already_completed = set(rows.filter(completed=True).values_list('lesson_id', flat=True))
+    now = timezone.now()
+    LessonProgress.objects.bulk_create(
+        [LessonProgress(student=student, lesson_id=lesson_id, last_viewed=now) for lesson_id in changed],
+        ignore_conflicts=True,
+    )
+
+    watched = [
+        When(lesson_id=lesson_id, then=Value(pending[lesson_id]['watched_seconds']))
+        for lesson_id in changed if pending[lesson_id]['watched_seconds']
+    ]
+    completed = [lesson_id for lesson_id in changed if pending[lesson_id]['completed']]
+    changes = {'last_viewed': now}
+    if watched:
+        changes['watched_seconds'] = F('watched_seconds') + Case(*watched, default=Value(0))
+    if completed:
+        changes['completed'] = Case(When(lesson_id__in=completed, then=Value(True)), default=F('completed'))
+        changes['completed_at'] = Case(
+            When(lesson_id__in=completed, completed=False, then=Value(now)), default=F('completed_at')
+        )
+    rows.update(**changes)
+
+    newly_completed = {}
+    for lesson_id in completed:
+        if lesson_id not in already_completed:
+            newly_completed.setdefault(changed[lesson_id], []).append(lesson_id)
+    return newly_completed
+
+
+def ingest_progress_events(student, events):
+    """Apply a batch of client progress events"""
+    pending = coalesce_progress_events(events)
+    newly_completed = flush_progress_updates(student, pending)
+
+    for course_id, lesson_ids in newly_completed.items():
+        outline = get_course_outline(course_id)
+        for lesson_id in lesson_ids:
+            record_lesson_completed(student, outline, lesson_id)
+        enrollment = Enrollment.objects.filter(student=student, course_id=course_id).first()
+        if enrollment:
+            enrollment.calculate_progress()
+
+    return {
+        'lessons': len(pending),
+        'completed': sum(len(lesson_ids) for lesson_ids in newly_completed.values()),
+    }
+
+
+# ============================================================================
+# LAST VIEWED WRITE COALESCING
+# ============================================================================
+
+LESSON_VIEW_SEQ_KEY = 'lesson_viewed_seq'
+LESSON_VIEW_FLUSHED_SEQ_KEY = 'lesson_viewed_flushed_seq'
+LESSON_VIEW_FLUSH_LOCK_KEY = 'lesson_viewed_flush_lock'
+LESSON_VIEW_PENDING_TIMEOUT = 60 * 60 * 24
+# How long a sequence number with no entry is waited for before it is skipped
+LESSON_VIEW_GAP_SECONDS = 60
+
+
+def note_lesson_viewed(student, lesson_id):
+    """
+    Record a lesson view in the cache instead of the database. At most one
+    pending entry is queued per (student, lesson) every
+    LESSON_VIEW_COALESCE_SECONDS; flush_lesson_views writes them in bulk
+    (right away with LESSON_VIEW_FLUSH_IN_PROCESS, when no other process can
+    see this cache).
+    """
+    student_id = getattr(student, 'pk', student)
+    viewed_at = time.time()
+    if not cache.add(f"lesson_viewed:{student_id}:{lesson_id}", viewed_at, settings.LESSON_VIEW_COALESCE_SECONDS):
+        return False
+
+    cache.add(LESSON_VIEW_SEQ_KEY, 0, None)
+    seq = cache.incr(LESSON_VIEW_SEQ_KEY)
+    cache.set(f"lesson_viewed_pending:{seq}", (student_id, lesson_id, viewed_at), LESSON_VIEW_PENDING_TIMEOUT)
+    if settings.LESSON_VIEW_FLUSH_IN_PROCESS:
+        flush_lesson_views()
+    return True
+
+
+def _flushable_upper(keys, found):
+    """
+    Highest sequence number that can be flushed. A view takes its sequence
+    number before writing its entry, so a missing entry may still arrive: stop
+    before it until it has been missing for LESSON_VIEW_GAP_SECONDS (the
+    writer died, or the entry expired).
+    """
+    missing = [seq for seq, key in keys.items() if key not in found]
+    if not missing:
+        return max(keys)
+    gap_keys = {seq: f"lesson_viewed_gap:{seq}" for seq in missing}
+    first_seen = cache.get_many(gap_keys.values())
+    now = time.time()
+    cache.set_many(
+        {key: now for key in gap_keys.values() if key not in first_seen}, LESSON_VIEW_PENDING_TIMEOUT
+    )
+    for seq in missing:
+        if now - first_seen.get(gap_keys[seq], now) < LESSON_VIEW_GAP_SECONDS:
+            return seq - 1
+    return max(keys)
+
+
+def flush_lesson_views(batch_size=1000):
+    """Write queued lesson views to LessonProgress.last_viewed. Returns rows written."""
+    if not cache.add(LESSON_VIEW_FLUSH_LOCK_KEY, 1, 60 * 10):
+        return 0
+
+    try:
+        last_seq = cache.get(LESSON_VIEW_SEQ_KEY) or 0
+        flushed_seq = min(cache.get(LESSON_VIEW_FLUSHED_SEQ_KEY) or 0, last_seq)
+        written = 0
+
+        while flushed_seq < last_seq:
+            keys = {
+                seq: f"lesson_viewed_pending:{seq}"
+                for seq in range(flushed_seq + 1, min(flushed_seq + batch_size, last_seq) + 1)
+            }
+            found = cache.get_many(keys.values())
+            upper = _flushable_upper(keys, found)
+            if upper == flushed_seq:
+                break
+
+            views = {}
+            for seq in range(flushed_seq + 1, upper + 1):
+                if keys[seq] in found:
+                    student_id, lesson_id, viewed_at = found[keys[seq]]
+                    views[(student_id, lesson_id)] = max(viewed_at, views.get((student_id, lesson_id), 0))
+
+            existing_lessons = set(
+                Lesson.objects.filter(id__in={lesson_id for _, lesson_id in views}).values_list('id', flat=True)
+            )
+            rows = [
+                LessonProgress(
+                    student_id=student_id,
+                    lesson_id=lesson_id,
+                    last_viewed=datetime.fromtimestamp(viewed_at, tz=dt_timezone.utc),
+                )
+                for (student_id, lesson_id), viewed_at in views.items()
+                if lesson_id in existing_lessons
+            ]
+            if rows:
+                LessonProgress.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['student', 'lesson'],
+                    update_fields=['last_viewed'],
+                )
+            written += len(rows)
+
+            flushed = range(flushed_seq + 1, upper + 1)
+            cache.delete_many([keys[seq] for seq in flushed] + [f"lesson_viewed_gap:{seq}" for seq in flushed])
+            flushed_seq = upper
+            cache.set(LESSON_VIEW_FLUSHED_SEQ_KEY, flushed_seq, None)
+            if upper < max(keys):
+                break
+
+        return written
+    finally:
+        cache.delete(LESSON_VIEW_FLUSH_LOCK_KEY)
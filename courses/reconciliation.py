@@ -0,0 +1,141 @@
+"""
+Reconcile orders with Paystack's transaction list.
+
+Orders stay pending when the buyer never comes back from Paystack and the
+webhook is lost. reconcile() pages through the transactions Paystack recorded
+in a time window and settles the orders they refer to, a page at a time:
+
+* each page's orders are loaded with one IN query on Order.order_id;
+* successful charges for the full amount fulfil their orders (failed ones too,
+  since the buyer did pay) in one batch;
+* failed or abandoned transactions fail orders still pending after
+  `fail_after`, in one UPDATE;
+* successful charges for the wrong amount or currency are only counted, for
+  an admin to look at.
+
+Pages are fetched concurrently, at most `concurrency` at a time. The window is
+fixed when the run starts, so new payments don't shift the pages under it.
+Database work runs on the sync thread, one page after another.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.utils import timezone
+
+from . import paystack
+from .models import Order
+from .payments import fail_orders, fulfil_orders
+from .utils import send_enrollment_email
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = ('failed', 'abandoned', 'reversed')
+PAGE_ATTEMPTS = 3
+
+
+@dataclass
+class ReconciliationResult:
+    transactions: int = 0
+    matched: int = 0
+    fulfilled: list = field(default_factory=list)
+    failed: int = 0
+    mismatched: list = field(default_factory=list)
+
+    def add(self, other):
+        self.transactions += other.transactions
+        self.matched += other.matched
+        self.fulfilled += other.fulfilled
+        self.failed += other.failed
+        self.mismatched += other.mismatched
+
+
+def latest_by_reference(transactions):
+    """One transaction per reference, preferring a successful one"""
+    by_reference = {}
+    for data in transactions:
+        reference = data.get('reference')
+        if not reference:
+            continue
+        current = by_reference.get(reference)
+        if current is None or (data.get('status') == 'success' and current.get('status') != 'success'):
+            by_reference[reference] = data
+    return by_reference
+
+
+def reconcile_transactions(transactions, fail_before):
+    """Settle the orders one page of Paystack transactions refers to"""
+    by_reference = latest_by_reference(transactions)
+    result = ReconciliationResult(transactions=len(transactions))
+    orders = Order.objects.filter(order_id__in=by_reference).exclude(status__in=('completed', 'refunded')).only(
+        'pk', 'order_id', 'status', 'total_amount', 'currency', 'created_at'
+    )
+
+    payments = []
+    to_fail = []
+    for order in orders:
+        result.matched += 1
+        data = by_reference[order.order_id]
+        status = data.get('status')
+        if status == 'success':
+            if paystack.is_successful_charge(data, order):
+                payments.append((order.pk, data.get('id'), data.get('channel')))
+            else:
+                result.mismatched.append(order.order_id)
+        elif status in FAILED_STATUSES and order.status == 'pending' and order.created_at < fail_before:
+            to_fail.append(order.pk)
+
+    result.fulfilled = fulfil_orders(payments)
+    result.failed = fail_orders(to_fail)
+    return result
+
+
+async def _fetch_page(semaphore, page, per_page, start, end):
+    async with semaphore:
+        for attempt in range(1, PAGE_ATTEMPTS + 1):
+            try:
+                return await paystack.list_transactions(page, per_page, start, end)
+            except paystack.PaystackError:
+                if attempt == PAGE_ATTEMPTS:
+                    raise
+                logger.warning('Paystack transactions page %s failed, retrying', page)
+                await asyncio.sleep(2 ** attempt)
+
+
+async def _send_emails(orders, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    send = sync_to_async(send_enrollment_email, thread_sensitive=False)
+
+    async def send_one(order):
+        async with semaphore:
+            await send(order.user, order)
+
+    await asyncio.gather(*(send_one(order) for order in orders))
+
+
+async def reconcile(start, end=None, per_page=100, concurrency=4, fail_after=None, send_emails=True):
+    """Reconcile orders with the Paystack transactions between start and end (default now)"""
+    end = end or timezone.now()
+    fail_before = end - fail_after if fail_after is not None else end
+    semaphore = asyncio.Semaphore(concurrency)
+    settle = sync_to_async(reconcile_transactions)
+    result = ReconciliationResult()
+
+    try:
+        transactions, meta = await _fetch_page(semaphore, 1, per_page, start, end)
+        result.add(await settle(transactions, fail_before))
+
+        page_count = meta.get('pageCount') or 1
+        pages = [_fetch_page(semaphore, page, per_page, start, end) for page in range(2, page_count + 1)]
+        for next_page in asyncio.as_completed(pages):
+            transactions, _ = await next_page
+            result.add(await settle(transactions, fail_before))
+
+        if send_emails and result.fulfilled:
+            await _send_emails(result.fulfilled, concurrency)
+    finally:
+        await paystack.close_client()
+        await sync_to_async(connections.close_all)()
+    return result
@@ -0,0 +1,60 @@
+"""
+Course review pagination.
+
+Reviews are paged by keyset on (created_at, id) instead of OFFSET, so
+"load more" costs the same on the first page as on the hundredth and is
+served by the (course, -created_at) index.
+"""
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
+
+from .models import Review
+from .pagination import encode_cursor, decode_cursor, slice_page
+
+REVIEWS_PAGE_SIZE = 10
+MAX_REVIEWS_PAGE_SIZE = 50
+
+
+def review_cursor(review):
+    """Cursor pointing just after the given review"""
+    return encode_cursor(review.created_at, review.id)
+
+
+def get_review_page(course, cursor=None, limit=REVIEWS_PAGE_SIZE):
+    """
+    Get one page of a course's reviews, newest first.
+    Returns (reviews, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_REVIEWS_PAGE_SIZE))
+    reviews = Review.objects.filter(course=course).select_related('student').order_by('-created_at', '-id')
+    if cursor:
+        created_at, review_id = decode_cursor(cursor, datetime, int)
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=review_id))
+
+    # Fetch one extra row to know whether another page exists
+    return slice_page(reviews[:limit + 1], limit, review_cursor)
+
+
+def lazy_review_page(course, limit=REVIEWS_PAGE_SIZE):
+    """
+    First page as {'reviews', 'next_cursor'}, only queried when the template
+    actually renders it (i.e. on a review fragment cache miss)
+    """
+    def load():
+        reviews, next_cursor = get_review_page(course, limit=limit)
+        return {'reviews': reviews, 'next_cursor': next_cursor}
+    return SimpleLazyObject(load)
+
+
+def serialize_review(review):
+    """Review as returned by the load-more endpoint"""
+    return {
+        'id': review.id,
+        'student': review.student.get_full_name() or review.student.username,
+        'rating': review.rating,
+        'title': review.title,
+        'comment': review.comment,
+        'created_at': review.created_at.isoformat(),
+    }
@@ -0,0 +1,240 @@
+import os
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .access import invalidate_enrollments
+
+from .caching import bump_version, bump_catalog_version, REVIEW_VERSION_NAMESPACE
+from .models import (
+    UserProfile, Category, Course, Instructor, Enrollment, Order, OrderItem, Section, Lesson, CourseMaterial, MaterialBlob, Review,
+    CourseRatingSummary, Discussion, DiscussionReply
+)
+from .analytics import invalidate_sales
+from .blobs import store_blob, use_blob
+from .discussions import bump_reply_version
+from .images import IMAGE_FIELDS, delete_image_on_commit, needs_derivatives, enqueue_derivatives, variants_field
+from .outline import invalidate_course_outline, outline_invalidation_suppressed
+from .slugs import invalidate_course_slugs, record_slug_change
+
+
+def _course_id_for_section(section_id):
+    return Section.objects.filter(id=section_id).values_list('course_id', flat=True).first()
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def section_changed(sender, instance, **kwargs):
+    """Invalidate the course outline when a section changes"""
+    if outline_invalidation_suppressed():
+        return
+    invalidate_course_outline(instance.course_id)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def lesson_changed(sender, instance, **kwargs):
+    """Invalidate the course outline when a lesson changes"""
+    if outline_invalidation_suppressed():
+        return
+    course_id = _course_id_for_section(instance.section_id)
+    if course_id:
+        invalidate_course_outline(course_id)
+
+
+@receiver(post_save, sender=CourseMaterial)
+@receiver(post_delete, sender=CourseMaterial)
+def material_changed(sender, instance, **kwargs):
+    """Invalidate the course outline when material counts change"""
+    if outline_invalidation_suppressed():
+        return
+    course_id = Lesson.objects.filter(id=instance.lesson_id).values_list(
+        'section__course_id', flat=True
+    ).first()
+    if course_id:
+        invalidate_course_outline(course_id)
+
+
+@receiver(pre_save, sender=CourseMaterial)
+def material_about_to_change(sender, instance, **kwargs):
+    """Store a newly uploaded file as a shared blob and remember the previous blob"""
+    instance._previous_blob_id = None
+    if instance.pk:
+        instance._previous_blob_id = CourseMaterial.objects.filter(pk=instance.pk).values_list(
+            'blob_id', flat=True
+        ).first()
+    if instance.file and not instance.file._committed:
+        filename = os.path.basename(instance.file.name)
+        use_blob(instance, store_blob(instance.file.file, filename), filename)
+
+
+@receiver(post_save, sender=CourseMaterial)
+def material_saved(sender, instance, **kwargs):
+    MaterialBlob.adjust_refs(getattr(instance, '_previous_blob_id', None), instance.blob_id)
+    instance._previous_blob_id = instance.blob_id
+
+
+@receiver(post_delete, sender=CourseMaterial)
+def material_deleted(sender, instance, **kwargs):
+    MaterialBlob.adjust_refs(instance.blob_id, None)
+
+
+@receiver(pre_save, sender=Review)
+def review_about_to_change(sender, instance, **kwargs):
+    """Remember the stored rating so the histogram can be adjusted"""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    """Update the rating histogram and invalidate cached review fragments"""
+    old_rating = None if created else getattr(instance, '_previous_rating', None)
+    CourseRatingSummary.apply_change(instance.course_id, old_rating=old_rating, new_rating=instance.rating)
+    bump_version(REVIEW_VERSION_NAMESPACE, instance.course_id)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    """Update the rating histogram and invalidate cached review fragments"""
+    CourseRatingSummary.apply_change(instance.course_id, old_rating=instance.rating)
+    bump_version(REVIEW_VERSION_NAMESPACE, instance.course_id)
+
+
+@receiver(post_save, sender=DiscussionReply)
+def discussion_reply_saved(sender, instance, created, **kwargs):
+    """Update the thread's reply count and last activity"""
+    if created:
+        Discussion.reply_added(instance)
+        bump_reply_version(instance.discussion_id)
+
+
+@receiver(post_delete, sender=DiscussionReply)
+def discussion_reply_deleted(sender, instance, **kwargs):
+    """Update the thread's reply count and last activity"""
+    Discussion.reply_removed(instance)
+    bump_reply_version(instance.discussion_id)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, **kwargs):
+    """Refresh the student's cached enrolled course ids once the enrollment is committed"""
+    if created:
+        transaction.on_commit(lambda: invalidate_enrollments(instance.student_id))
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    """Refresh the student's cached enrolled course ids once the removal is committed"""
+    transaction.on_commit(lambda: invalidate_enrollments(instance.student_id))
+
+
+@receiver(pre_save, sender=Course)
+def course_about_to_change(sender, instance, **kwargs):
+    """Remember the stored slug so a rename can be recorded"""
+    instance._previous_slug = None
+    if instance.pk:
+        instance._previous_slug = Course.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    """Keep renamed slugs redirecting and refresh resolved slugs"""
+    previous_slug = getattr(instance, '_previous_slug', None)
+    if previous_slug and previous_slug != instance.slug:
+        record_slug_change(instance.pk, previous_slug, instance.slug)
+    transaction.on_commit(invalidate_course_slugs)
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Instructor)
+@receiver(post_delete, sender=Instructor)
+def course_header_changed(sender, instance, **kwargs):
+    """Refresh resolved slugs (they carry the instructor's name)"""
+    transaction.on_commit(invalidate_course_slugs)
+
+
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=Instructor)
+@receiver(pre_save, sender=UserProfile)
+def image_about_to_change(sender, instance, **kwargs):
+    """Remember the stored images and their variants so replaced ones can be deleted"""
+    instance._previous_images = {}
+    if instance.pk:
+        field_names = IMAGE_FIELDS[sender._meta.label]
+        stored = sender.objects.filter(pk=instance.pk).values(
+            *field_names, *[variants_field(field_name) for field_name in field_names]
+        ).first()
+        if stored:
+            instance._previous_images = {
+                field_name: (stored[field_name], stored[variants_field(field_name)]) for field_name in field_names
+            }
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Instructor)
+@receiver(post_save, sender=UserProfile)
+def image_uploaded(sender, instance, **kwargs):
+    """Queue responsive derivatives for new or replaced images, and delete the replaced ones"""
+    previous_images = getattr(instance, '_previous_images', {})
+    for field_name in IMAGE_FIELDS[sender._meta.label]:
+        previous_name, previous_variants = previous_images.get(field_name, (None, None))
+        if previous_name and previous_name != getattr(instance, field_name).name:
+            delete_image_on_commit(instance, field_name, previous_name, previous_variants)
+        if needs_derivatives(instance, field_name):
+            enqueue_derivatives(instance, field_name)
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Instructor)
+@receiver(post_delete, sender=UserProfile)
+def image_owner_deleted(sender, instance, **kwargs):
+    """Delete the images of a deleted row, with their derivatives"""
+    for field_name in IMAGE_FIELDS[sender._meta.label]:
+        field_file = getattr(instance, field_name)
+        if field_file:
+            delete_image_on_commit(instance, field_name, field_file.name, getattr(instance, variants_field(field_name)))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Instructor)
+@receiver(post_delete, sender=Instructor)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def catalog_changed(sender, instance, **kwargs):
+    """Change the ETags of cached catalog pages once the change is committed"""
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_save, sender=Order)
+def order_about_to_change(sender, instance, **kwargs):
+    """Remember the stored status so edits to completed orders can be detected"""
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    """Recompute cached sales buckets when a completed order is edited, refunded or deleted"""
+    if 'completed' in (instance.status, getattr(instance, '_previous_status', None)):
+        transaction.on_commit(invalidate_sales)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    """Order items are only edited by hand; recompute cached sales buckets"""
+    transaction.on_commit(invalidate_sales)
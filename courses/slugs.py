@@ -0,0 +1,151 @@
+"""
+Course slug resolution.
+
+Turns the slug in a course URL into a small CourseHeader (id plus the fields
+headers and sidebars show) without touching the wide slug index:
+
+1. a process-local LRU, checked first and kept for COURSE_SLUG_LOCAL_TTL
+   seconds so other processes' invalidations are picked up quickly;
+2. the shared cache, keyed by a hash of the slug under a version that is
+   bumped whenever a course or instructor is saved or deleted;
+3. the database, which also consults CourseSlugHistory so renamed courses
+   keep resolving (the header then carries the current slug to redirect to).
+
+Slugs no course has are remembered in the shared cache for
+COURSE_SLUG_MISS_TIMEOUT seconds, so repeated requests for them don't each
+reach the database; creating or renaming a course bumps the version anyway.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import get_version, bump_version
+from .models import Course, CourseSlugHistory
+
+COURSE_SLUG_VERSION_NAMESPACE = 'course_slugs'
+COURSE_SLUG_CACHE_TIMEOUT = 60 * 60 * 24
+COURSE_SLUG_MISS_TIMEOUT = 60
+COURSE_SLUG_MISS = 'missing'
+
+
+@dataclass(frozen=True)
+class CourseHeader:
+    id: int
+    slug: str
+    title: str
+    instructor_id: int
+    instructor_name: str
+    image_url: str
+    price: object
+    currency: str
+    updated_at: object
+
+
+class LocalLRU:
+    """Small thread-safe LRU whose entries expire after ttl seconds"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalLRU(settings.COURSE_SLUG_LRU_SIZE, settings.COURSE_SLUG_LOCAL_TTL)
+
+
+def _header_for(course):
+    return CourseHeader(
+        id=course.id,
+        slug=course.slug,
+        title=course.title,
+        instructor_id=course.instructor_id,
+        instructor_name=course.instructor.full_name,
+        image_url=course.image.url if course.image else '',
+        price=course.price,
+        currency=course.currency,
+        updated_at=course.updated_at,
+    )
+
+
+def load_course_header(slug):
+    """Look a slug (current or previous) up in the database"""
+    courses = Course.objects.select_related('instructor').only(
+        'id', 'slug', 'title', 'instructor_id', 'instructor__full_name',
+        'image', 'price', 'currency', 'updated_at',
+    )
+    course = courses.filter(slug=slug).first()
+    if course is None:
+        course_id = CourseSlugHistory.objects.filter(old_slug=slug).values_list('course_id', flat=True).first()
+        if course_id is None:
+            return None
+        course = courses.filter(pk=course_id).first()
+        if course is None:
+            return None
+    return _header_for(course)
+
+
+def resolve_course_slug(slug):
+    """
+    Get the CourseHeader for a slug, or None if no course has (or had) it.
+    A header whose .slug differs from the one asked for means the course was
+    renamed and the caller should redirect.
+    """
+    header = _local.get(slug)
+    if header is not None:
+        return header
+
+    version = get_version(COURSE_SLUG_VERSION_NAMESPACE)
+    key = f"course_slug:{version}:{hashlib.sha1(slug.encode()).hexdigest()}"
+    header = cache.get(key)
+    if header == COURSE_SLUG_MISS:
+        return None
+    if header is None:
+        header = load_course_header(slug)
+        if header is None:
+            cache.set(key, COURSE_SLUG_MISS, COURSE_SLUG_MISS_TIMEOUT)
+            return None
+        cache.set(key, header, COURSE_SLUG_CACHE_TIMEOUT)
+
+    _local.set(slug, header)
+    return header
+
+
+def invalidate_course_slugs():
+    """Forget every resolved slug (after a course or instructor changes)"""
+    bump_version(COURSE_SLUG_VERSION_NAMESPACE)
+    _local.clear()
+
+
+def record_slug_change(course_id, old_slug, new_slug):
+    """Keep the previous slug of a renamed course pointing at it"""
+    CourseSlugHistory.objects.filter(old_slug=new_slug).delete()
+    CourseSlugHistory.objects.update_or_create(old_slug=old_slug, defaults={'course_id': course_id})
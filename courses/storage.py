@@ -0,0 +1,260 @@
+"""
+Media storage backends.
+
+CachedRemoteStorage layers a bounded local disk cache in front of a remote
+store (Cloudinary in production). Writes go to the remote store and are
+kept in the cache; reads are served from the cache and only fetched from the
+remote store on a miss. The least recently used files are evicted once the
+cache grows past ``max_cache_bytes``; the cache's size is kept as a running
+total, so the directory is only walked when a write pushes it over the budget
+(or the total is older than CACHE_RESCAN_SECONDS, since other processes share
+the directory). Large files don't have to pass through the app when the
+remote store can issue URLs that really expire: ``signed_url`` returns one
+for the client to be redirected to, or None. Cloudinary media are public
+'upload' assets whose URLs never expire, so they are always streamed.
+
+LocalCloudStorage is a filesystem stand-in for the remote store that signs
+URLs the same way, so everything above can be run and tested offline.
+"""
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+SIGNED_URL_TTL = 60 * 10
+CACHE_RESCAN_SECONDS = 60 * 5
+
+
+def _signature(name, expires):
+    message = f'{name}:{expires}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+@deconstructible
+class LocalCloudStorage(FileSystemStorage):
+    """Filesystem stand-in for the remote media store, with signed URLs"""
+
+    def signed_url(self, name, expires_in=SIGNED_URL_TTL):
+        expires = int(time.time()) + expires_in
+        query = urlencode({'expires': expires, 'signature': _signature(name, expires)})
+        return f'{self.url(name)}?{query}'
+
+    @staticmethod
+    def verify_signature(name, expires, signature):
+        """Check a signed URL's query parameters (what the CDN would do)"""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(_signature(name, expires), signature or '')
+
+
+@deconstructible
+class CachedRemoteStorage(Storage):
+    """Remote storage with a bounded LRU disk cache for reads"""
+
+    def __init__(self, remote_backend=None, remote_options=None, cache_dir=None, max_cache_bytes=None):
+        remote_backend = remote_backend or settings.REMOTE_MEDIA_STORAGE_BACKEND
+        self.remote_backend = remote_backend
+        self.remote_options = remote_options or {}
+        self.remote = import_string(remote_backend)(**self.remote_options)
+        self.cache_dir = str(cache_dir or settings.MEDIA_CACHE_DIR)
+        self.max_cache_bytes = max_cache_bytes if max_cache_bytes is not None else settings.MEDIA_CACHE_MAX_BYTES
+        if self.max_cache_bytes <= 0:
+            raise ImproperlyConfigured('MEDIA_CACHE_MAX_BYTES must be positive')
+        self._lock = threading.Lock()
+        self._cache_bytes = None
+        self._scanned_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Local cache
+    # ------------------------------------------------------------------
+
+    def cache_path(self, name):
+        """Where a file is kept in the local cache (flat, keyed by a hash of the name)"""
+        digest = hashlib.sha256(name.encode()).hexdigest()
+        extension = os.path.splitext(name)[1]
+        return os.path.join(self.cache_dir, digest[:2], digest + extension)
+
+    def is_cached(self, name):
+        return os.path.exists(self.cache_path(name))
+
+    def _store_in_cache(self, name, source):
+        """Copy a file object into the cache atomically"""
+        path = self.cache_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as target:
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            size = os.path.getsize(temp_path)
+            try:
+                size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._resized(size)
+        return path
+
+    def _resized(self, delta):
+        """Add delta bytes to the running cache size, evicting if it's over budget or stale"""
+        with self._lock:
+            if self._cache_bytes is not None and time.monotonic() - self._scanned_at < CACHE_RESCAN_SECONDS:
+                self._cache_bytes += delta
+                if self._cache_bytes <= self.max_cache_bytes:
+                    return
+        self.evict()
+
+    def local_path(self, name):
+        """Path of a cached copy of the file, fetching it from the remote store on a miss"""
+        path = self.cache_path(name)
+        if os.path.exists(path):
+            # Recency for the LRU is the file's mtime
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                return path
+        with self.remote.open(name, 'rb') as remote_file:
+            return self._store_in_cache(name, remote_file)
+
+    def evict(self):
+        """Delete least recently used files until the cache fits its budget"""
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for filename in files:
+                    if filename.endswith('.part'):
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            removed = 0
+            if total > self.max_cache_bytes:
+                for _, size, path in sorted(entries):
+                    if total <= self.max_cache_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+            self._cache_bytes = total
+            self._scanned_at = time.monotonic()
+            return removed
+
+    def cache_size(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, filename))
+                except FileNotFoundError:
+                    pass
+        return total
+
+    # ------------------------------------------------------------------
+    # Storage API
+    # ------------------------------------------------------------------
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('CachedRemoteStorage files are read-only once saved')
+        return File(open(self.local_path(name), mode), name=name)
+
+    def _save(self, name, content):
+        name = self.remote.save(name, content)
+        try:
+            self._store_in_cache(name, content)
+        except OSError:
+            # The remote copy is what matters; the cache is filled on the next read
+            pass
+        return name
+
+    def delete(self, name):
+        self.remote.delete(name)
+        path = self.cache_path(name)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        else:
+            self._resized(-size)
+
+    def exists(self, name):
+        return self.is_cached(name) or self.remote.exists(name)
+
+    def get_available_name(self, name, max_length=None):
+        return self.remote.get_available_name(name, max_length=max_length)
+
+    def get_valid_name(self, name):
+        return self.remote.get_valid_name(name)
+
+    def size(self, name):
+        path = self.cache_path(name)
+        if os.path.exists(path):
+            return os.path.getsize(path)
+        return self.remote.size(name)
+
+    def url(self, name):
+        return self.remote.url(name)
+
+    def signed_url(self, name, expires_in=SIGNED_URL_TTL):
+        """Expiring URL for fetching the file straight from the remote store/CDN, or None"""
+        return signed_url(self.remote, name, expires_in)
+
+    def listdir(self, path):
+        return self.remote.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.remote.get_modified_time(name)
+
+    def get_created_time(self, name):
+        return self.remote.get_created_time(name)
+
+    def get_accessed_time(self, name):
+        return self.remote.get_accessed_time(name)
+
+
+def signed_url(storage, name, expires_in=SIGNED_URL_TTL):
+    """
+    Expiring URL for a file if the storage can sign one, else None: a plain
+    URL would be a permanent link around the access check
+    """
+    if hasattr(storage, 'signed_url'):
+        return storage.signed_url(name, expires_in)
+    return None
+
+
+def should_redirect(size):
+    """Whether a download is big enough to send the client straight to the CDN"""
+    threshold = settings.MEDIA_REDIRECT_MIN_BYTES
+    return bool(threshold) and size >= threshold
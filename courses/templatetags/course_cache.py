@@ -0,0 +1,27 @@
+"""
+Template helpers for version-keyed fragment caching.
+
+    {% load cache course_cache %}
+    {% cache_version 'course_outline' course.id as outline_version %}
+    {% cache 86400 course_curriculum course.id outline_version %} ... {% endcache %}
+
+A fragment is re-rendered only when the version it is keyed on is bumped.
+"""
+from django import template
+
+from courses.caching import get_version
+from courses.outline import get_course_outline
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(namespace, pk=''):
+    """Current cache version for a namespace/object"""
+    return get_version(namespace, pk)
+
+
+@register.simple_tag
+def course_outline(course):
+    """Cached outline of a course"""
+    return get_course_outline(course)
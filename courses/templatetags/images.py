@@ -0,0 +1,36 @@
+"""
+Responsive images for uploaded course/instructor/profile pictures.
+
+    {% load images %}
+    {% responsive_image course.image course.title sizes="(max-width: 768px) 100vw, 33vw" class="card-img-top" %}
+
+Renders a <picture> with AVIF/WebP sources and a JPEG srcset from the
+derivatives made by courses.images, or a plain <img> of the original while
+they are still being generated.
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from courses.images import picture_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, alt='', sizes='100vw', **attrs):
+    """<picture> with srcset for an image field"""
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    extra = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+
+    sources, jpeg_srcset, fallback = picture_sources(field_file)
+    if not jpeg_srcset:
+        return format_html('<img src="{}" alt="{}" {}>', field_file.url, alt, extra)
+
+    source_tags = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">', ((mime, srcset, sizes) for mime, srcset in sources)
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" {}></picture>',
+        source_tags, fallback, jpeg_srcset, sizes, alt, extra
+    )
@@ -1,3 +1,1765 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import psycopg
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from emining_university import settings as project_settings
+from emining_university.db_config import database_config
+
+from . import analytics, discussions, payments, paystack, progress
+from .access import enrolled_course_ids, is_enrolled
+from .blobs import collect_unused_blobs, deduplicate_materials
+from .caching import CATALOG_MODIFIED_KEY, bump_catalog_version
+from .course_structure import (
+    MAX_NUMBER, CourseStructureError, build_course_structure, parse_sections_data, serialize_course_structure,
+    sync_course_structure,
+)
+from .database import (
+    STICKY_PRIMARY_COOKIE, ReplicaRoutingMiddleware, StatementTimeout, pool_metrics, route_class, use_primary,
+)
+from .discussions import REPLIES_PAGE_SIZE, get_discussion_page, get_reply_page, reply_event_stream
+from .downloads import RangeNotSatisfiable, parse_range, serve_protected_file
+from .http_cache import catalog_page
+from .images import generate_derivatives, picture_sources, process_image, variant_names
+from .management.commands.explain_hot_queries import HOT_INDEXES, find_problems, hot_queries
+from .models import (
+    Cart, CartItem, Category, Course, CourseMaterial, CourseRatingSummary, Discussion, DiscussionReply, Enrollment, Instructor,
+    Lesson, LessonProgress, MaterialBlob, MaterialUpload, Order, OrderItem, Review, Section,
+)
+from .outline import get_course_outline, invalidate_course_outline, suppress_outline_invalidation
+from .pagination import InvalidCursor, encode_cursor
+from .progress import (
+    LESSON_VIEW_SEQ_KEY, MAX_WATCHED_SECONDS_PER_EVENT, ProgressBitmap, coalesce_progress_events, get_progress_bitmap,
+    flush_lesson_views, ingest_progress_events, note_lesson_viewed, record_lesson_completed, record_lesson_viewed,
+)
+from .reviews import get_review_page
+from .slugs import invalidate_course_slugs, resolve_course_slug
+from .storage import CachedRemoteStorage, LocalCloudStorage
+from .uploads import UploadError, complete_upload, expire_uploads, part_path, start_upload, write_chunk
+
+STATIC_TAG = re.compile(r"""{%\s*static\s+['"]([^'"]+)['"]\s*%}""")
+
+
+def create_course(slug='blasting', price=100, username=None):
+    """A course with its own instructor"""
+    teacher = User.objects.create_user(username or f'{slug}-teacher', password='password')
+    instructor = Instructor.objects.create(user=teacher, full_name=f'{slug.title()} Teacher')
+    return Course.objects.create(title=slug.title(), slug=slug, instructor=instructor, price=price)
+
+
+def create_syllabus(course, sections=2, lessons=2):
+    """Sections with numbered lessons; returns the lessons in course order"""
+    created = []
+    for section_order in range(1, sections + 1):
+        section = Section.objects.create(course=course, title=f'Section {section_order}', order=section_order)
+        for lesson_order in range(1, lessons + 1):
+            created.append(Lesson.objects.create(
+                section=section, title=f'Lesson {section_order}.{lesson_order}', order=lesson_order, duration_minutes=10
+            ))
+    return created
+
+
+def template_static_references():
+    """Map each literal {% static '...' %} path in the project's templates to the files using it"""
+    directories = [Path(directory) for directory in settings.TEMPLATES[0]['DIRS']]
+    directories += [
+        Path(app_config.path) / 'templates' for app_config in apps.get_app_configs()
+        if Path(app_config.path).is_relative_to(settings.BASE_DIR)
+    ]
+    references = {}
+    for directory in directories:
+        for template in directory.rglob('*.html'):
+            for name in STATIC_TAG.findall(template.read_text(encoding='utf-8')):
+                references.setdefault(name, []).append(str(template.relative_to(settings.BASE_DIR)))
+    return references
+
+
+class StaticReferencesTest(SimpleTestCase):
+    """Every {% static %} reference in a template must point at a real file, hashed by the project's storage"""
+
+    def test_references_exist(self):
+        references = template_static_references()
+        self.assertTrue(references)
+        missing = {name: templates for name, templates in references.items() if not finders.find(name)}
+        self.assertEqual(missing, {})
+
+    def test_references_resolve_to_hashed_files(self):
+        references = template_static_references()
+        with tempfile.TemporaryDirectory() as static_root, override_settings(
+            STATIC_ROOT=static_root, STORAGES=project_settings.STORAGES, DEBUG=False
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            storage = import_string(settings.STORAGES['staticfiles']['BACKEND'])()
+            for name in references:
+                with self.subTest(name=name):
+                    # Raises ValueError if the manifest has no entry for the file
+                    url = storage.url(name)
+                    self.assertNotEqual(url, settings.STATIC_URL + name)
+                    self.assertTrue(storage.exists(storage.stored_name(name)))
+
+
+class CachedRemoteStorageTest(SimpleTestCase):
+    """The disk cache in front of the remote store, with LocalCloudStorage standing in for Cloudinary"""
+
+    def setUp(self):
+        remote_dir = tempfile.TemporaryDirectory()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(remote_dir.cleanup)
+        self.addCleanup(cache_dir.cleanup)
+        self.remote_dir = remote_dir.name
+        self.storage = CachedRemoteStorage(
+            remote_backend='courses.storage.LocalCloudStorage',
+            remote_options={'location': remote_dir.name, 'base_url': '/cloud/'},
+            cache_dir=cache_dir.name,
+            max_cache_bytes=100,
+        )
+
+    def test_save_writes_remote_and_cache(self):
+        name = self.storage.save('materials/notes.txt', ContentFile(b'hello'))
+        self.assertTrue(os.path.exists(os.path.join(self.remote_dir, name)))
+        self.assertTrue(self.storage.is_cached(name))
+        with self.storage.open(name) as handle:
+            self.assertEqual(handle.read(), b'hello')
+
+    def test_miss_fetches_from_remote(self):
+        name = self.storage.save('materials/notes.txt', ContentFile(b'hello'))
+        os.remove(self.storage.cache_path(name))
+        with self.storage.open(name) as handle:
+            self.assertEqual(handle.read(), b'hello')
+        self.assertTrue(self.storage.is_cached(name))
+
+    def test_least_recently_used_files_are_evicted(self):
+        first = self.storage.save('a.bin', ContentFile(b'a' * 40))
+        second = self.storage.save('b.bin', ContentFile(b'b' * 40))
+        old = time.time() - 60
+        os.utime(self.storage.cache_path(second), (old, old))
+        # Reading the first file makes the second one the least recently used
+        self.storage.local_path(first)
+        self.storage.save('c.bin', ContentFile(b'c' * 40))
+
+        self.assertTrue(self.storage.is_cached(first))
+        self.assertFalse(self.storage.is_cached(second))
+        self.assertLessEqual(self.storage.cache_size(), 100)
+        # Evicted files are still served, from the remote store
+        with self.storage.open(second) as handle:
+            self.assertEqual(handle.read(), b'b' * 40)
+
+    def test_cache_is_only_walked_past_its_budget(self):
+        self.storage.save('a.bin', ContentFile(b'a' * 40))
+        with mock.patch('courses.storage.os.walk', wraps=os.walk) as walk:
+            second = self.storage.save('b.bin', ContentFile(b'b' * 40))
+            self.storage.delete(second)
+            self.storage.save('c.bin', ContentFile(b'c' * 40))
+            self.assertEqual(walk.call_count, 0)
+            self.storage.save('d.bin', ContentFile(b'd' * 40))
+            self.assertEqual(walk.call_count, 1)
+        self.assertLessEqual(self.storage.cache_size(), 100)
+
+    def test_signed_url(self):
+        name = self.storage.save('materials/notes.txt', ContentFile(b'hello'))
+        url = urlparse(self.storage.signed_url(name, expires_in=60))
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.assertEqual(url.path, '/cloud/' + name)
+        self.assertTrue(LocalCloudStorage.verify_signature(name, query['expires'], query['signature']))
+        self.assertFalse(LocalCloudStorage.verify_signature('other.txt', query['expires'], query['signature']))
+        self.assertFalse(LocalCloudStorage.verify_signature(name, int(time.time()) - 1, query['signature']))
+
+    @override_settings(MEDIA_REDIRECT_MIN_BYTES=1)
+    def test_remote_without_expiring_urls_is_not_signed(self):
+        storage = CachedRemoteStorage(
+            remote_backend='django.core.files.storage.FileSystemStorage',
+            remote_options={'location': self.remote_dir, 'base_url': '/cloud/'},
+            cache_dir=self.storage.cache_dir,
+            max_cache_bytes=100,
+        )
+        name = storage.save('materials/notes.txt', ContentFile(b'hello'))
+        self.assertIsNone(storage.signed_url(name))
+
+        request = RequestFactory().get('/')
+        response = serve_protected_file(request, SimpleNamespace(storage=storage, name=name), 'notes.txt')
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'hello')
+
+        response = serve_protected_file(request, SimpleNamespace(storage=self.storage, name=name), 'notes.txt')
+        self.assertEqual(response.status_code, 302)
+
+
+class FakeCursor:
+    """Records statements; the first one begins the server-side transaction"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        self.connection.info.transaction_status = psycopg.pq.TransactionStatus.INTRANS
+
+
+class DatabaseConfigTest(SimpleTestCase):
+    """Connection modes, route classes, statement timeouts and pool metrics"""
+
+    url = 'postgres://emining:secret@db:5432/emining'
+
+    def test_connection_modes(self):
+        persistent = database_config(self.url, statement_timeout=5000, application_name='emining')
+        self.assertEqual(persistent['CONN_MAX_AGE'], 600)
+        self.assertTrue(persistent['CONN_HEALTH_CHECKS'])
+        self.assertEqual(persistent['OPTIONS'], {
+            'application_name': 'emining', 'options': '-c statement_timeout=5000',
+        })
+
+        pool = database_config(self.url, mode='pool', pool_min=1, pool_max=4, pool_timeout=3)
+        self.assertEqual(pool['CONN_MAX_AGE'], 0)
+        self.assertFalse(pool['CONN_HEALTH_CHECKS'])
+        self.assertEqual(pool['OPTIONS']['pool'], {'min_size': 1, 'max_size': 4, 'timeout': 3})
+
+        pgbouncer = database_config(self.url, mode='pgbouncer', statement_timeout=5000)
+        self.assertTrue(pgbouncer['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(pgbouncer['OPTIONS'], {'prepare_threshold': None})
+
+        self.assertNotIn('OPTIONS', database_config('sqlite:///db.sqlite3', mode='pool', statement_timeout=5000))
+        with self.assertRaises(ValueError):
+            database_config(self.url, mode='sessions')
+
+    def test_route_class(self):
+        self.assertEqual(route_class('/custom-admin/sales/', 'courses:admin_sales_analytics'), 'admin')
+        self.assertEqual(route_class('/payment/webhook/', 'courses:paystack_webhook'), 'api')
+        self.assertEqual(route_class('/courses/', 'courses:courses_list'), 'default')
+
+    def run_query(self, wrapper, connection, cursor):
+        context = {'connection': connection, 'cursor': SimpleNamespace(cursor=cursor)}
+        wrapper(lambda sql, params, many, context: cursor.execute(sql, params), 'SELECT 1', None, False, context)
+
+    def test_timeout_is_set_in_every_transaction(self):
+        raw = SimpleNamespace(info=SimpleNamespace(transaction_status=psycopg.pq.TransactionStatus.IDLE))
+        connection = SimpleNamespace(in_atomic_block=True, connection=raw, Database=psycopg, alias='default')
+        cursor = FakeCursor(raw)
+        wrapper = StatementTimeout(5000, transaction_local=False)
+
+        # Two transactions, e.g. two calls of the same @transaction.atomic function
+        for _ in range(2):
+            self.run_query(wrapper, connection, cursor)
+            self.run_query(wrapper, connection, cursor)
+            raw.info.transaction_status = psycopg.pq.TransactionStatus.IDLE
+        set_config = "SELECT set_config('statement_timeout', %s, %s)"
+        self.assertEqual(cursor.statements, [set_config, 'SELECT 1', 'SELECT 1'] * 2)
+
+        # Outside transactions it is set once per connection, at session level
+        connection.in_atomic_block = False
+        cursor.statements.clear()
+        self.run_query(wrapper, connection, cursor)
+        self.run_query(wrapper, connection, cursor)
+        self.assertEqual(cursor.statements, [set_config, 'SELECT 1', 'SELECT 1'])
+        self.assertIs(wrapper.session_connection, raw)
+
+    def test_pool_metrics(self):
+        stats = {'pool_size': 8, 'pool_available': 2, 'pool_max': 10}
+        pooled = SimpleNamespace(
+            vendor='postgresql', settings_dict={'CONN_MAX_AGE': 0}, pool=SimpleNamespace(get_stats=lambda: stats)
+        )
+        plain = SimpleNamespace(vendor='sqlite', settings_dict={'CONN_MAX_AGE': 600})
+        with mock.patch('courses.database.connections', {'default': pooled, 'replica_1': plain}):
+            metrics = pool_metrics()
+        self.assertEqual(metrics['default']['in_use'], 6)
+        self.assertEqual(metrics['default']['saturation'], 0.6)
+        self.assertEqual(metrics['replica_1'], {
+            'vendor': 'sqlite', 'mode': settings.DATABASE_CONNECTION_MODE, 'conn_max_age': 600,
+        })
+
+
+REPLICA = 'replica_test'
+
+
+def replica_only_visible(request):
+    return HttpResponse(str(Category.objects.filter(slug='replica-only').exists()))
+
+
+def write_then_read(request):
+    Category.objects.create(name='Primary', slug='primary')
+    return replica_only_visible(request)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_REPLICA_ROUTES=['/catalog/'], DATABASE_REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Read routing, with the 'replica_test' database from test_settings standing in for the replica"""
+
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        Category.objects.using(REPLICA).create(name='Replica only', slug='replica-only')
+
+    def request(self, view, path='/catalog/', method='get', cookies=None):
+        request = getattr(RequestFactory(), method)(path)
+        request.COOKIES.update(cookies or {})
+        middleware = ReplicaRoutingMiddleware(
+            lambda request: middleware.process_view(request, view, (), {}) or view(request)
+        )
+        return middleware(request)
+
+    async def arequest(self, view, path='/catalog/'):
+        async def get_response(request):
+            await sync_to_async(middleware.process_view)(request, view, (), {})
+            return await sync_to_async(view)(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        return await middleware(RequestFactory().get(path))
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertFalse(Category.objects.filter(slug='replica-only').exists())
+
+    def test_catalog_reads_use_the_replica(self):
+        response = self.request(replica_only_visible)
+        self.assertEqual(response.content, b'True')
+        self.assertNotIn(STICKY_PRIMARY_COOKIE, response.cookies)
+
+    def test_other_routes_and_posts_use_the_primary(self):
+        self.assertEqual(self.request(replica_only_visible, path='/dashboard/').content, b'False')
+        self.assertEqual(self.request(replica_only_visible, method='post').content, b'False')
+
+    def test_reads_after_a_write_use_the_primary(self):
+        response = self.request(write_then_read)
+        self.assertEqual(response.content, b'False')
+        self.assertIn(STICKY_PRIMARY_COOKIE, response.cookies)
+        self.assertTrue(Category.objects.filter(slug='primary').exists())
+
+    def test_catalog_pages_read_the_primary_while_replicas_lag(self):
+        view = catalog_page()(replica_only_visible)
+        cache.set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+        self.assertEqual(self.request(view).content, b'False')
+        cache.set(CATALOG_MODIFIED_KEY, int(time.time()) - 60, None)
+        self.assertEqual(self.request(view).content, b'True')
+
+    async def test_async_requests_route_their_sync_queries(self):
+        self.assertEqual((await self.arequest(replica_only_visible)).content, b'True')
+        response = await self.arequest(write_then_read)
+        self.assertEqual(response.content, b'False')
+        self.assertIn(STICKY_PRIMARY_COOKIE, response.cookies)
+
+    def test_sticky_cookie_keeps_reads_on_the_primary(self):
+        cookies = {STICKY_PRIMARY_COOKIE: str(time.time() + 5)}
+        response = self.request(replica_only_visible, cookies=cookies)
+        self.assertEqual(response.content, b'False')
+        # The window is not extended by requests that don't write
+        self.assertNotIn(STICKY_PRIMARY_COOKIE, response.cookies)
+
+        expired = {STICKY_PRIMARY_COOKIE: str(time.time() - 5)}
+        self.assertEqual(self.request(replica_only_visible, cookies=expired).content, b'True')
+
+    def test_use_primary_views_read_the_primary_and_start_the_window(self):
+        response = self.request(use_primary(lambda request: replica_only_visible(request)))
+        self.assertEqual(response.content, b'False')
+        self.assertIn(STICKY_PRIMARY_COOKIE, response.cookies)
+
+
+class FakePaystack(BaseHTTPRequestHandler):
+    """Paystack's GET /transaction listing, served from `transactions`"""
+
+    transactions = []
+    pages_served = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path != '/transaction' or self.headers.get('Authorization') != 'Bearer sk_test_fake':
+            return self._reply(401, {'status': False, 'message': 'Invalid key'})
+
+        page, per_page = int(query['page']), int(query['perPage'])
+        self.pages_served.append(page)
+        data = self.transactions[(page - 1) * per_page:page * per_page]
+        page_count = max(1, -(-len(self.transactions) // per_page))
+        self._reply(200, {
+            'status': True,
+            'message': 'Transactions retrieved',
+            'data': data,
+            'meta': {'total': len(self.transactions), 'perPage': per_page, 'page': page, 'pageCount': page_count},
+        })
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReconcilePaymentsTest(TransactionTestCase):
+    """reconcile_payments against a fake Paystack transaction list"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakePaystack)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        teacher = User.objects.create_user('teacher', 'teacher@example.com', 'password')
+        instructor = Instructor.objects.create(user=teacher, full_name='Teacher')
+        self.course = Course.objects.create(title='Blasting', slug='blasting', instructor=instructor, price=100)
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        FakePaystack.transactions = []
+        FakePaystack.pages_served = []
+
+    def order(self, order_id, status='pending', age=timedelta(hours=1)):
+        order = Order.objects.create(user=self.buyer, order_id=order_id, total_amount=100, status=status)
+        OrderItem.objects.create(order=order, course=self.course, price=100)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - age)
+        return order
+
+    def transaction(self, reference, status, amount=10000):
+        FakePaystack.transactions.append({
+            'id': len(FakePaystack.transactions) + 1,
+            'reference': reference,
+            'status': status,
+            'amount': amount,
+            'currency': 'GHS',
+            'channel': 'card',
+        })
+
+    def reconcile(self):
+        output = StringIO()
+        with override_settings(
+            PAYSTACK_API_URL=f'http://127.0.0.1:{self.server.server_port}', PAYSTACK_SECRET_KEY='sk_test_fake'
+        ):
+            call_command('reconcile_payments', '--per-page', '2', '--concurrency', '2', '--no-email', stdout=output)
+        return output.getvalue()
+
+    def status(self, order):
+        order.refresh_from_db()
+        return order.status
+
+    def test_orders_are_settled_from_every_page(self):
+        Cart.objects.create(user=self.buyer)
+        paid = self.order('ORD-PAID')
+        paid_after_failing = self.order('ORD-RETRIED', status='failed')
+        abandoned = self.order('ORD-ABANDONED', age=timedelta(days=2))
+        recent = self.order('ORD-RECENT')
+        underpaid = self.order('ORD-UNDERPAID')
+        self.transaction('ORD-PAID', 'success')
+        self.transaction('ORD-RETRIED', 'failed')
+        self.transaction('ORD-ABANDONED', 'abandoned')
+        self.transaction('ORD-RECENT', 'abandoned')
+        self.transaction('ORD-UNDERPAID', 'success', amount=500)
+        self.transaction('ORD-RETRIED', 'success')
+        self.transaction('ORD-ELSEWHERE', 'success')
+
+        output = self.reconcile()
+
+        self.assertEqual(sorted(FakePaystack.pages_served), [1, 2, 3, 4])
+        self.assertEqual(self.status(paid), 'completed')
+        self.assertEqual(paid.payment_reference, '1')
+        self.assertEqual(self.status(paid_after_failing), 'completed')
+        self.assertEqual(self.status(abandoned), 'failed')
+        self.assertEqual(self.status(recent), 'pending')
+        self.assertEqual(self.status(underpaid), 'pending')
+        self.assertIn('ORD-UNDERPAID', output)
+        self.assertTrue(Enrollment.objects.filter(student=self.buyer, course=self.course).exists())
+        self.assertFalse(Cart.objects.filter(user=self.buyer).exists())
+
+    def test_completed_orders_are_left_alone(self):
+        done = self.order('ORD-DONE', status='completed')
+        self.transaction('ORD-DONE', 'failed')
+        self.reconcile()
+        self.assertEqual(self.status(done), 'completed')
+        self.assertFalse(Enrollment.objects.exists())
+
+
+class CourseOutlineTest(TestCase):
+    """The cached section -> lesson tree and its invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.lessons = create_syllabus(self.course)
+
+    def test_outline_follows_course_order(self):
+        outline = get_course_outline(self.course)
+        self.assertEqual(outline.lesson_ids, tuple(lesson.id for lesson in self.lessons))
+        self.assertEqual([section.title for section in outline.sections], ['Section 1', 'Section 2'])
+        self.assertEqual(outline.total_minutes, 40)
+        self.assertEqual(outline.next_lesson(self.lessons[1].id).id, self.lessons[2].id)
+        self.assertIsNone(outline.previous_lesson(self.lessons[0].id))
+        self.assertIsNone(outline.get_lesson(-1))
+
+    def test_outline_is_cached(self):
+        get_course_outline(self.course)
+        with self.assertNumQueries(0):
+            get_course_outline(self.course.id)
+
+    def test_lesson_changes_invalidate_the_outline(self):
+        get_course_outline(self.course)
+        lesson = Lesson.objects.create(section=self.lessons[0].section, title='Late addition', order=3)
+        self.assertIn(lesson.id, get_course_outline(self.course).lesson_ids)
+
+        lesson.delete()
+        self.assertNotIn(lesson.id, get_course_outline(self.course).lesson_ids)
+
+    def test_suppressed_invalidation_waits_for_the_caller(self):
+        get_course_outline(self.course)
+        with suppress_outline_invalidation():
+            Section.objects.create(course=self.course, title='Bulk', order=3)
+        self.assertEqual(len(get_course_outline(self.course).sections), 2)
+
+        invalidate_course_outline(self.course.id)
+        self.assertEqual(len(get_course_outline(self.course).sections), 3)
+
+
+class ProgressBitmapTest(TestCase):
+    """Per-student completion bits over the course outline"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.lessons = create_syllabus(self.course)
+        self.ids = [lesson.id for lesson in self.lessons]
+        self.student = User.objects.create_user('student', password='password')
+
+    def test_next_incomplete_wraps_around(self):
+        bitmap = ProgressBitmap(tuple(self.ids))
+        for lesson_id in self.ids[2:]:
+            bitmap.mark_completed(lesson_id)
+        self.assertEqual(bitmap.next_incomplete(self.ids[2]), self.ids[0])
+        self.assertEqual(bitmap.completed_ids, frozenset(self.ids[2:]))
+        self.assertEqual(bitmap.percentage, 50)
+
+        bitmap.mark_completed(self.ids[0])
+        bitmap.mark_completed(self.ids[1])
+        self.assertIsNone(bitmap.next_incomplete())
+        # Lessons outside the outline are ignored
+        bitmap.mark_completed(-1)
+        self.assertEqual(bitmap.completed_count, 4)
+
+    def test_resume_skips_a_completed_last_lesson(self):
+        bitmap = ProgressBitmap(tuple(self.ids), last_viewed_lesson_id=self.ids[1])
+        self.assertEqual(bitmap.resume_lesson_id, self.ids[1])
+        bitmap.mark_completed(self.ids[1])
+        self.assertEqual(bitmap.resume_lesson_id, self.ids[2])
+
+    def test_bitmap_is_built_from_progress_rows_and_cached(self):
+        LessonProgress.objects.create(student=self.student, lesson=self.lessons[0], completed=True)
+        LessonProgress.objects.create(student=self.student, lesson=self.lessons[1])
+        outline = get_course_outline(self.course)
+
+        bitmap = get_progress_bitmap(self.student, outline)
+        self.assertEqual(bitmap.completed_ids, {self.ids[0]})
+        self.assertEqual(bitmap.last_viewed_lesson_id, self.ids[1])
+
+        record_lesson_viewed(self.student, outline, self.ids[3])
+        record_lesson_completed(self.student, outline, self.ids[2])
+        with self.assertNumQueries(0):
+            bitmap = get_progress_bitmap(self.student.id, outline)
+        self.assertEqual(bitmap.completed_ids, {self.ids[0], self.ids[2]})
+        self.assertEqual(bitmap.last_viewed_lesson_id, self.ids[2])
+
+    def test_outline_changes_rebuild_the_bitmap(self):
+        outline = get_course_outline(self.course)
+        record_lesson_completed(self.student, outline, self.ids[0])
+
+        # Cached-only bits are dropped once the outline changes; rows are the source of truth
+        lesson = Lesson.objects.create(section=self.lessons[0].section, title='Late addition', order=3)
+        outline = get_course_outline(self.course)
+        bitmap = get_progress_bitmap(self.student, outline)
+        self.assertEqual(bitmap.completed_ids, frozenset())
+        self.assertEqual(len(bitmap.lesson_ids), 5)
+        self.assertIn(lesson.id, bitmap.lesson_ids)
+
+
+class ProgressIngestionTest(TestCase):
+    """Batched client progress events: coalescing and the upsert into LessonProgress"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.lessons = create_syllabus(self.course)
+        self.student = User.objects.create_user('student', password='password')
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+
+    def progress(self, lesson):
+        return LessonProgress.objects.get(student=self.student, lesson=lesson)
+
+    def test_events_are_coalesced_per_lesson(self):
+        pending = coalesce_progress_events([
+            {'lesson_id': '1', 'type': 'watched', 'seconds': 30},
+            {'lesson_id': 1, 'type': 'watched', 'seconds': 10 ** 9},
+            {'lesson_id': 1, 'type': 'watched', 'seconds': -50},
+            {'lesson_id': 2, 'type': 'completed'},
+            {'lesson_id': 2, 'type': 'viewed'},
+        ])
+        self.assertEqual(pending, {
+            1: {'watched_seconds': 30 + MAX_WATCHED_SECONDS_PER_EVENT, 'completed': False, 'viewed': False},
+            2: {'watched_seconds': 0, 'completed': True, 'viewed': True},
+        })
+
+    def test_malformed_events_are_rejected(self):
+        for event in (
+            {'type': 'watched'},
+            {'lesson_id': 'one', 'type': 'watched'},
+            {'lesson_id': 1, 'type': 'watched', 'seconds': float('inf')},
+            {'lesson_id': 1, 'type': 'watched', 'seconds': float('nan')},
+            {'lesson_id': 10 ** 30, 'type': 'viewed'},
+            {'lesson_id': 0, 'type': 'viewed'},
+            {'lesson_id': 1, 'type': 'watched', 'seconds': 10 ** 30},
+            {'lesson_id': 1, 'type': 'skipped'},
+            'not an event',
+        ):
+            with self.subTest(event=event), self.assertRaises(ValueError):
+                coalesce_progress_events([event])
+
+    def test_watched_seconds_accumulate_across_batches(self):
+        lesson = self.lessons[0]
+        LessonProgress.objects.create(student=self.student, lesson=lesson, watched_seconds=100)
+        ingest_progress_events(self.student, [{'lesson_id': lesson.id, 'type': 'watched', 'seconds': 20}])
+        ingest_progress_events(self.student, [{'lesson_id': lesson.id, 'type': 'watched', 'seconds': 5}])
+        self.assertEqual(self.progress(lesson).watched_seconds, 125)
+
+    def test_completion_is_recorded_once(self):
+        lesson = self.lessons[1]
+        events = [
+            {'lesson_id': lesson.id, 'type': 'watched', 'seconds': 60},
+            {'lesson_id': lesson.id, 'type': 'completed'},
+        ]
+        self.assertEqual(ingest_progress_events(self.student, events), {'lessons': 1, 'completed': 1})
+        completed_at = self.progress(lesson).completed_at
+        self.assertIsNotNone(completed_at)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.progress_percentage, 25)
+        outline = get_course_outline(self.course)
+        self.assertTrue(get_progress_bitmap(self.student, outline).is_completed(lesson.id))
+
+        self.assertEqual(ingest_progress_events(self.student, events), {'lessons': 1, 'completed': 0})
+        progress = self.progress(lesson)
+        self.assertEqual(progress.completed_at, completed_at)
+        self.assertEqual(progress.watched_seconds, 120)
+
+    def test_views_are_queued_instead_of_written(self):
+        lesson = self.lessons[0]
+        result = ingest_progress_events(self.student, [{'lesson_id': lesson.id, 'type': 'viewed'}])
+        self.assertEqual(result, {'lessons': 1, 'completed': 0})
+        self.assertFalse(LessonProgress.objects.exists())
+        self.assertEqual(flush_lesson_views(), 1)
+        self.assertEqual(self.progress(lesson).watched_seconds, 0)
+
+    def test_lessons_of_other_courses_are_ignored(self):
+        other = create_syllabus(create_course('surveying'), sections=1, lessons=1)[0]
+        result = ingest_progress_events(self.student, [{'lesson_id': other.id, 'type': 'completed'}])
+        self.assertEqual(result['completed'], 0)
+        self.assertFalse(LessonProgress.objects.exists())
+
+    def test_endpoint_rejects_non_finite_seconds(self):
+        client = Client()
+        client.force_login(self.student)
+        body = '{"events": [{"lesson_id": %d, "type": "watched", "seconds": Infinity}]}' % self.lessons[0].id
+        response = client.post(
+            reverse('courses:record_progress_events'), body, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_endpoint_rejects_out_of_range_lesson_ids(self):
+        client = Client()
+        client.force_login(self.student)
+        response = client.post(
+            reverse('courses:record_progress_events'),
+            {'events': [{'lesson_id': 10 ** 30, 'type': 'completed'}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class LessonViewQueueTest(TestCase):
+    """Lesson views queued in the cache and flushed to LessonProgress.last_viewed"""
+
+    def setUp(self):
+        cache.clear()
+        self.lessons = create_syllabus(create_course(), sections=1, lessons=3)
+        self.student = User.objects.create_user('student', password='password')
+
+    def viewed(self):
+        return set(LessonProgress.objects.filter(student=self.student).values_list('lesson_id', flat=True))
+
+    def test_views_are_coalesced_and_flushed(self):
+        self.assertTrue(note_lesson_viewed(self.student, self.lessons[0].id))
+        self.assertFalse(note_lesson_viewed(self.student, self.lessons[0].id))
+        self.assertTrue(note_lesson_viewed(self.student.id, self.lessons[1].id))
+        self.assertEqual(LessonProgress.objects.count(), 0)
+
+        self.assertEqual(flush_lesson_views(batch_size=1), 2)
+        self.assertEqual(self.viewed(), {self.lessons[0].id, self.lessons[1].id})
+        self.assertEqual(flush_lesson_views(), 0)
+
+    @override_settings(LESSON_VIEW_FLUSH_IN_PROCESS=True)
+    def test_views_are_flushed_in_process_without_a_shared_cache(self):
+        note_lesson_viewed(self.student, self.lessons[0].id)
+        self.assertEqual(self.viewed(), {self.lessons[0].id})
+
+    def test_flush_waits_for_an_entry_still_being_written(self):
+        note_lesson_viewed(self.student, self.lessons[0].id)
+        # A view that has taken its sequence number but not yet stored its entry
+        seq = cache.incr(LESSON_VIEW_SEQ_KEY)
+        note_lesson_viewed(self.student, self.lessons[2].id)
+
+        self.assertEqual(flush_lesson_views(), 1)
+        self.assertEqual(self.viewed(), {self.lessons[0].id})
+
+        cache.set(f'lesson_viewed_pending:{seq}', (self.student.id, self.lessons[1].id, time.time()))
+        self.assertEqual(flush_lesson_views(), 2)
+        self.assertEqual(self.viewed(), {lesson.id for lesson in self.lessons})
+
+    def test_flush_skips_an_entry_that_never_arrives(self):
+        cache.add(LESSON_VIEW_SEQ_KEY, 0, None)
+        cache.incr(LESSON_VIEW_SEQ_KEY)
+        note_lesson_viewed(self.student, self.lessons[0].id)
+        self.assertEqual(flush_lesson_views(), 0)
+
+        with mock.patch.object(progress, 'LESSON_VIEW_GAP_SECONDS', 0):
+            self.assertEqual(flush_lesson_views(), 1)
+        self.assertEqual(self.viewed(), {self.lessons[0].id})
+
+
+class HotQueryIndexTest(TestCase):
+    """The composite indexes for the hot query shapes, and that those queries use them"""
+
+    def setUp(self):
+        course = create_course()
+        lesson = create_syllabus(course, sections=1, lessons=1)[0]
+        student = User.objects.create_user('student', password='password')
+        Enrollment.objects.create(student=student, course=course)
+        LessonProgress.objects.create(student=student, lesson=lesson, completed=True)
+
+    def test_indexes_exist(self):
+        with connection.cursor() as cursor:
+            for model, name in HOT_INDEXES:
+                with self.subTest(index=name):
+                    constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                    self.assertIn(name, constraints)
+                    self.assertTrue(constraints[name]['index'])
+
+    def test_hot_queries_run_as_one_query_each(self):
+        for name, queryset in hot_queries():
+            with self.subTest(query=name), self.assertNumQueries(1):
+                list(queryset)
+
+    def test_find_problems(self):
+        self.assertEqual(find_problems('SEARCH courses_order USING INDEX order_status_date_idx (status=?)'), [])
+        self.assertEqual(find_problems('SCAN courses_order'), ['SCAN courses_order'])
+        self.assertEqual(find_problems('Seq Scan on courses_order'), ['Seq Scan on courses_order'])
+        self.assertEqual(find_problems('USE TEMP B-TREE FOR ORDER BY'), ['USE TEMP B-TREE FOR ORDER BY'])
+
+    def test_command_explains_every_query_and_rolls_back_its_seed(self):
+        output = StringIO()
+        call_command('explain_hot_queries', '--seed', '20', stdout=output)
+        for name, queryset in hot_queries():
+            self.assertIn(name, output.getvalue())
+        self.assertFalse(Course.objects.filter(slug__startswith='explain-seed').exists())
+
+
+class CourseStructureTest(TestCase):
+    """Validating the course editor's syllabus JSON and diffing it against the stored rows"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.lessons = create_syllabus(self.course)
+
+    def test_invalid_syllabi_are_rejected(self):
+        lesson = {'title': 'Intro'}
+        for raw in (
+            'not json',
+            '{"title": "Section"}',
+            json.dumps([{'lessons': [lesson]}]),
+            json.dumps([{'title': 'S', 'lessons': [{'title': ''}]}]),
+            json.dumps([{'title': 'S', 'lessons': [{**lesson, 'content_type': 'podcast'}]}]),
+            json.dumps([{'title': 'S', 'lessons': [{**lesson, 'video_url': 'not a url'}]}]),
+            json.dumps([{'title': 'S', 'lessons': [{**lesson, 'duration_minutes': -1}]}]),
+            json.dumps([{'title': 'S', 'lessons': [{**lesson, 'duration_minutes': MAX_NUMBER + 1}]}]),
+            json.dumps([{'title': 'S', 'order': 10 ** 30, 'lessons': []}]),
+            '[{"title": "S", "order": Infinity, "lessons": []}]',
+            '[{"title": "S", "id": -Infinity, "lessons": []}]',
+        ):
+            with self.subTest(raw=raw), self.assertRaises(CourseStructureError):
+                parse_sections_data(raw)
+
+    def test_edits_keep_lesson_ids(self):
+        sections = serialize_course_structure(self.course)
+        kept, moved = sections[0]['lessons']
+        removed, untouched = sections[1]['lessons']
+        sections[0]['lessons'] = [{**kept, 'title': 'Renamed'}]
+        sections[1]['lessons'] = [moved, untouched, {'title': 'New lesson', 'order': 9}]
+
+        changes = sync_course_structure(self.course, parse_sections_data(json.dumps(sections)))
+
+        self.assertEqual(changes, {'created': 1, 'updated': 2, 'deleted': 1})
+        self.assertEqual(Lesson.objects.get(pk=kept['id']).title, 'Renamed')
+        self.assertEqual(Lesson.objects.get(pk=moved['id']).section_id, sections[1]['id'])
+        self.assertFalse(Lesson.objects.filter(pk=removed['id']).exists())
+        self.assertEqual(get_course_outline(self.course).lesson_count, 4)
+
+    def test_unknown_ids_change_nothing(self):
+        sections = serialize_course_structure(self.course)
+        sections[0]['title'] = 'Renamed'
+        sections[1]['lessons'][0]['id'] = 10 ** 9
+        with self.assertRaises(CourseStructureError):
+            sync_course_structure(self.course, parse_sections_data(json.dumps(sections)))
+        self.assertFalse(Section.objects.filter(title='Renamed').exists())
+
+    def test_editor_reports_oversized_numbers_as_form_errors(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        sections = serialize_course_structure(self.course)
+        sections[0]['lessons'][0]['duration_minutes'] = 10 ** 12
+        response = client.post(
+            reverse('courses:admin_edit_course', args=[self.course.id]),
+            {'title': self.course.title, 'sections_data': json.dumps(sections)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Course content error')
+        self.assertEqual(Lesson.objects.get(pk=self.lessons[0].id).duration_minutes, 10)
+
+
+def syllabus_json(sections, lessons):
+    return json.dumps([
+        {
+            'title': f'Section {section}',
+            'order': section,
+            'lessons': [{'title': f'Lesson {section}.{lesson}', 'order': lesson} for lesson in range(lessons)],
+        }
+        for section in range(sections)
+    ])
+
+
+class CourseCreatorTest(TestCase):
+    """The all-in-one course creator inserts the whole syllabus in bulk"""
+
+    def build(self, slug, sections, lessons):
+        course = create_course(slug)
+        with CaptureQueriesContext(connection) as queries:
+            created = build_course_structure(course, parse_sections_data(syllabus_json(sections, lessons)))
+        self.assertEqual(created, {'sections': sections, 'lessons': sections * lessons})
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_syllabus(self):
+        self.assertEqual(self.build('small', 1, 1), self.build('large', 8, 12))
+        lessons = Lesson.objects.filter(section__course__slug='large')
+        self.assertEqual(lessons.count(), 96)
+        self.assertEqual(
+            list(lessons.filter(section__order=3).order_by('order').values_list('title', flat=True)[:2]),
+            ['Lesson 3.0', 'Lesson 3.1'],
+        )
+
+    def test_invalid_syllabus_creates_no_course(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        response = client.post(reverse('courses:admin_create_course'), {
+            'title': 'Drilling', 'sections_data': '[{"title": "", "lessons": []}]',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Course content error')
+        self.assertFalse(Course.objects.filter(title='Drilling').exists())
+
+
+class ReviewsTest(TestCase):
+    """The incrementally maintained rating histogram and keyset-paged reviews"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+
+    def review(self, rating, username=None):
+        student = User.objects.create_user(username or f'student{Review.objects.count()}', password='password')
+        return Review.objects.create(course=self.course, student=student, rating=rating, title='Title', comment='Text')
+
+    def summary(self):
+        return CourseRatingSummary.objects.get(course=self.course)
+
+    def test_histogram_follows_review_changes(self):
+        five = self.review(5)
+        self.review(3)
+        four = self.review(4)
+        four.rating = 2
+        four.save()
+        five.delete()
+
+        summary = self.summary()
+        self.assertEqual((summary.rating_count, summary.rating_sum), (2, 5))
+        self.assertEqual([bucket['count'] for bucket in summary.histogram], [0, 0, 1, 1, 0])
+        self.assertEqual(summary.average, 2.5)
+        refreshed = CourseRatingSummary.refresh(self.course.id)
+        self.assertEqual(
+            [bucket['count'] for bucket in refreshed.histogram], [bucket['count'] for bucket in summary.histogram]
+        )
+
+    def test_missing_summary_is_built_on_first_use(self):
+        self.review(4)
+        CourseRatingSummary.objects.all().delete()
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual((course.get_average_rating(), course.get_rating_count()), (4, 1))
+
+    def test_pages_cover_every_review_once(self):
+        reviews = [self.review(rating) for rating in (1, 2, 3, 4, 5)]
+        # Ties on created_at are broken by id
+        Review.objects.filter(pk__in=[review.pk for review in reviews[1:4]]).update(created_at=reviews[1].created_at)
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = get_review_page(self.course, cursor, limit=2)
+            seen += [review.pk for review in page]
+            if cursor is None:
+                break
+        expected = Review.objects.filter(course=self.course).order_by('-created_at', '-id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_invalid_cursors(self):
+        for cursor in ('garbage', encode_cursor('yesterday', 1), encode_cursor(1), base64.urlsafe_b64encode(b'[1e400, 1]').decode()):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                get_review_page(self.course, cursor)
+
+        url = reverse('courses:course_reviews', args=[self.course.slug])
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get(url).json(), {'reviews': [], 'next_cursor': None})
+
+
+class DiscussionThreadsTest(TestCase):
+    """Denormalized reply counts and last activity, and keyset-paged threads"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.student = User.objects.create_user('student', password='password')
+        self.other = User.objects.create_user('other', password='password')
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+    def thread(self, title='Question', **fields):
+        return Discussion.objects.create(course=self.course, author=self.student, title=title, content='?', **fields)
+
+    def test_replies_update_the_thread(self):
+        discussion = self.thread()
+        first = DiscussionReply.objects.create(discussion=discussion, author=self.other, content='One')
+        second = DiscussionReply.objects.create(discussion=discussion, author=self.student, content='Two')
+        discussion.refresh_from_db()
+        self.assertEqual(discussion.reply_count, 2)
+        self.assertEqual(discussion.last_reply_author, self.student)
+        self.assertEqual(discussion.last_activity_at, second.created_at)
+
+        second.delete()
+        discussion.refresh_from_db()
+        self.assertEqual(discussion.reply_count, 1)
+        self.assertEqual((discussion.last_reply_author, discussion.last_reply_at), (self.other, first.created_at))
+
+        first.delete()
+        discussion.refresh_from_db()
+        self.assertEqual(discussion.reply_count, 0)
+        self.assertIsNone(discussion.last_reply_author)
+        self.assertEqual(discussion.last_activity_at, discussion.created_at)
+
+    def test_threads_are_paged_pinned_first_then_by_activity(self):
+        quiet = self.thread('Quiet')
+        busy = self.thread('Busy')
+        pinned = self.thread('Pinned', is_pinned=True)
+        DiscussionReply.objects.create(discussion=quiet, author=self.other, content='Bump')
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = get_discussion_page(self.course, cursor, limit=1)
+            seen += [discussion.title for discussion in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [pinned.title, quiet.title, busy.title])
+
+    def test_forum_page_queries_do_not_grow_with_threads(self):
+        for index in range(5):
+            discussion = self.thread(f'Thread {index}')
+            DiscussionReply.objects.create(discussion=discussion, author=self.other, content='Reply')
+        page, _ = get_discussion_page(self.course)
+        with self.assertNumQueries(0):
+            [(discussion.reply_count, discussion.last_reply_author.username, discussion.author.username)
+             for discussion in page]
+
+    def test_invalid_cursor_restarts_the_forum(self):
+        self.client.force_login(self.student)
+        url = reverse('courses:course_discussions', args=[self.course.slug])
+        self.assertRedirects(self.client.get(url, {'cursor': 'garbage'}), url)
+
+
+class DiscussionRepliesTest(TestCase):
+    """Reply pages and the incremental new-replies endpoint and SSE stream"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.student = User.objects.create_user('student', password='password')
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.discussion = Discussion.objects.create(
+            course=self.course, author=self.student, title='Question', content='?'
+        )
+        self.client.force_login(self.student)
+
+    def reply(self, content='Reply'):
+        return DiscussionReply.objects.create(discussion=self.discussion, author=self.student, content=content)
+
+    def test_reply_pages_are_clamped(self):
+        replies = [self.reply(f'Reply {index}') for index in range(REPLIES_PAGE_SIZE + 1)]
+        self.discussion.refresh_from_db()
+        page, number, count = get_reply_page(self.discussion, '99')
+        self.assertEqual((number, count, [reply.id for reply in page]), (2, 2, [replies[-1].id]))
+        self.assertEqual(get_reply_page(self.discussion, 'first')[1], 1)
+        self.assertEqual(get_reply_page(self.discussion, '-3')[1], 1)
+
+    def test_new_replies_endpoint(self):
+        first = self.reply('First')
+        second = self.reply('Second')
+        url = reverse('courses:discussion_new_replies', args=[self.discussion.id])
+
+        data = self.client.get(url, {'after': first.id}).json()
+        self.assertEqual(([reply['id'] for reply in data['replies']], data['last_id']), ([second.id], second.id))
+        self.assertEqual(self.client.get(url, {'after': second.id}).json(), {'replies': [], 'last_id': second.id})
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+
+        self.client.force_login(User.objects.create_user('outsider', password='password'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_stream_sends_replies_after_the_last_id_and_new_ones(self):
+        first = await sync_to_async(self.reply)('First')
+        second = await sync_to_async(self.reply)('Second')
+
+        async def reply_later():
+            await asyncio.sleep(0.1)
+            return await sync_to_async(self.reply)('Live')
+
+        async def read_stream():
+            return [event async for event in reply_event_stream(self.discussion.id, last_id=first.id)]
+
+        with mock.patch.multiple(discussions, SSE_POLL_SECONDS=0.02, SSE_MAX_SECONDS=0.5):
+            events, live = await asyncio.gather(read_stream(), reply_later())
+
+        reply_ids = [int(event.split('\n')[0][4:]) for event in events if event.startswith('id: ')]
+        self.assertEqual(reply_ids, [second.id, live.id])
+        self.assertTrue(events[0].startswith('retry: '))
+
+    async def test_stream_sends_a_burst_larger_than_one_batch(self):
+        replies = [await sync_to_async(self.reply)(f'Reply {index}') for index in range(5)]
+        with mock.patch.multiple(discussions, MAX_NEW_REPLIES=2, SSE_POLL_SECONDS=0.02, SSE_MAX_SECONDS=0.1):
+            events = [event async for event in reply_event_stream(self.discussion.id)]
+        reply_ids = [int(event.split('\n')[0][4:]) for event in events if event.startswith('id: ')]
+        self.assertEqual(reply_ids, [reply.id for reply in replies])
+
+    @override_settings(DISCUSSION_SSE_ENABLED=False)
+    def test_stream_is_off_unless_enabled(self):
+        url = reverse('courses:discussion_reply_stream', args=[self.discussion.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class EnrollmentAccessTest(TestCase):
+    """Cached enrolled course ids behind the gated course views"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.student = User.objects.create_user('student', password='password')
+
+    def enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Enrollment.objects.create(student=self.student, course=self.course)
+
+    def test_enrolled_ids_are_cached(self):
+        self.enroll()
+        self.assertEqual(enrolled_course_ids(self.student), {self.course.id})
+        with self.assertNumQueries(0):
+            self.assertTrue(is_enrolled(self.student, self.course.id))
+        self.assertEqual(enrolled_course_ids(AnonymousUser()), frozenset())
+
+    def test_enrolling_and_unenrolling_invalidate_the_cache(self):
+        self.assertFalse(is_enrolled(self.student, self.course.id))
+        enrollment = self.enroll()
+        self.assertTrue(is_enrolled(self.student, self.course.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.delete()
+        self.assertFalse(is_enrolled(self.student, self.course.id))
+
+    def test_a_stale_cached_set_does_not_deny_access(self):
+        self.assertEqual(enrolled_course_ids(self.student), frozenset())
+        # Created without running the on_commit invalidation, like a write another worker's cache missed
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.assertTrue(is_enrolled(self.student, self.course.id))
+        self.assertEqual(enrolled_course_ids(self.student), {self.course.id})
+
+    def test_gated_views_redirect_until_enrolled(self):
+        self.client.force_login(self.student)
+        url = reverse('courses:course_discussions', args=[self.course.slug])
+        self.assertRedirects(
+            self.client.get(url), reverse('courses:course_detail', args=[self.course.slug]),
+            fetch_redirect_response=False,
+        )
+        self.enroll()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        missing = reverse('courses:course_discussions', args=['no-such-course'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class CourseSlugTest(TestCase):
+    """Slug resolution, its miss cache and previous-slug redirects"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_course_slugs()
+
+    def test_renamed_course_redirects_with_query_string(self):
+        course = create_course()
+        course.slug = 'blasting-basics'
+        with self.captureOnCommitCallbacks(execute=True):
+            course.save()
+
+        response = self.client.get(reverse('courses:course_detail', args=['blasting']) + '?ref=newsletter')
+        self.assertEqual(response.status_code, 301)
+        renamed = reverse('courses:course_detail', args=['blasting-basics'])
+        self.assertEqual(response['Location'], f'{renamed}?ref=newsletter')
+        self.assertEqual(resolve_course_slug('blasting').slug, 'blasting-basics')
+
+    def test_unknown_slugs_are_cached_until_a_course_takes_them(self):
+        self.assertIsNone(resolve_course_slug('drilling'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_course_slug('drilling'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course = create_course('drilling')
+        self.assertEqual(resolve_course_slug('drilling').id, course.id)
+
+    async def test_async_requests_are_redirected(self):
+        course = await sync_to_async(create_course)()
+        course.slug = 'blasting-basics'
+        with self.captureOnCommitCallbacks(execute=True):
+            await course.asave()
+
+        response = await self.async_client.get(reverse('courses:course_detail', args=['blasting']))
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], reverse('courses:course_detail', args=['blasting-basics']))
+
+    def test_unknown_slug_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('courses:course_detail', args=['drilling'])).status_code, 404)
+
+
+def png_bytes(width, height, color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ImageDerivativesTest(TestCase):
+    """Responsive derivatives of course images"""
+
+    def setUp(self):
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        media = override_settings(MEDIA_ROOT=media_dir.name, IMAGE_DERIVATIVE_WIDTHS=(320, 640))
+        media.enable()
+        self.addCleanup(media.disable)
+        self.course = create_course()
+
+    def upload(self, name, width=400):
+        self.course.image.save(name, ContentFile(png_bytes(width, width // 2)))
+        return process_image('courses.Course', self.course.pk, 'image')
+
+    def test_derivatives_never_upscale(self):
+        variants = self.upload('intro.png')
+        self.assertEqual(variants['source'], self.course.image.name)
+        self.assertEqual({width for width, _ in variants['formats']['jpeg']}, {320})
+        for name in variant_names(variants):
+            self.assertTrue(default_storage.exists(name))
+
+        self.course.refresh_from_db()
+        sources, jpeg_srcset, fallback = picture_sources(self.course.image)
+        self.assertIn('320w', jpeg_srcset)
+        self.assertTrue(fallback.endswith('.jpeg'))
+
+    def test_replaced_image_drops_old_derivatives(self):
+        old = self.upload('intro.png')
+        self.course.refresh_from_db()
+        new = self.upload('outro.png', width=800)
+
+        self.assertNotEqual(old['source'], new['source'])
+        for name in variant_names(old):
+            self.assertFalse(default_storage.exists(name))
+        for name in variant_names(new):
+            self.assertTrue(default_storage.exists(name))
+
+    def test_replaced_and_cleared_originals_are_deleted(self):
+        self.upload('intro.png')
+        self.course.refresh_from_db()
+        old = self.course.image.name
+        with mock.patch('courses.signals.enqueue_derivatives'), self.captureOnCommitCallbacks(execute=True):
+            self.course.image.save('outro.png', ContentFile(png_bytes(400, 200)))
+        self.assertFalse(default_storage.exists(old))
+
+        variants = process_image('courses.Course', self.course.pk, 'image')
+        self.course.refresh_from_db()
+        current = self.course.image.name
+        self.course.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()
+        for name in [current, *variant_names(variants)]:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_deleted_rows_take_their_images_along(self):
+        variants = self.upload('intro.png')
+        self.course.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.delete()
+        for name in [variants['source'], *variant_names(variants)]:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_derivatives_of_an_image_replaced_meanwhile_are_dropped(self):
+        self.course.image.save('intro.png', ContentFile(png_bytes(400, 200)))
+
+        def replaced_meanwhile(field_file):
+            variants = generate_derivatives(field_file)
+            Course.objects.filter(pk=self.course.pk).update(image='courses/other.png')
+            return variants
+
+        with mock.patch('courses.images.generate_derivatives', side_effect=replaced_meanwhile) as generate:
+            self.assertIsNone(process_image('courses.Course', self.course.pk, 'image'))
+        self.assertTrue(generate.called)
+        self.assertFalse(any(default_storage.exists(name) for name in default_storage.listdir('derivatives/courses')[1]))
+
+
+class ProtectedDownloadTest(TestCase):
+    """Access checks, byte ranges and server offload of material downloads"""
+
+    def setUp(self):
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        media = override_settings(MEDIA_ROOT=media_dir.name, PROTECTED_MEDIA_SERVER='', MEDIA_REDIRECT_MIN_BYTES=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_dir = media_dir.name
+
+        cache.clear()
+        self.course = create_course()
+        lesson = create_syllabus(self.course, sections=1, lessons=1)[0]
+        self.material = CourseMaterial.objects.create(
+            lesson=lesson, title='Notes', file=ContentFile(b'0123456789', name='blasting notes.txt'),
+        )
+        self.url = reverse('courses:download_material', args=[self.material.id])
+        self.student = User.objects.create_user('student', password='password')
+        self.client.force_login(self.student)
+
+    def enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.student, course=self.course)
+
+    def download(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=2-5', 10), (2, 5))
+        self.assertEqual(parse_range('bytes=7-', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-30', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=8-30', 10), (8, 9))
+        for header in (None, '', 'bytes=-', 'bytes=5-2', 'bytes=0-1,4-5', 'items=0-1', 'bytes=a-b'):
+            self.assertIsNone(parse_range(header, 10), header)
+        for header in ('bytes=10-', 'bytes=-0'):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 10)
+
+    def test_only_enrolled_students_download(self):
+        self.assertEqual(self.download().status_code, 404)
+        self.enroll()
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('blasting notes.txt', response['Content-Disposition'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_ranges(self):
+        self.enroll()
+        response = self.download(range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.download(range='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+        # A stale If-Range gets the whole file
+        response = self.download(range='bytes=2-5', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_nginx_sends_the_file(self):
+        self.enroll()
+        locations = {self.media_dir: '/protected/media/'}
+        with override_settings(PROTECTED_MEDIA_SERVER='nginx', PROTECTED_MEDIA_ACCEL_LOCATIONS=locations):
+            response = self.download()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/media/{self.material.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+class MaterialUploadTest(TestCase):
+    """Resumable chunked material uploads"""
+
+    def setUp(self):
+        media_dir = tempfile.TemporaryDirectory()
+        parts_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        self.addCleanup(parts_dir.cleanup)
+        uploads = override_settings(
+            MEDIA_ROOT=media_dir.name, MATERIAL_UPLOAD_TEMP_DIR=parts_dir.name, MATERIAL_UPLOAD_CHUNK_SIZE=4,
+        )
+        uploads.enable()
+        self.addCleanup(uploads.disable)
+
+        self.course = create_course()
+        self.lesson = create_syllabus(self.course, sections=1, lessons=1)[0]
+        self.user = self.course.instructor.user
+        self.content = b'0123456789'
+
+    def start(self, **kwargs):
+        return start_upload(self.user, self.lesson, 'Notes', 'notes.txt', len(self.content), **kwargs)
+
+    def send(self, upload, index, data=None, checksum=None):
+        data = self.content[index * 4:index * 4 + 4] if data is None else data
+        checksum = checksum or hashlib.sha256(data).hexdigest()
+        return write_chunk(upload, index, BytesIO(data), len(data), checksum)
+
+    def test_chunks_must_match_their_checksums(self):
+        upload = self.start()
+        with self.assertRaises(UploadError) as raised:
+            self.send(upload, 0, checksum=hashlib.sha256(b'nope').hexdigest())
+        self.assertEqual(raised.exception.status, 422)
+        upload.refresh_from_db()
+        self.assertEqual(upload.received_bytes, 0)
+        self.assertEqual(self.send(upload, 0), 4)
+
+    def test_uploads_resume_from_the_last_chunk(self):
+        upload = self.start()
+        self.assertEqual(self.send(upload, 0), 4)
+        with self.assertRaises(UploadError) as raised:
+            self.send(upload, 2)
+        self.assertEqual(raised.exception.status, 409)
+
+        resumed = self.start()
+        self.assertEqual(resumed.pk, upload.pk)
+        self.assertEqual(resumed.received_bytes, 4)
+        # A chunk that already arrived is accepted again without moving the offset
+        self.assertEqual(self.send(resumed, 0), 4)
+        self.assertEqual(self.send(resumed, 1), 8)
+
+    def test_complete_upload_creates_the_material(self):
+        upload = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        with self.assertRaises(UploadError):
+            complete_upload(upload)
+        for index in range(upload.chunk_count):
+            upload.received_bytes = self.send(upload, index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            material = complete_upload(upload)
+        with material.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.content)
+        self.assertEqual(material.original_filename, 'notes.txt')
+        material.blob.refresh_from_db()
+        self.assertEqual(material.blob.ref_count, 1)
+        self.assertFalse(os.path.exists(part_path(upload.id)))
+        self.assertEqual(complete_upload(MaterialUpload.objects.get(pk=upload.pk)), material)
+
+    def test_expire_only_removes_stale_uploads(self):
+        stale = self.start()
+        self.send(stale, 0)
+        fresh = start_upload(self.user, self.lesson, 'Other', 'other.txt', len(self.content))
+        self.send(fresh, 0)
+        MaterialUpload.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=49))
+
+        self.assertEqual(expire_uploads(48), 1)
+        self.assertFalse(MaterialUpload.objects.filter(pk=stale.pk).exists())
+        self.assertFalse(os.path.exists(part_path(stale.id)))
+        self.assertTrue(os.path.exists(part_path(fresh.id)))
+
+
+class MaterialBlobTest(TestCase):
+    """Content-addressed material files and their reference counts"""
+
+    def setUp(self):
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        media = override_settings(MEDIA_ROOT=media_dir.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_dir = Path(media_dir.name)
+        self.lesson = create_syllabus(create_course(), sections=1, lessons=1)[0]
+
+    def material(self, content, name='notes.txt'):
+        return CourseMaterial.objects.create(lesson=self.lesson, title=name, file=ContentFile(content, name=name))
+
+    def legacy_material(self, content, name):
+        """A material stored before blobs existed"""
+        name = default_storage.save(f'course_materials/{name}', ContentFile(content))
+        return CourseMaterial.objects.create(lesson=self.lesson, title=name, file=name)
+
+    def refs(self, material):
+        return MaterialBlob.objects.values_list('ref_count', flat=True).get(materials=material)
+
+    def stored_files(self):
+        return sorted(path.name for path in self.media_dir.rglob('*') if path.is_file())
+
+    def test_same_bytes_share_one_blob(self):
+        first = self.material(b'handout')
+        stored = self.stored_files()
+        second = self.material(b'handout', name='copy.txt')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(second.download_filename, 'copy.txt')
+        self.assertEqual(self.stored_files(), stored)
+
+    def test_ref_count_follows_materials(self):
+        first = self.material(b'handout')
+        second = self.material(b'handout')
+        self.assertEqual(self.refs(first), 2)
+
+        second.file = ContentFile(b'revised handout', name='notes.txt')
+        second.save()
+        self.assertEqual(self.refs(first), 1)
+        self.assertEqual(self.refs(second), 1)
+
+        blob = first.blob
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+
+    def test_collect_keeps_referenced_and_recent_blobs(self):
+        old = timezone.now() - timedelta(hours=48)
+        referenced = self.material(b'in use').blob
+        recent = self.material(b'just detached').blob
+        unused = self.material(b'long gone').blob
+        CourseMaterial.objects.filter(blob__in=[recent, unused]).delete()
+        MaterialBlob.objects.filter(pk__in=[referenced.pk, unused.pk]).update(last_used_at=old)
+
+        self.assertEqual(collect_unused_blobs(grace_hours=24), 1)
+        self.assertEqual(set(MaterialBlob.objects.values_list('pk', flat=True)), {referenced.pk, recent.pk})
+        self.assertFalse(default_storage.exists(unused.file.name))
+        self.assertTrue(default_storage.exists(referenced.file.name))
+
+    def test_deduplicate_deletes_only_unreferenced_copies(self):
+        original = self.legacy_material(b'handout', 'a.txt')
+        copy = self.legacy_material(b'handout', 'b.txt')
+        # Another material sharing the copy's file keeps it until it is moved too
+        CourseMaterial.objects.create(lesson=self.lesson, title='Shared', file=copy.file.name)
+        unique = self.legacy_material(b'syllabus', 'c.txt')
+
+        stats = deduplicate_materials()
+        self.assertEqual(stats, {'materials': 4, 'duplicates': 1, 'bytes_reclaimed': 7, 'missing': 0})
+        self.assertEqual(self.stored_files(), ['a.txt', 'c.txt'])
+        self.assertEqual(CourseMaterial.objects.filter(file=original.file.name).count(), 3)
+        self.assertEqual(MaterialBlob.objects.get(file=original.file.name).ref_count, 3)
+        self.assertEqual(MaterialBlob.objects.get(file=unique.file.name).ref_count, 1)
+
+
+class AsyncViewsTest(TestCase):
+    """The async views render and complete their flows on the async stack"""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        create_syllabus(self.course)
+        self.student = User.objects.create_user('student', email='student@example.com', password='password')
+
+    async def get_ok(self, url):
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    async def test_catalog_pages_render_with_cold_caches(self):
+        detail = reverse('courses:instructor_detail', args=[self.course.instructor_id])
+        urls = [reverse('courses:home'), reverse('courses:courses_list'), reverse('courses:instructors'), detail]
+        for url in urls + [reverse('courses:contact'), reverse('courses:register')]:
+            await self.get_ok(url)
+
+        outline = await sync_to_async(get_course_outline)(self.course)
+        self.assertContains(await self.get_ok(detail), f'{outline.total_hours}h')
+
+        await sync_to_async(cache.clear)()
+        await self.async_client.aforce_login(self.student)
+        for url in urls + [reverse('courses:contact')]:
+            self.assertContains(await self.get_ok(url), 'student')
+
+    @mock.patch('courses.views.send_welcome_email')
+    @mock.patch('courses.views.send_contact_form_email')
+    async def test_contact_and_register_send_email(self, send_contact_form_email, send_welcome_email):
+        response = await self.async_client.post(reverse('courses:contact'), {
+            'name': 'Ama', 'email': 'ama@example.com', 'subject': 'Hello', 'message': 'A question',
+        })
+        self.assertRedirects(response, reverse('courses:contact'), fetch_redirect_response=False)
+        send_contact_form_email.assert_called_once_with(
+            name='Ama', email='ama@example.com', subject='Hello', message='A question'
+        )
+
+        response = await self.async_client.post(reverse('courses:register'), {
+            'username': 'kofi', 'email': 'kofi@example.com', 'first_name': 'Kofi', 'last_name': 'Mensah',
+            'password1': 'a-long-passphrase', 'password2': 'a-long-passphrase',
+        })
+        self.assertRedirects(response, reverse('courses:dashboard'), fetch_redirect_response=False)
+        user = await User.objects.aget(username='kofi', profile__isnull=False)
+        send_welcome_email.assert_called_once_with(user)
+
+    def add_to_cart(self):
+        cart = Cart.objects.create(user=self.student)
+        CartItem.objects.create(cart=cart, course=self.course)
+
+    def charge(self, order):
+        return {
+            'status': 'success', 'amount': paystack.to_subunits(order.total_amount), 'currency': order.currency,
+            'id': 1234, 'channel': 'card', 'reference': order.order_id,
+        }
+
+    @mock.patch('courses.views.send_enrollment_email')
+    async def test_payment_is_initiated_and_verified(self, send_enrollment_email):
+        await sync_to_async(self.add_to_cart)()
+        await self.async_client.aforce_login(self.student)
+        initialize = mock.AsyncMock(return_value={'authorization_url': 'https://paystack.test/pay'})
+        with mock.patch.object(paystack, 'initialize_transaction', initialize):
+            response = await self.async_client.post(reverse('courses:initiate_payment'))
+        self.assertEqual(response.json()['authorization_url'], 'https://paystack.test/pay')
+
+        order = await Order.objects.aget(order_id=response.json()['reference'])
+        with mock.patch.object(paystack, 'verify_transaction', mock.AsyncMock(return_value=self.charge(order))):
+            response = await self.async_client.get(reverse('courses:payment_verify'), {'reference': order.order_id})
+        self.assertRedirects(response, reverse('courses:dashboard'), fetch_redirect_response=False)
+        self.assertTrue(await Enrollment.objects.filter(student=self.student, course=self.course).aexists())
+        self.assertFalse(await Cart.objects.filter(user=self.student).aexists())
+        send_enrollment_email.assert_called_once()
+
+    @override_settings(PAYSTACK_SECRET_KEY='secret')
+    @mock.patch('courses.views.send_enrollment_email')
+    async def test_webhook_checks_the_signature_and_fulfils_once(self, send_enrollment_email):
+        await sync_to_async(self.add_to_cart)()
+        order = await sync_to_async(payments.create_order_from_cart)(self.student)
+        body = json.dumps({'event': 'charge.success', 'data': self.charge(order)}).encode()
+        signature = hmac.new(b'secret', body, hashlib.sha512).hexdigest()
+        url = reverse('courses:paystack_webhook')
+
+        response = await self.async_client.post(url, body, content_type='application/json', headers={
+            'X-Paystack-Signature': 'forged',
+        })
+        self.assertEqual(response.status_code, 400)
+        for _ in range(2):
+            response = await self.async_client.post(url, body, content_type='application/json', headers={
+                'X-Paystack-Signature': signature,
+            })
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual((await Order.objects.aget(pk=order.pk)).status, 'completed')
+        self.assertTrue(await Enrollment.objects.filter(student=self.student, course=self.course).aexists())
+        send_enrollment_email.assert_called_once()
+
+
+class CatalogHttpCacheTest(TestCase):
+    """Validators, 304s and the public/private split of catalog pages"""
+
+    def setUp(self):
+        cache.clear()
+        create_course()
+        bump_catalog_version()
+        self.url = reverse('courses:courses_list')
+
+    def test_anonymous_pages_are_public_and_revalidate(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        bump_catalog_version()
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pages_for_a_session_are_private(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(User.objects.create_user('student', password='password'))
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertNotIn('ETag', response)
+
+    def test_course_pages_change_with_the_course(self):
+        url = reverse('courses:course_detail', args=['blasting'])
+        etag = self.client.get(url)['ETag']
+        course = Course.objects.get(slug='blasting')
+        course.price = 120
+        with self.captureOnCommitCallbacks(execute=True):
+            course.save()
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SalesAnalyticsTest(TestCase):
+    """Revenue buckets, exact totals for partial buckets, and invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user('buyer', password='password')
+        self.blasting = create_course('blasting')
+        self.drilling = create_course('drilling')
+
+    def sell(self, day, *items, status='completed'):
+        """An order completed at noon (local time) on `day` with (course, price) items"""
+        completed_at = timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=12))
+        order = Order.objects.create(
+            user=self.buyer, order_id=f'order-{Order.objects.count()}', status=status, completed_at=completed_at,
+            total_amount=sum(price for _, price in items),
+        )
+        for course, price in items:
+            OrderItem.objects.create(order=order, course=course, price=price)
+        return order
+
+    def revenue(self, rows):
+        return {row['id']: row['revenue'] for row in rows}
+
+    def test_courses_are_credited_with_their_own_price(self):
+        self.sell(date(2025, 10, 15), (self.blasting, 100), (self.drilling, 40))
+
+        by_course = analytics.sales_totals('course', date(2025, 10, 1), date(2025, 10, 31))
+        self.assertEqual(self.revenue(by_course), {self.blasting.pk: Decimal('100'), self.drilling.pk: Decimal('40')})
+        self.assertEqual([row['orders'] for row in by_course], [1, 1])
+
+        [total] = analytics.sales_totals('total', date(2025, 10, 1), date(2025, 10, 31))
+        self.assertEqual(total['revenue'], Decimal('140'))
+        self.assertEqual(total['items'], 2)
+        self.assertEqual(total['orders'], 1)
+
+    def test_sales_fall_in_the_bucket_of_their_day(self):
+        # 12 October 2025 is a Sunday and 31 October the last day of the month
+        self.sell(date(2025, 10, 12), (self.blasting, 10))
+        self.sell(date(2025, 10, 13), (self.blasting, 20))
+        self.sell(date(2025, 10, 31), (self.blasting, 30))
+        self.sell(date(2025, 11, 1), (self.blasting, 40))
+
+        weeks = analytics.sales_series('week', 'total', date(2025, 10, 12), date(2025, 10, 13))
+        self.assertEqual(
+            [(bucket['bucket'], [row['revenue'] for row in bucket['rows']]) for bucket in weeks],
+            [(date(2025, 10, 6), [Decimal('10')]), (date(2025, 10, 13), [Decimal('20')])],
+        )
+        months = analytics.sales_series('month', 'total', date(2025, 10, 31), date(2025, 11, 1))
+        self.assertEqual(
+            [(bucket['bucket'], [row['revenue'] for row in bucket['rows']]) for bucket in months],
+            [(date(2025, 10, 1), [Decimal('60')]), (date(2025, 11, 1), [Decimal('40')])],
+        )
+
+    def test_totals_only_count_the_days_asked_for(self):
+        self.sell(date(2025, 10, 3), (self.blasting, 1))
+        self.sell(date(2025, 10, 15), (self.blasting, 10))
+        self.sell(date(2025, 10, 16), (self.blasting, 20))
+        self.sell(date(2025, 10, 17), (self.blasting, 300))
+        self.sell(date(2025, 11, 20), (self.blasting, 4000))
+
+        def total(start, end, granularity):
+            rows = analytics.sales_totals('total', start, end, granularity)
+            return rows[0]['revenue'] if rows else Decimal('0')
+
+        self.assertEqual(total(date(2025, 10, 15), date(2025, 10, 16), 'month'), Decimal('30'))
+        self.assertEqual(total(date(2025, 10, 15), date(2025, 10, 16), 'week'), Decimal('30'))
+        self.assertEqual(total(date(2025, 10, 2), date(2025, 11, 30), 'month'), Decimal('4331'))
+        self.assertEqual(total(date(2025, 10, 4), date(2025, 11, 19), 'month'), Decimal('330'))
+        self.assertEqual(total(date(2025, 10, 1), date(2025, 10, 31), 'month'), Decimal('331'))
+        self.assertEqual(
+            analytics.clipped_spans(date(2025, 10, 15), date(2025, 12, 2), 'month'),
+            [
+                ('day', date(2025, 10, 15), date(2025, 10, 31)),
+                ('month', date(2025, 11, 1), date(2025, 11, 30)),
+                ('day', date(2025, 12, 1), date(2025, 12, 2)),
+            ],
+        )
+
+    def test_bucket_count_matches_the_buckets(self):
+        for start, end in ((date(2025, 10, 15), date(2025, 10, 15)), (date(2024, 2, 29), date(2025, 3, 2))):
+            for granularity in analytics.GRANULARITIES:
+                with self.subTest(start=start, end=end, granularity=granularity):
+                    self.assertEqual(
+                        analytics.bucket_count(start, end, granularity),
+                        len(analytics.buckets_between(start, end, granularity)),
+                    )
+
+    def test_endpoint_rejects_ranges_it_cannot_bucket(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        url = reverse('courses:admin_sales_analytics')
+        for params in (
+            {'granularity': 'day', 'start': '0001-01-01', 'end': '9999-12-31'},
+            {'granularity': 'month', 'start': '9999-12-01', 'end': '9999-12-31'},
+            {'granularity': 'week', 'end': '0001-01-02'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        response = self.client.get(url, {'granularity': 'week', 'start': '2025-10-15', 'end': '2025-10-16'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_editing_a_completed_order_recomputes_cached_buckets(self):
+        order = self.sell(date(2025, 10, 15), (self.blasting, 100), (self.drilling, 40))
+        october = (date(2025, 10, 1), date(2025, 10, 31))
+        self.assertEqual(analytics.sales_totals('total', *october)[0]['revenue'], Decimal('140'))
+
+        item = order.items.get(course=self.drilling)
+        item.price = 25
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertEqual(analytics.sales_totals('total', *october)[0]['revenue'], Decimal('125'))
+
+        order.status = 'refunded'
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(analytics.sales_totals('total', *october), [])
@@ -0,0 +1,209 @@
+"""
+Resumable chunked uploads for course materials.
+
+A client starts an upload with the file's name and size, then PUTs it in
+fixed-size chunks (MATERIAL_UPLOAD_CHUNK_SIZE, the last one shorter), each
+with the SHA-256 of its bytes. Chunks are streamed straight into a part file
+under MATERIAL_UPLOAD_TEMP_DIR, so an upload never holds more than one read
+buffer in memory. ``received_bytes`` is only moved forward once a chunk's
+checksum matches, which makes it the offset to resume from after a dropped
+connection: asking for the upload again returns it, and re-sending a chunk
+that already arrived is harmless. When every byte is in, the part file is
+stored as a content-addressed blob (courses/blobs.py) for a new
+CourseMaterial.
+
+Part files live on local disk, so with several app servers the temp dir
+must be shared or uploads pinned to one server.
+"""
+import hashlib
+import hmac
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .blobs import file_sha256, store_blob, use_blob
+from .models import CourseMaterial, MaterialUpload
+
+UPLOAD_READ_SIZE = 64 * 1024
+EXPIRE_BATCH_SIZE = 500
+
+
+class UploadError(Exception):
+    """An upload request that can't be accepted, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload_id):
+    return os.path.join(settings.MATERIAL_UPLOAD_TEMP_DIR, f'{upload_id}.part')
+
+
+def start_upload(user, lesson, title, filename, total_size, sha256=''):
+    """Begin an upload, or return the user's unfinished upload of the same file to resume"""
+    if total_size <= 0:
+        raise UploadError('The file is empty')
+    if total_size > settings.MATERIAL_UPLOAD_MAX_BYTES:
+        raise UploadError(f'Files can be at most {settings.MATERIAL_UPLOAD_MAX_BYTES} bytes', 413)
+    filename = get_valid_filename(os.path.basename(filename or ''))
+    if not filename:
+        raise UploadError('A file name is required')
+
+    existing = MaterialUpload.objects.filter(
+        uploaded_by=user, lesson=lesson, filename=filename, total_size=total_size, status='uploading'
+    ).first()
+    if existing is not None:
+        return existing
+
+    return MaterialUpload.objects.create(
+        uploaded_by=user,
+        lesson=lesson,
+        title=title or os.path.splitext(filename)[0],
+        filename=filename,
+        total_size=total_size,
+        chunk_size=settings.MATERIAL_UPLOAD_CHUNK_SIZE,
+        sha256=(sha256 or '').lower(),
+    )
+
+
+def chunk_bounds(upload, index):
+    """(offset, length) of a chunk"""
+    if index < 0 or index >= upload.chunk_count:
+        raise UploadError(f'Chunk {index} is out of range', 404)
+    offset = index * upload.chunk_size
+    return offset, min(upload.chunk_size, upload.total_size - offset)
+
+
+def write_chunk(upload, index, stream, content_length, checksum):
+    """
+    Stream one chunk from a request body into the part file and return the new
+    resume offset. Chunks must arrive in order; a chunk that was already
+    received is accepted again without being rewritten.
+    """
+    if upload.status != 'uploading':
+        raise UploadError('This upload is no longer in progress', 409)
+    offset, length = chunk_bounds(upload, index)
+    if offset < upload.received_bytes:
+        return upload.received_bytes
+    if offset > upload.received_bytes:
+        raise UploadError(f'Expected the chunk at offset {upload.received_bytes}', 409)
+    if content_length != length:
+        raise UploadError(f'Chunk {index} must be {length} bytes')
+    if not checksum:
+        raise UploadError('The chunk checksum is missing')
+
+    os.makedirs(settings.MATERIAL_UPLOAD_TEMP_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    position = offset
+    remaining = length
+    fd = os.open(part_path(upload.id), os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        while remaining:
+            data = stream.read(min(UPLOAD_READ_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, position)
+                view = view[written:]
+                position += written
+            remaining -= len(data)
+    finally:
+        os.close(fd)
+
+    if remaining:
+        raise UploadError(f'Chunk {index} ended {remaining} bytes early')
+    if not hmac.compare_digest(digest.hexdigest(), checksum.lower()):
+        raise UploadError(f'Chunk {index} does not match its checksum', 422)
+
+    # Only the first request to deliver this chunk moves the offset on
+    MaterialUpload.objects.filter(pk=upload.pk, status='uploading', received_bytes=offset).update(
+        received_bytes=offset + length, updated_at=timezone.now()
+    )
+    return MaterialUpload.objects.values_list('received_bytes', flat=True).get(pk=upload.pk)
+
+
+def complete_upload(upload):
+    """Store the assembled file and create its CourseMaterial"""
+    if upload.status == 'completed':
+        return upload.material
+    if upload.status != 'uploading':
+        raise UploadError('This upload was aborted', 409)
+    if upload.received_bytes != upload.total_size:
+        raise UploadError(f'Only {upload.received_bytes} of {upload.total_size} bytes were received', 409)
+
+    path = part_path(upload.id)
+    os.truncate(path, upload.total_size)
+    with open(path, 'rb') as part:
+        sha256, _ = file_sha256(part)
+    if upload.sha256 and not hmac.compare_digest(sha256, upload.sha256):
+        abort_upload(upload)
+        raise UploadError('The file does not match its checksum', 422)
+
+    with transaction.atomic():
+        upload = MaterialUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.status == 'completed':
+            return upload.material
+        # Files that are already stored (by content) are not sent to the storage backend again
+        with open(path, 'rb') as part:
+            blob = store_blob(File(part, name=upload.filename), upload.filename, sha256=sha256)
+        material = CourseMaterial(lesson_id=upload.lesson_id, title=upload.title)
+        use_blob(material, blob, upload.filename)
+        material.save()
+        upload.status = 'completed'
+        upload.material = material
+        upload.save(update_fields=['status', 'material', 'updated_at'])
+
+    transaction.on_commit(lambda: _remove_part(path))
+    return material
+
+
+def _remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def abort_upload(upload):
+    MaterialUpload.objects.filter(pk=upload.pk, status='uploading').update(status='aborted', updated_at=timezone.now())
+    _remove_part(part_path(upload.id))
+
+
+def expire_uploads(hours):
+    """Delete unfinished uploads (and their part files) idle for more than `hours`"""
+    cutoff = timezone.now() - timedelta(hours=hours)
+    stale = MaterialUpload.objects.filter(status__in=['uploading', 'aborted'], updated_at__lt=cutoff)
+    upload_ids = list(stale.values_list('pk', flat=True))
+    expired = 0
+    for start in range(0, len(upload_ids), EXPIRE_BATCH_SIZE):
+        batch = upload_ids[start:start + EXPIRE_BATCH_SIZE]
+        # An upload that received a chunk since the query above is no longer stale and keeps its part file
+        stale.filter(pk__in=batch).delete()
+        remaining = set(MaterialUpload.objects.filter(pk__in=batch).values_list('pk', flat=True))
+        for upload_id in batch:
+            if upload_id not in remaining:
+                _remove_part(part_path(upload_id))
+                expired += 1
+    return expired
+
+
+def serialize_upload(upload):
+    return {
+        'id': str(upload.id),
+        'filename': upload.filename,
+        'size': upload.total_size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'offset': upload.received_bytes,
+        'next_chunk': upload.received_bytes // upload.chunk_size,
+        'status': upload.status,
+        'material_id': upload.material_id,
+    }
@@ -25,6 +25,8 @@ urlpatterns = [
     path('course/<slug:slug>/content/', views.course_content, name='course_content'),
     path('course/<slug:course_slug>/lesson/<int:lesson_id>/', views.lesson_view, name='lesson_view'),
     path('lesson/<int:lesson_id>/complete/', views.mark_lesson_complete, name='mark_lesson_complete'),
+    path('material/<int:material_id>/download/', views.download_material, name='download_material'),
+    path('progress/events/', views.record_progress_events, name='record_progress_events'),
 
     # Shopping Cart
     path('cart/', views.cart_view, name='cart'),
@@ -39,11 +41,14 @@ urlpatterns = [
 
     # Reviews
     path('course/<slug:slug>/review/', views.add_review, name='add_review'),
+    path('course/<slug:slug>/reviews/', views.course_reviews, name='course_reviews'),
     path('review/<int:review_id>/edit/', views.edit_review, name='edit_review'),
 
     # Discussions
     path('course/<slug:slug>/discussions/', views.course_discussions, name='course_discussions'),
     path('discussion/<int:discussion_id>/', views.discussion_detail, name='discussion_detail'),
+    path('discussion/<int:discussion_id>/replies/new/', views.discussion_new_replies, name='discussion_new_replies'),
+    path('discussion/<int:discussion_id>/replies/stream/', views.discussion_reply_stream, name='discussion_reply_stream'),
     path('course/<slug:slug>/discussion/new/', views.create_discussion, name='create_discussion'),
 
     # Certificates
@@ -102,4 +107,16 @@ urlpatterns = [
     path('custom-admin/categories/create/', admin_views.admin_create_category, name='admin_create_category'),
     path('custom-admin/categories/<int:category_id>/edit/', admin_views.admin_edit_category, name='admin_edit_category'),
     path('custom-admin/categories/<int:category_id>/delete/', admin_views.admin_delete_category, name='admin_delete_category'),
+
+    # Chunked material uploads
+    path('custom-admin/uploads/', admin_views.admin_start_material_upload, name='admin_start_material_upload'),
+    path('custom-admin/uploads/<uuid:upload_id>/', admin_views.admin_material_upload, name='admin_material_upload'),
+    path('custom-admin/uploads/<uuid:upload_id>/chunks/<int:index>/', admin_views.admin_upload_chunk, name='admin_upload_chunk'),
+    path('custom-admin/uploads/<uuid:upload_id>/complete/', admin_views.admin_complete_material_upload, name='admin_complete_material_upload'),
+
+    # Sales analytics
+    path('custom-admin/sales/', admin_views.admin_sales_analytics, name='admin_sales_analytics'),
+
+    # Database
+    path('custom-admin/database/pool/', admin_views.admin_database_pool, name='admin_database_pool'),
 ]
@@ -1,19 +1,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import login, logout, authenticate
+from django.contrib.auth import login, logout, authenticate, alogin
 from django.contrib import messages
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse, StreamingHttpResponse, Http404
+from django.core.files import File
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
+from django.db import transaction
 from django.db.models import Q, Avg, Count, Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.conf import settings
+from asgiref.sync import sync_to_async
 import json
-import requests
 
 from .models import (
-    Course, Instructor, Category, Enrollment, UserProfile, Section, Lesson,
-    LessonProgress, Cart, CartItem, Order, OrderItem, Review, Discussion,
+    Course, Instructor, Category, Enrollment, UserProfile, Lesson,
+    LessonProgress, Cart, CartItem, Order, Review, Discussion,
     DiscussionReply, Certificate, CourseMaterial
 )
 from .forms import (
@@ -24,16 +28,64 @@ from .utils import (
     send_welcome_email, send_enrollment_email, send_certificate_email,
     send_contact_form_email, generate_certificate_pdf
 )
+from . import paystack
+from .payments import create_order_from_cart, fulfil_order, fail_order
+from .access import is_enrolled, get_course_id_or_404, get_course_header_or_404
+from .outline import get_course_outline
+from .downloads import serve_protected_file
+from .database import use_primary
+from .http_cache import catalog_page
+from .pagination import InvalidCursor
+from .discussions import (
+    get_discussion_page, get_reply_page, get_new_replies, serialize_reply,
+    reply_event_stream, reply_page_count
+)
+from .reviews import get_review_page, lazy_review_page, serialize_review, REVIEWS_PAGE_SIZE
+from .progress import (
+    get_progress_bitmap, record_lesson_viewed, record_lesson_completed,
+    ingest_progress_events, note_lesson_viewed, MAX_PROGRESS_EVENTS
+)
+
+# Async views use the async ORM and must not leave lazy queries for the template:
+# querysets are evaluated up front and the user is loaded before rendering.
+# Emails are sent off the shared sync thread (thread_sensitive=False).
+
+async def _aload_user(request):
+    """Load the user asynchronously and pin it on the request for templates"""
+    user = await request.auser()
+    request.user = user
+    return user
+
+def _send_in_thread(func):
+    """Run a blocking email helper in a worker thread of its own"""
+    return sync_to_async(func, thread_sensitive=False)
+
+def _attach_outlines(courses):
+    """Set course.outline on each course (outlines are built from the database on a cache miss)"""
+    for course in courses:
+        course.outline = get_course_outline(course)
+
+def _course_page_validators(request, slug):
+    """A course page changes with the catalog and with the course itself"""
+    header = get_course_header_or_404(slug)
+    return (header.id,), header.updated_at
+
+def _instructor_page_validators(request, instructor_id):
+    """An instructor page changes with the catalog"""
+    return (instructor_id,), None
 
 # ============================================================================
 # PUBLIC VIEWS
 # ============================================================================
 
-def home(request):
+@catalog_page()
+async def home(request):
     """Homepage with featured courses"""
-    featured_courses = Course.objects.filter(is_featured=True).select_related('instructor')[:6]
-    total_courses = Course.objects.count()
-    total_instructors = Instructor.objects.count()
+    await _aload_user(request)
+    featured = Course.objects.filter(is_featured=True).select_related('instructor', 'category')[:6]
+    featured_courses = [course async for course in featured]
+    total_courses = await Course.objects.acount()
+    total_instructors = await Instructor.objects.acount()
 
     context = {
         'featured_courses': featured_courses,
@@ -42,13 +94,15 @@ def home(request):
     }
     return render(request, 'home.html', context)
 
-def courses_list(request):
+@catalog_page()
+async def courses_list(request):
     """Course catalog with search and filtering"""
+    await _aload_user(request)
     courses = Course.objects.all().select_related('instructor', 'category').annotate(
         avg_rating=Avg('reviews__rating'),
         enrollment_count=Count('enrollments')
     )
-    categories = Category.objects.all()
+    categories = [category async for category in Category.objects.all()]
 
     # Search
     search_query = request.GET.get('search', '')
@@ -90,7 +144,7 @@ def courses_list(request):
         courses = courses.order_by(sort_by)
 
     context = {
-        'courses': courses,
+        'courses': [course async for course in courses],
         'categories': categories,
         'search_query': search_query,
         'category_filter': category_filter,
@@ -99,19 +153,20 @@ def courses_list(request):
     }
     return render(request, 'courses/courses_list.html', context)
 
+@catalog_page(_course_page_validators)
 def course_detail(request, slug):
     """Course detail page with reviews"""
-    course = get_object_or_404(Course, slug=slug)
-    reviews = course.reviews.select_related('student').all()
-    sections = Section.objects.filter(course=course).prefetch_related('lessons').order_by('order')
+    course = get_object_or_404(Course.objects.select_related('rating_summary'), pk=get_course_id_or_404(slug))
+    rating_summary = course.get_rating_summary()
+    outline = get_course_outline(course)
 
     # Check if user is enrolled
-    is_enrolled = False
+    enrolled = False
     user_review = None
     in_cart = False
     is_in_wishlist = False
     if request.user.is_authenticated:
-        is_enrolled = Enrollment.objects.filter(student=request.user, course=course).exists()
+        enrolled = is_enrolled(request.user, course.id)
         user_review = Review.objects.filter(student=request.user, course=course).first()
         cart = Cart.objects.filter(user=request.user).first()
         if cart:
@@ -119,28 +174,47 @@ def course_detail(request, slug):
 
     context = {
         'course': course,
-        'reviews': reviews,
-        'sections': sections,
-        'is_enrolled': is_enrolled,
+        'review_page': lazy_review_page(course),
+        'rating_summary': rating_summary,
+        'outline': outline,
+        'sections': outline.sections,
+        'is_enrolled': enrolled,
         'user_review': user_review,
         'in_cart': in_cart,
         'is_in_wishlist': is_in_wishlist,
-        'average_rating': course.get_average_rating(),
-        'rating_count': course.get_rating_count(),
+        'average_rating': rating_summary.average,
+        'rating_count': rating_summary.rating_count,
         'enrollment_count': course.get_enrollment_count(),
     }
     return render(request, 'courses/course_detail.html', context)
 
+def course_reviews(request, slug):
+    """Next page of a course's reviews as JSON (load more)"""
+    course_id = get_course_id_or_404(slug)
+
+    try:
+        limit = int(request.GET.get('limit', REVIEWS_PAGE_SIZE))
+        reviews, next_cursor = get_review_page(course_id, request.GET.get('cursor'), limit)
+    except (ValueError, InvalidCursor):
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+    return JsonResponse({
+        'reviews': [serialize_review(review) for review in reviews],
+        'next_cursor': next_cursor,
+    })
+
+@catalog_page()
 def about(request):
     """About page"""
     return render(request, 'about.html')
 
-def contact(request):
+async def contact(request):
     """Contact page with form"""
+    await _aload_user(request)
     if request.method == 'POST':
         form = ContactForm(request.POST)
         if form.is_valid():
-            send_contact_form_email(
+            await _send_in_thread(send_contact_form_email)(
                 name=form.cleaned_data['name'],
                 email=form.cleaned_data['email'],
                 subject=form.cleaned_data['subject'],
@@ -153,34 +227,47 @@ def contact(request):
 
     return render(request, 'contact.html', {'form': form})
 
-def instructors_list(request):
+@catalog_page()
+async def instructors_list(request):
     """Instructor listing page"""
+    await _aload_user(request)
     instructors = Instructor.objects.all().annotate(
         course_count=Count('courses')
     )
     context = {
-        'instructors': instructors,
+        'instructors': [instructor async for instructor in instructors],
     }
     return render(request, 'instructors.html', context)
 
-def instructor_detail(request, instructor_id):
+@catalog_page(_instructor_page_validators)
+async def instructor_detail(request, instructor_id):
     """Instructor profile page with their courses"""
-    instructor = get_object_or_404(Instructor, id=instructor_id)
+    await _aload_user(request)
+    instructor = await Instructor.objects.filter(id=instructor_id).afirst()
+    if instructor is None:
+        raise Http404('Instructor not found')
 
     # Get all courses by this instructor with ratings and enrollment counts
-    courses = Course.objects.filter(instructor=instructor).annotate(
+    courses = [course async for course in Course.objects.filter(instructor=instructor).select_related(
+        'instructor', 'category'
+    ).annotate(
         avg_rating=Avg('reviews__rating'),
         enrollment_count=Count('enrollments')
-    )
+    )]
+    await sync_to_async(_attach_outlines)(courses)
 
     # Calculate instructor stats
-    total_students = Enrollment.objects.filter(course__instructor=instructor).values('student').distinct().count()
-    course_count = courses.count()
+    total_students = await Enrollment.objects.filter(
+        course__instructor=instructor
+    ).values('student').distinct().acount()
+    course_count = len(courses)
 
     # Calculate average rating across all instructor's courses
-    all_reviews = Review.objects.filter(course__instructor=instructor)
-    avg_instructor_rating = all_reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-    total_reviews = all_reviews.count()
+    review_stats = await Review.objects.filter(course__instructor=instructor).aaggregate(
+        average=Avg('rating'), total=Count('id')
+    )
+    avg_instructor_rating = review_stats['average'] or 0
+    total_reviews = review_stats['total']
 
     context = {
         'instructor': instructor,
@@ -196,20 +283,27 @@ def instructor_detail(request, instructor_id):
 # AUTHENTICATION VIEWS
 # ============================================================================
 
-def register(request):
+def _create_account(form):
+    """Save a valid registration form and the user's profile together"""
+    with transaction.atomic():
+        user = form.save()
+        UserProfile.objects.create(user=user)
+    return user
+
+async def register(request):
     """User registration"""
-    if request.user.is_authenticated:
+    if (await _aload_user(request)).is_authenticated:
         return redirect('courses:dashboard')
 
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
-        if form.is_valid():
-            user = form.save()
-            # Create user profile automatically
-            UserProfile.objects.create(user=user)
-            login(request, user)
+        # Validation checks the username/email against the database
+        if await sync_to_async(form.is_valid)():
+            user = await sync_to_async(_create_account)(form)
+            await alogin(request, user)
+            request.user = user
             # Send welcome email
-            send_welcome_email(user)
+            await _send_in_thread(send_welcome_email)(user)
             messages.success(request, 'Registration successful! Welcome to E-miningCampus.')
             return redirect('courses:dashboard')
     else:
@@ -313,79 +407,114 @@ def dashboard(request):
 @login_required
 def course_content(request, slug):
     """View course content - only for enrolled students"""
-    course = get_object_or_404(Course, slug=slug)
-    enrollment = Enrollment.objects.filter(student=request.user, course=course).first()
+    course_id = get_course_id_or_404(slug)
+    enrollment = None
+    if is_enrolled(request.user, course_id):
+        enrollment = Enrollment.objects.select_related('course__instructor').filter(
+            student=request.user, course_id=course_id
+        ).first()
 
     if not enrollment:
         messages.error(request, 'You must be enrolled to access course content.')
         return redirect('courses:course_detail', slug=slug)
 
-    sections = Section.objects.filter(course=course).prefetch_related('lessons')
+    course = enrollment.course
+    outline = get_course_outline(course)
+    progress_map = get_progress_bitmap(request.user, outline)
 
     # Calculate progress
     enrollment.calculate_progress()
 
     context = {
         'course': course,
-        'sections': sections,
+        'outline': outline,
+        'sections': outline.sections,
         'enrollment': enrollment,
+        'completed_lesson_ids': progress_map.completed_ids,
+        'resume_lesson_id': progress_map.resume_lesson_id,
     }
     return render(request, 'courses/course_content.html', context)
 
 @login_required
 def lesson_view(request, course_slug, lesson_id):
     """View individual lesson"""
-    course = get_object_or_404(Course, slug=course_slug)
-    lesson = get_object_or_404(Lesson, id=lesson_id)
+    course_id = get_course_id_or_404(course_slug)
+    outline = get_course_outline(course_id)
+    outline_lesson = outline.get_lesson(lesson_id)
+    if outline_lesson is None:
+        raise Http404('Lesson not found')
 
     # Check if student is enrolled or lesson is preview
-    enrollment = Enrollment.objects.filter(student=request.user, course=course).first()
-    if not enrollment and not lesson.is_preview:
+    enrolled = is_enrolled(request.user, course_id)
+    if not enrolled and not outline_lesson.is_preview:
         messages.error(request, 'You must be enrolled to access this lesson.')
         return redirect('courses:course_detail', slug=course_slug)
 
-    # Track progress
-    progress = None
-    if enrollment:
-        progress, created = LessonProgress.objects.get_or_create(
-            student=request.user,
-            lesson=lesson
-        )
+    lesson = get_object_or_404(Lesson.objects.select_related('section__course'), id=lesson_id)
+    course = lesson.section.course
 
-    # Get all sections for navigation
-    sections = Section.objects.filter(course=course).prefetch_related('lessons')
+    # Track progress (views are coalesced in the cache and flushed by flush_lesson_views)
+    completed_lesson_ids = frozenset()
+    if enrolled:
+        note_lesson_viewed(request.user, lesson.id)
+        completed_lesson_ids = record_lesson_viewed(request.user, outline, lesson.id).completed_ids
 
-    # Get course materials
-    materials = CourseMaterial.objects.filter(lesson=lesson)
+    # Get course materials (skip the query when the outline says there are none)
+    materials = []
+    if outline_lesson.material_count:
+        materials = list(CourseMaterial.objects.filter(lesson=lesson))
 
     context = {
         'course': course,
         'lesson': lesson,
-        'sections': sections,
-        'enrollment': enrollment,
-        'progress': progress,
+        'outline': outline,
+        'sections': outline.sections,
+        'previous_lesson': outline.previous_lesson(lesson.id),
+        'next_lesson': outline.next_lesson(lesson.id),
+        'is_enrolled': enrolled,
+        'lesson_completed': lesson.id in completed_lesson_ids,
+        'completed_lesson_ids': completed_lesson_ids,
         'materials': materials,
     }
     return render(request, 'courses/lesson_detail.html', context)
 
+@login_required
+def download_material(request, material_id):
+    """Download a lesson material - only for enrolled students (or on preview lessons)"""
+    material = get_object_or_404(
+        CourseMaterial.objects.select_related('lesson__section'), id=material_id
+    )
+    lesson = material.lesson
+    if not lesson.is_preview and not is_enrolled(request.user, lesson.section.course_id):
+        raise Http404('Material not found')
+
+    return serve_protected_file(request, material.file, material.download_filename)
+
+@use_primary
 @login_required
 @require_POST
 def mark_lesson_complete(request, lesson_id):
     """Mark a lesson as completed"""
-    lesson = get_object_or_404(Lesson, id=lesson_id)
-    enrollment = Enrollment.objects.filter(
-        student=request.user,
-        course=lesson.section.course
-    ).first()
+    lesson = get_object_or_404(Lesson.objects.select_related('section'), id=lesson_id)
+    enrollment = None
+    if is_enrolled(request.user, lesson.section.course_id):
+        enrollment = Enrollment.objects.select_related('course').filter(
+            student=request.user, course_id=lesson.section.course_id
+        ).first()
 
     if enrollment:
+        now = timezone.now()
         progress, created = LessonProgress.objects.get_or_create(
             student=request.user,
-            lesson=lesson
+            lesson=lesson,
+            defaults={'completed': True, 'completed_at': now, 'last_viewed': now}
         )
-        progress.completed = True
-        progress.completed_at = timezone.now()
-        progress.save()
+        if not created and not progress.completed:
+            progress.completed = True
+            progress.completed_at = now
+            progress.last_viewed = now
+            progress.save(update_fields=['completed', 'completed_at', 'last_viewed'])
+        record_lesson_completed(request.user, get_course_outline(enrollment.course_id), lesson.id)
 
         # Recalculate course progress
         enrollment.calculate_progress()
@@ -393,12 +522,31 @@ def mark_lesson_complete(request, lesson_id):
         messages.success(request, f'Lesson "{lesson.title}" marked as complete!')
 
         return redirect('courses:lesson_view',
-                       course_slug=lesson.section.course.slug,
+                       course_slug=enrollment.course.slug,
                        lesson_id=lesson.id)
 
     messages.error(request, 'You must be enrolled to mark lessons as complete.')
     return redirect('courses:home')
 
+@login_required
+@require_POST
+def record_progress_events(request):
+    """Batch ingestion of queued client progress events (viewed, watched, completed)"""
+    try:
+        events = json.loads(request.body)['events']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+
+    if not isinstance(events, list) or len(events) > MAX_PROGRESS_EVENTS:
+        return JsonResponse({'error': f'Send a list of at most {MAX_PROGRESS_EVENTS} events'}, status=400)
+
+    try:
+        result = ingest_progress_events(request.user, events)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'status': 'success', **result})
+
 # ============================================================================
 # SHOPPING CART & PAYMENT
 # ============================================================================
@@ -423,7 +571,7 @@ def add_to_cart(request, course_id):
     course = get_object_or_404(Course, id=course_id)
 
     # Check if already enrolled
-    if Enrollment.objects.filter(student=request.user, course=course).exists():
+    if is_enrolled(request.user, course.id):
         messages.warning(request, 'You are already enrolled in this course.')
         return redirect('courses:course_detail', slug=course.slug)
 
@@ -447,6 +595,7 @@ def remove_from_cart(request, item_id):
     messages.success(request, f'{course_title} removed from cart.')
     return redirect('courses:cart')
 
+@use_primary
 @login_required
 def checkout(request):
     """Checkout page"""
@@ -467,150 +616,85 @@ def checkout(request):
 
 @login_required
 @require_POST
-def initiate_payment(request):
+async def initiate_payment(request):
     """Initiate Paystack payment"""
-    cart = get_object_or_404(Cart, user=request.user)
-
-    if not cart.items.exists():
+    user = await request.auser()
+    order = await sync_to_async(create_order_from_cart)(user)
+    if order is None:
         return JsonResponse({'error': 'Cart is empty'}, status=400)
 
-    # Create order
-    order = Order()
-    order.user = request.user
-    order.order_id = order.generate_order_id()
-    order.total_amount = cart.get_total()
-    order.currency = 'GHS'
-    order.status = 'pending'
-    order.save()
-
-    # Add order items
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
-            order=order,
-            course=cart_item.course,
-            price=cart_item.course.price
+    try:
+        data = await paystack.initialize_transaction(
+            email=user.email,
+            amount=order.total_amount,
+            reference=order.order_id,
+            callback_url=request.build_absolute_uri(reverse('courses:payment_verify')),
         )
+    except paystack.PaystackError as e:
+        await sync_to_async(fail_order)(order.pk)
+        return JsonResponse({'error': f'Payment initialization failed: {e}'}, status=502)
 
-    # Initialize Paystack payment
-    url = "https://api.paystack.co/transaction/initialize"
-    headers = {
-        "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "email": request.user.email,
-        "amount": int(order.total_amount * 100),  # Paystack uses pesewas (GHS * 100)
-        "reference": order.order_id,
-        "callback_url": request.build_absolute_uri('/payment/verify/')
-    }
-
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        result = response.json()
-
-        if result['status']:
-            return JsonResponse({
-                'authorization_url': result['data']['authorization_url'],
-                'reference': order.order_id
-            })
-        else:
-            order.status = 'failed'
-            order.save()
-            return JsonResponse({'error': 'Payment initialization failed'}, status=400)
-    except Exception as e:
-        order.status = 'failed'
-        order.save()
-        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({
+        'authorization_url': data['authorization_url'],
+        'reference': order.order_id
+    })
 
 @csrf_exempt
-def paystack_webhook(request):
+@require_POST
+async def paystack_webhook(request):
     """Handle Paystack webhook for payment verification"""
-    if request.method == 'POST':
+    if not paystack.valid_webhook_signature(request.body, request.headers.get('X-Paystack-Signature')):
+        return JsonResponse({'error': 'Invalid signature'}, status=400)
+    try:
         payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid request'}, status=400)
 
-        if payload['event'] == 'charge.success':
-            reference = payload['data']['reference']
-
-            try:
-                order = Order.objects.get(order_id=reference)
-                order.status = 'completed'
-                order.payment_reference = payload['data']['id']
-                order.payment_method = payload['data']['channel']
-                order.completed_at = timezone.now()
-                order.save()
-
-                # Enroll user in courses
-                for order_item in order.items.all():
-                    Enrollment.objects.get_or_create(
-                        student=order.user,
-                        course=order_item.course
-                    )
-
-                # Clear cart
-                Cart.objects.filter(user=order.user).delete()
-
-                # Send confirmation email
-                send_enrollment_email(order.user, order)
+    if payload.get('event') == 'charge.success':
+        data = payload.get('data') or {}
+        order = await Order.objects.filter(order_id=data.get('reference')).afirst()
+        if order is not None and paystack.is_successful_charge(data, order):
+            order = await sync_to_async(fulfil_order)(order.pk, data.get('id'), data.get('channel'))
+            if order is not None:
+                await _send_in_thread(send_enrollment_email)(order.user, order)
 
-            except Order.DoesNotExist:
-                pass
-
-        return JsonResponse({'status': 'success'})
-
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return JsonResponse({'status': 'success'})
 
+@use_primary
 @login_required
-def payment_verify(request):
+async def payment_verify(request):
     """Verify payment and show result"""
+    user = await _aload_user(request)
     reference = request.GET.get('reference')
 
     if not reference:
         messages.error(request, 'Invalid payment reference.')
         return redirect('courses:cart')
 
-    try:
-        order = Order.objects.get(order_id=reference, user=request.user)
-
-        # Verify with Paystack
-        url = f"https://api.paystack.co/transaction/verify/{reference}"
-        headers = {"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"}
-        response = requests.get(url, headers=headers)
-        result = response.json()
-
-        if result['status'] and result['data']['status'] == 'success':
-            order.status = 'completed'
-            order.payment_reference = result['data']['id']
-            order.payment_method = result['data']['channel']
-            order.completed_at = timezone.now()
-            order.save()
-
-            # Enroll in courses
-            for order_item in order.items.all():
-                Enrollment.objects.get_or_create(
-                    student=order.user,
-                    course=order_item.course
-                )
-
-            # Clear cart
-            Cart.objects.filter(user=order.user).delete()
-
-            # Send enrollment email
-            send_enrollment_email(order.user, order)
-
-            messages.success(request, 'Payment successful! You have been enrolled in your courses.')
-            return redirect('courses:dashboard')
-        else:
-            order.status = 'failed'
-            order.save()
+    order = await Order.objects.filter(order_id=reference, user=user).afirst()
+    if order is None:
+        messages.error(request, 'Order not found.')
+        return redirect('courses:cart')
+
+    # The webhook may already have fulfilled it
+    if order.status != 'completed':
+        try:
+            data = await paystack.verify_transaction(reference)
+        except paystack.PaystackError as e:
+            messages.error(request, f'Error verifying payment: {e}')
+            return redirect('courses:cart')
+
+        if not paystack.is_successful_charge(data, order):
+            await sync_to_async(fail_order)(order.pk)
             messages.error(request, 'Payment verification failed.')
             return redirect('courses:cart')
 
-    except Order.DoesNotExist:
-        messages.error(request, 'Order not found.')
-        return redirect('courses:cart')
-    except Exception as e:
-        messages.error(request, f'Error verifying payment: {str(e)}')
-        return redirect('courses:cart')
+        fulfilled = await sync_to_async(fulfil_order)(order.pk, data.get('id'), data.get('channel'))
+        if fulfilled is not None:
+            await _send_in_thread(send_enrollment_email)(fulfilled.user, fulfilled)
+
+    messages.success(request, 'Payment successful! You have been enrolled in your courses.')
+    return redirect('courses:dashboard')
 
 # ============================================================================
 # REVIEWS
@@ -619,16 +703,15 @@ def payment_verify(request):
 @login_required
 def add_review(request, slug):
     """Add review for a course"""
-    course = get_object_or_404(Course, slug=slug)
+    course_id = get_course_id_or_404(slug)
 
     # Check if user is enrolled
-    enrollment = Enrollment.objects.filter(student=request.user, course=course).first()
-    if not enrollment:
+    if not is_enrolled(request.user, course_id):
         messages.error(request, 'You must be enrolled to review this course.')
         return redirect('courses:course_detail', slug=slug)
 
     # Check if already reviewed
-    if Review.objects.filter(student=request.user, course=course).exists():
+    if Review.objects.filter(student=request.user, course_id=course_id).exists():
         messages.warning(request, 'You have already reviewed this course.')
         return redirect('courses:course_detail', slug=slug)
 
@@ -637,7 +720,7 @@ def add_review(request, slug):
         if form.is_valid():
             review = form.save(commit=False)
             review.student = request.user
-            review.course = course
+            review.course_id = course_id
             review.save()
             messages.success(request, 'Thank you for your review!')
             return redirect('courses:course_detail', slug=slug)
@@ -646,7 +729,7 @@ def add_review(request, slug):
 
     context = {
         'form': form,
-        'course': course,
+        'course': get_object_or_404(Course.objects.select_related('instructor'), pk=course_id),
     }
     return render(request, 'courses/add_review.html', context)
 
@@ -678,35 +761,38 @@ def edit_review(request, review_id):
 @login_required
 def course_discussions(request, slug):
     """View all discussions for a course"""
-    course = get_object_or_404(Course, slug=slug)
+    course = get_course_header_or_404(slug)
 
     # Check if enrolled
-    enrollment = Enrollment.objects.filter(student=request.user, course=course).first()
-    if not enrollment:
+    if not is_enrolled(request.user, course.id):
         messages.error(request, 'You must be enrolled to access discussions.')
         return redirect('courses:course_detail', slug=slug)
 
-    discussions = course.discussions.select_related('author').all()
+    try:
+        discussions, next_cursor = get_discussion_page(course.id, request.GET.get('cursor'))
+    except InvalidCursor:
+        return redirect('courses:course_discussions', slug=slug)
 
     context = {
         'course': course,
         'discussions': discussions,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'courses/discussions.html', context)
 
 @login_required
 def discussion_detail(request, discussion_id):
     """View single discussion with replies"""
-    discussion = get_object_or_404(Discussion, id=discussion_id)
+    discussion = get_object_or_404(
+        Discussion.objects.select_related('author', 'course__instructor'), id=discussion_id
+    )
 
     # Check if enrolled
-    enrollment = Enrollment.objects.filter(student=request.user, course=discussion.course).first()
-    if not enrollment:
+    if not is_enrolled(request.user, discussion.course_id):
         messages.error(request, 'You must be enrolled to access discussions.')
         return redirect('courses:course_detail', slug=discussion.course.slug)
 
-    replies = discussion.replies.select_related('author').all()
-
     if request.method == 'POST':
         form = DiscussionReplyForm(request.POST)
         if form.is_valid():
@@ -714,29 +800,87 @@ def discussion_detail(request, discussion_id):
             reply.discussion = discussion
             reply.author = request.user
             # Check if user is instructor
-            reply.is_instructor_reply = (discussion.course.instructor.user == request.user)
+            reply.is_instructor_reply = (discussion.course.instructor.user_id == request.user.id)
             reply.save()
             messages.success(request, 'Reply posted successfully!')
-            return redirect('courses:discussion_detail', discussion_id=discussion.id)
+            # Land on the last page, where the new reply is
+            discussion.refresh_from_db(fields=['reply_count'])
+            url = reverse('courses:discussion_detail', args=[discussion.id])
+            return redirect(f'{url}?page={reply_page_count(discussion)}#reply-{reply.id}')
     else:
         form = DiscussionReplyForm()
 
+    replies, page_number, page_count = get_reply_page(discussion, request.GET.get('page'))
+
     context = {
         'discussion': discussion,
         'replies': replies,
+        'page_number': page_number,
+        'page_count': page_count,
+        'is_last_page': page_number == page_count,
+        'last_reply_id': replies[-1].id if replies else 0,
+        'live_updates': settings.DISCUSSION_SSE_ENABLED,
         'form': form,
         'course': discussion.course,
     }
     return render(request, 'courses/discussion_detail.html', context)
 
+@login_required
+def discussion_new_replies(request, discussion_id):
+    """Replies posted after ?after=<reply id> and/or ?since=<ISO timestamp>, as JSON"""
+    course_id = Discussion.objects.filter(id=discussion_id).values_list('course_id', flat=True).first()
+    if course_id is None:
+        raise Http404('Discussion not found')
+    if not is_enrolled(request.user, course_id):
+        return JsonResponse({'error': 'You must be enrolled to access discussions.'}, status=403)
+
+    try:
+        after_id = int(request.GET['after']) if request.GET.get('after') else None
+        since = parse_datetime(request.GET['since']) if request.GET.get('since') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid after or since'}, status=400)
+    if request.GET.get('since') and since is None:
+        return JsonResponse({'error': 'Invalid after or since'}, status=400)
+
+    replies = [serialize_reply(reply) for reply in get_new_replies(discussion_id, after_id, since)]
+    return JsonResponse({
+        'replies': replies,
+        'last_id': replies[-1]['id'] if replies else after_id,
+    })
+
+@login_required
+async def discussion_reply_stream(request, discussion_id):
+    """Server-Sent Events stream of new replies (needs the ASGI server)"""
+    if not settings.DISCUSSION_SSE_ENABLED:
+        raise Http404('Live updates are disabled')
+
+    user = await request.auser()
+    discussion = await Discussion.objects.filter(id=discussion_id).only('id', 'course_id').afirst()
+    if discussion is None:
+        raise Http404('Discussion not found')
+    if not await sync_to_async(is_enrolled)(user, discussion.course_id):
+        return JsonResponse({'error': 'You must be enrolled to access discussions.'}, status=403)
+
+    # EventSource resends the last id it saw when it reconnects
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or 0)
+    except ValueError:
+        last_id = 0
+
+    response = StreamingHttpResponse(
+        reply_event_stream(discussion.id, last_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def create_discussion(request, slug):
     """Create new discussion"""
-    course = get_object_or_404(Course, slug=slug)
+    course = get_course_header_or_404(slug)
 
     # Check if enrolled
-    enrollment = Enrollment.objects.filter(student=request.user, course=course).first()
-    if not enrollment:
+    if not is_enrolled(request.user, course.id):
         messages.error(request, 'You must be enrolled to create discussions.')
         return redirect('courses:course_detail', slug=slug)
 
@@ -744,7 +888,7 @@ def create_discussion(request, slug):
         form = DiscussionForm(request.POST)
         if form.is_valid():
             discussion = form.save(commit=False)
-            discussion.course = course
+            discussion.course_id = course.id
             discussion.author = request.user
             discussion.save()
             messages.success(request, 'Discussion created successfully!')
@@ -773,10 +917,9 @@ def download_certificate(request, certificate_id):
         filename = f"certificate_{certificate.certificate_id}.pdf"
         certificate.pdf_file.save(filename, File(pdf_buffer))
 
-    # Return PDF
-    response = FileResponse(certificate.pdf_file.open('rb'), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="certificate_{certificate.certificate_id}.pdf"'
-    return response
+    return serve_protected_file(
+        request, certificate.pdf_file, f"certificate_{certificate.certificate_id}.pdf", 'application/pdf'
+    )
 
 @login_required
 def my_certificates(request):
@@ -3,6 +3,11 @@ ASGI config for emining_university project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve through this module (e.g. with the gunicorn profile in
+emining_university/gunicorn_asgi.py) to use the discussion reply stream
+(DISCUSSION_SSE_ENABLED), which is an async view that holds the connection
+open without tying up a worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
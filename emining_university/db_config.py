@@ -0,0 +1,51 @@
+"""
+Builds the DATABASES entries from a database URL and a connection mode.
+
+Modes (DATABASE_CONNECTION_MODE):
+
+``persistent``
+    Each worker thread keeps its connection for DATABASE_CONN_MAX_AGE seconds
+    and checks it is alive before reusing it (CONN_HEALTH_CHECKS).
+``pool``
+    psycopg 3's connection pool, shared by the threads of a process, between
+    DATABASE_POOL_MIN and DATABASE_POOL_MAX connections. Waiting longer than
+    DATABASE_POOL_TIMEOUT seconds for one raises an error. Saturation is
+    reported by courses.database.pool_metrics.
+``pgbouncer``
+    For PgBouncer in transaction pooling mode, where a server connection is
+    only ours for one transaction: server-side cursors and prepared
+    statements are disabled and nothing is set at session level. The default
+    statement timeout then belongs on the role
+    (ALTER ROLE ... SET statement_timeout) instead of DATABASE_STATEMENT_TIMEOUT.
+
+SQLite (the default without DATABASE_URL) ignores the Postgres-only options.
+"""
+import dj_database_url
+
+CONNECTION_MODES = ('persistent', 'pool', 'pgbouncer')
+
+
+def database_config(url, mode='persistent', conn_max_age=600, health_checks=True, pool_min=2, pool_max=10,
+                    pool_timeout=10, statement_timeout=0, application_name=''):
+    if mode not in CONNECTION_MODES:
+        raise ValueError(f'DATABASE_CONNECTION_MODE must be one of {", ".join(CONNECTION_MODES)}, not {mode!r}')
+
+    database = dj_database_url.parse(
+        url,
+        conn_max_age=0 if mode == 'pool' else conn_max_age,
+        conn_health_checks=health_checks and mode != 'pool',
+        disable_server_side_cursors=mode == 'pgbouncer',
+    )
+    if 'postgresql' not in database['ENGINE']:
+        return database
+
+    options = database.setdefault('OPTIONS', {})
+    if application_name:
+        options['application_name'] = application_name
+    if mode == 'pool':
+        options['pool'] = {'min_size': pool_min, 'max_size': pool_max, 'timeout': pool_timeout}
+    elif mode == 'pgbouncer':
+        options['prepare_threshold'] = None
+    if statement_timeout and mode != 'pgbouncer':
+        options['options'] = f'-c statement_timeout={statement_timeout}'
+    return database
@@ -0,0 +1,27 @@
+"""
+Gunicorn profile for serving the ASGI application with uvicorn workers.
+
+    gunicorn -c python:emining_university.gunicorn_asgi emining_university.asgi:application
+
+Each worker runs one event loop for the async views (payments, the Paystack
+webhook, the contact/registration emails, the catalog pages and the
+discussion reply stream). Sync views still work: Django runs them in a
+thread, one at a time per worker, which is why this profile keeps a few
+workers rather than one. Compare it with the WSGI deployment using
+``manage.py benchmark_servers`` before switching.
+"""
+import multiprocessing
+
+import decouple
+
+# Gunicorn reads every module-level name as a setting, so nothing else is
+# imported by name ('config' is itself a gunicorn setting)
+bind = decouple.config('GUNICORN_BIND', default='127.0.0.1:8000')
+workers = decouple.config('GUNICORN_WORKERS', default=multiprocessing.cpu_count() + 1, cast=int)
+worker_class = 'uvicorn_worker.UvicornWorker'
+# Held-open SSE connections and slow upstreams shouldn't trip the worker timeout
+timeout = decouple.config('GUNICORN_TIMEOUT', default=60, cast=int)
+graceful_timeout = 30
+keepalive = 5
+max_requests = 10000
+max_requests_jitter = 1000
@@ -12,7 +12,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 from decouple import config
-import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
+from emining_university.db_config import database_config
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -89,6 +90,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +98,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'courses.middleware.CourseSlugRedirectMiddleware',
+    'courses.database.StatementTimeoutMiddleware',
+    'courses.database.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'emining_university.urls'
@@ -121,17 +126,125 @@ WSGI_APPLICATION = 'emining_university.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DATABASE_CONNECTION_MODE: persistent (per-thread connections kept for
+# DATABASE_CONN_MAX_AGE seconds), pool (psycopg's pool) or pgbouncer (transaction
+# pooling in front of Postgres). See emining_university/db_config.py.
+DATABASE_CONNECTION_MODE = config('DATABASE_CONNECTION_MODE', default='persistent')
+# Default statement_timeout in ms for every connection (0 = none). Behind PgBouncer
+# set it on the role instead and repeat the value here.
+DATABASE_STATEMENT_TIMEOUT = config('DATABASE_STATEMENT_TIMEOUT', default=0, cast=int)
+
+DATABASE_CONNECTION_OPTIONS = {
+    'mode': DATABASE_CONNECTION_MODE,
+    'conn_max_age': config('DATABASE_CONN_MAX_AGE', default=600, cast=int),
+    'health_checks': config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool),
+    'pool_min': config('DATABASE_POOL_MIN', default=2, cast=int),
+    'pool_max': config('DATABASE_POOL_MAX', default=10, cast=int),
+    'pool_timeout': config('DATABASE_POOL_TIMEOUT', default=10, cast=int),
+    'statement_timeout': DATABASE_STATEMENT_TIMEOUT,
+    'application_name': 'emining_university',
+}
+
 DATABASES = {
-    'default': dj_database_url.config(
-        default=config('DATABASE_URL', default='') or 'sqlite:///' + str(BASE_DIR / 'db.sqlite3')
+    'default': database_config(
+        config('DATABASE_URL', default='') or 'sqlite:///' + str(BASE_DIR / 'db.sqlite3'),
+        **DATABASE_CONNECTION_OPTIONS,
     )
 }
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.sqlite3',
-#         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
-# }
+
+# Statement timeouts (ms) per route class, applied by StatementTimeoutMiddleware.
+# Classes are matched in order by URL prefix ('/...') or view name; anything else
+# is 'default' and runs under DATABASE_STATEMENT_TIMEOUT.
+DATABASE_ROUTE_CLASSES = [
+    ('/admin/', 'admin'),
+    ('/custom-admin/', 'admin'),
+    ('courses:paystack_webhook', 'api'),
+    ('courses:record_progress_events', 'api'),
+]
+DATABASE_ROUTE_STATEMENT_TIMEOUTS = {
+    'admin': config('DATABASE_ADMIN_STATEMENT_TIMEOUT', default=30000, cast=int),
+    'api': config('DATABASE_API_STATEMENT_TIMEOUT', default=5000, cast=int),
+}
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of Postgres URLs
+# (same credentials as the primary). Catalog, instructor and admin reporting
+# pages read from them; see courses/database.py.
+DATABASE_REPLICAS = []
+replica_urls = [url.strip() for url in config('DATABASE_REPLICA_URLS', default='').split(',') if url.strip()]
+for index, replica_url in enumerate(replica_urls, start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = database_config(replica_url, **DATABASE_CONNECTION_OPTIONS)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['courses.database.PrimaryReplicaRouter']
+DATABASE_REPLICA_ROUTES = [
+    'courses:home',
+    'courses:courses_list',
+    'courses:course_detail',
+    'courses:course_reviews',
+    'courses:about',
+    'courses:instructors',
+    'courses:instructor_detail',
+    'courses:verify_certificate',
+    'courses:admin_dashboard',
+    'courses:admin_users_list',
+    'courses:admin_courses_list',
+    'courses:admin_orders_list',
+    'courses:admin_enrollments_list',
+    'courses:admin_certificates_list',
+    'courses:admin_reviews_list',
+    'courses:admin_instructors_list',
+]
+# How long a user keeps reading from the primary after writing, and shared
+# catalog pages after the catalog changes (covers replica lag)
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+
+# HTTP caching of anonymous catalog pages (courses/http_cache.py), in seconds.
+# Browsers revalidate every time (cheap 304s); a CDN may serve its copy for
+# CATALOG_CDN_MAX_AGE and a stale one while it revalidates.
+CATALOG_BROWSER_MAX_AGE = config('CATALOG_BROWSER_MAX_AGE', default=0, cast=int)
+CATALOG_CDN_MAX_AGE = config('CATALOG_CDN_MAX_AGE', default=300, cast=int)
+CATALOG_STALE_WHILE_REVALIDATE = config('CATALOG_STALE_WHILE_REVALIDATE', default=60, cast=int)
+
+
+# Seconds the current day/week/month of sales analytics is cached for
+# (courses/analytics.py); past buckets are cached until an order is edited.
+SALES_OPEN_BUCKET_TTL = config('SALES_OPEN_BUCKET_TTL', default=60, cast=int)
+
+
+# Cache
+# Redis in production: lesson view coalescing (flush_lesson_views), the version
+# counters and the rate of cache writes all need a shared cache with atomic
+# incr. Without REDIS_URL (development only) each process gets its own
+# in-memory cache, which the flush command can't see, so lesson views are
+# flushed by the process that queued them.
+REDIS_URL = config('REDIS_URL', default='')
+if not DEBUG and not REDIS_URL:
+    raise ImproperlyConfigured(
+        'REDIS_URL must be set when DEBUG is off: lesson views and cache invalidation need a shared cache'
+    )
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'emining_university',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            },
+        }
+    }
 
 
 # Password validation
@@ -197,11 +310,61 @@ if CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET:
         secure=True
     )
 
-    # Use Cloudinary for media files storage
-    DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+    # Use Cloudinary for media files storage, behind a local disk cache
+    REMOTE_MEDIA_STORAGE_BACKEND = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+    MEDIA_STORAGE = {
+        'BACKEND': 'courses.storage.CachedRemoteStorage',
+    }
 else:
-    # Fallback to local storage if Cloudinary is not configured
-    DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+    # Fallback to local storage if Cloudinary is not configured. The layered
+    # backend can be tried offline with 'courses.storage.LocalCloudStorage' as
+    # REMOTE_MEDIA_STORAGE_BACKEND and 'courses.storage.CachedRemoteStorage' here.
+    REMOTE_MEDIA_STORAGE_BACKEND = 'courses.storage.LocalCloudStorage'
+    MEDIA_STORAGE = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    }
+
+# Local disk cache in front of the remote media store (least recently used
+# files are evicted past the size limit), and the size from which downloads
+# are redirected to an expiring signed URL instead of being served by the app
+# (only when the remote store can sign one; Cloudinary media are streamed)
+MEDIA_CACHE_DIR = config('MEDIA_CACHE_DIR', default=str(BASE_DIR / 'media_cache'))
+MEDIA_CACHE_MAX_BYTES = config('MEDIA_CACHE_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+MEDIA_REDIRECT_MIN_BYTES = config('MEDIA_REDIRECT_MIN_BYTES', default=25 * 1024 ** 2, cast=int)
+
+# Course materials and certificates are downloaded through views that check
+# access and then let the front-end server send the file: 'nginx' uses
+# X-Accel-Redirect to the internal locations below, 'apache' uses X-Sendfile
+# (mod_xsendfile). Empty streams the file from the app (os.sendfile under gunicorn).
+PROTECTED_MEDIA_SERVER = config('PROTECTED_MEDIA_SERVER', default='')
+PROTECTED_MEDIA_ACCEL_LOCATIONS = {
+    str(MEDIA_ROOT): '/protected/media/',
+    MEDIA_CACHE_DIR: '/protected/media-cache/',
+}
+
+# Large course materials are uploaded in fixed-size chunks that are streamed
+# to part files here, then handed to the media storage once complete. The
+# front-end server's request body limit must allow one chunk.
+MATERIAL_UPLOAD_CHUNK_SIZE = config('MATERIAL_UPLOAD_CHUNK_SIZE', default=8 * 1024 ** 2, cast=int)
+MATERIAL_UPLOAD_MAX_BYTES = config('MATERIAL_UPLOAD_MAX_BYTES', default=5 * 1024 ** 3, cast=int)
+MATERIAL_UPLOAD_TEMP_DIR = config('MATERIAL_UPLOAD_TEMP_DIR', default=str(BASE_DIR / 'upload_chunks'))
+
+# Static files are built by `manage.py collectstatic` into content-hashed names
+# with a manifest plus .gz/.br precompressed copies, and served by WhiteNoise.
+# Hashed files get a one-year `immutable` Cache-Control, so repeat visitors
+# never re-download them; in DEBUG the unhashed originals are served.
+STORAGES = {
+    'default': MEDIA_STORAGE,
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Responsive image derivatives (see courses/images.py): widths generated for
+# course images, instructor photos and profile pictures, and how many
+# background threads per process resize uploads
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 960, 1280)
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', default=2, cast=int)
 
 # Crispy Forms Configuration
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
@@ -225,9 +388,26 @@ CONTACT_EMAIL = config('CONTACT_EMAIL', default='contact@eminingcampus.com')
 # Paystack Payment Configuration
 PAYSTACK_PUBLIC_KEY = config('PAYSTACK_PUBLIC_KEY', default='')
 PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='')
+PAYSTACK_API_URL = config('PAYSTACK_API_URL', default='https://api.paystack.co')
 
 # Site Configuration
 SITE_URL = config('SITE_URL', default='http://localhost:8000')
 
+# Lesson views are recorded in the cache and flushed to LessonProgress.last_viewed
+# by `manage.py flush_lesson_views`, at most once per row per this many seconds
+LESSON_VIEW_COALESCE_SECONDS = config('LESSON_VIEW_COALESCE_SECONDS', default=300, cast=int)
+# Flush each queued view right away when the cache isn't shared with the command
+LESSON_VIEW_FLUSH_IN_PROCESS = not REDIS_URL
+
+# Course slug resolution: per-process LRU in front of the shared cache. Entries
+# live this many seconds locally before the shared cache is asked again.
+COURSE_SLUG_LRU_SIZE = config('COURSE_SLUG_LRU_SIZE', default=2048, cast=int)
+COURSE_SLUG_LOCAL_TTL = config('COURSE_SLUG_LOCAL_TTL', default=30, cast=int)
+
+# Live discussion replies over Server-Sent Events. Only enable when serving
+# through ASGI (emining_university.asgi); under WSGI each stream would hold a
+# worker, so clients poll the new-replies endpoint instead.
+DISCUSSION_SSE_ENABLED = config('DISCUSSION_SSE_ENABLED', default=False, cast=bool)
+
 # Default Primary Key Field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,39 @@
+"""
+Settings for `manage.py test` (picked by manage.py when running tests).
+
+Adds a second SQLite database, 'replica_test', that the read-replica routing
+tests use as a replica holding rows the primary doesn't have. It isn't in
+DATABASE_REPLICAS, so nothing reads from it unless a test routes there, and
+only tests that list it in `databases` get it created.
+
+Tests always use an in-memory cache, even when REDIS_URL is set, standing in
+for the shared cache (so lesson views stay queued until flushed), and render
+pages with unhashed static URLs, since there is no collectstatic manifest.
+StaticReferencesTest checks the configured manifest storage itself.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, STORAGES
+
+DATABASES['replica_test'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'replica_test.sqlite3',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+LESSON_VIEW_FLUSH_IN_PROCESS = False
+
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}